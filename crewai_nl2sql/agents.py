@@ -1,8 +1,9 @@
 """
 CrewAI Agents for NL2SQL Pipeline
 """
-from crewai import Agent
-from langchain_openai import ChatOpenAI
+import copy
+import threading
+from llm_providers import create_llm
 from tools import (
     classify_intent, 
     select_tables, 
@@ -12,65 +13,108 @@ from tools import (
 )
 
 
-# Initialize LLM (can be configured with different models)
-llm = ChatOpenAI(model="gpt-4", temperature=0)
+def _with_callback(llm, handler):
+    """A shallow copy of llm with handler added to its callbacks, leaving llm itself alone"""
+    if not hasattr(llm, "callbacks"):
+        # Not a LangChain model, so nothing would call the handler
+        return llm
+    callbacks = list(llm.callbacks or []) + [handler]
+    if hasattr(llm, "model_copy"):
+        return llm.model_copy(update={"callbacks": callbacks})
+    traced = copy.copy(llm)
+    if hasattr(llm, "__dict__") and traced.__dict__ is llm.__dict__:
+        # copy.copy of a pydantic v1 model (LangChain chat models before 0.3) shares its __dict__
+        object.__setattr__(traced, "__dict__", dict(llm.__dict__))
+        if hasattr(llm, "__fields_set__"):
+            object.__setattr__(traced, "__fields_set__", set(llm.__fields_set__))
+    traced.callbacks = callbacks
+    return traced
+
+
+def _build_agent(**kwargs):
+    # crewai is imported on first use to keep module import cheap
+    from crewai import Agent
+    return Agent(**kwargs)
 
 
 class NL2SQLAgents:
     """Collection of specialized agents for NL2SQL pipeline"""
     
-    @staticmethod
-    def intent_agent():
+    def __init__(self, llm=None, tracer=None):
+        # Any LangChain chat model works; defaults to the configured provider,
+        # which is only built when the first agent is
+        self._llm = llm
+        self.tracer = tracer
+        self._traced_llm = None
+        self._lock = threading.Lock()
+        
+    @property
+    def llm(self):
+        """
+        Chat model for the agents and the direct LLM calls
+        
+        With a tracer this is a shallow copy of the model carrying the
+        tracer's callback handler, so a model shared with other crews or
+        apps is never changed.
+        """
+        with self._lock:
+            if self._llm is None:
+                self._llm = create_llm()
+            if self.tracer is None:
+                return self._llm
+            if self._traced_llm is None:
+                # LLM latency and token usage are reported to the tracer's stage
+                self._traced_llm = _with_callback(self._llm, self.tracer.callback_handler())
+            return self._traced_llm
+    
+    def intent_agent(self):
         """Agent for classifying user intent"""
-        return Agent(
+        return _build_agent(
             role="Intent Strategist",
             goal="Analyze natural language queries and extract structured intent metadata including metric type, scenario, aggregation level, and time window",
             backstory="""You are an expert at understanding business questions about HR and financial data. 
             You can identify what metrics users are asking for, what time periods they care about, 
             and how they want data aggregated. You understand the nuances between different financial 
             scenarios like actuals vs forecasts vs budgets.""",
-            tools=[classify_intent],
-            llm=llm,
+            tools=[classify_intent.as_tool()],
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
     
-    @staticmethod
-    def table_agent():
+    def table_agent(self):
         """Agent for selecting appropriate tables"""
-        return Agent(
+        return _build_agent(
             role="Table Curator",
             goal="Select the optimal set of database tables needed to answer the user's query based on the classified intent",
             backstory="""You are a database architect who knows exactly which tables contain what data. 
             You understand the relationships between fact tables (personnel details, headcount) and 
             dimension tables (department, location, time). You always include necessary lookup tables 
             and know when to add currency or rollup mapping tables.""",
-            tools=[select_tables],
-            llm=llm,
+            tools=[select_tables.as_tool()],
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
     
-    @staticmethod
-    def schema_agent():
+    def schema_agent(self):
         """Agent for pruning columns to reduce context"""
-        return Agent(
+        return _build_agent(
             role="Schema Trimmer",
             goal="Reduce the schema to only essential columns needed for the query, minimizing token usage while preserving all necessary fields",
             backstory="""You are an optimization expert who knows which columns are critical for 
             queries and which are just noise. You understand that keeping only necessary columns 
             improves query generation accuracy. You know to always keep keys, measures, and 
             business-critical attributes while dropping audit fields and redundant data.""",
-            tools=[prune_columns],
-            llm=llm,
+            tools=[prune_columns.as_tool()],
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
     
-    @staticmethod
-    def sql_agent():
+    def sql_agent(self):
         """Agent for generating SQL queries"""
-        return Agent(
+        return _build_agent(
             role="SQL Composer",
             goal="Generate accurate, optimized SQL queries that implement the business logic correctly with proper joins, filters, and aggregations",
             backstory="""You are a senior SQL developer who specializes in financial and HR analytics. 
@@ -78,32 +122,30 @@ class NL2SQLAgents:
             hierarchical rollups. You write clear, performant SQL that correctly implements 
             scenario filters, time windows, and aggregation logic. You always document your 
             decisions and assumptions.""",
-            tools=[generate_sql],
-            llm=llm,
+            tools=[generate_sql.as_tool()],
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
     
-    @staticmethod
-    def validation_agent():
+    def validation_agent(self):
         """Agent for validating generated SQL"""
-        return Agent(
+        return _build_agent(
             role="Query Auditor", 
             goal="Validate SQL queries for correctness, ensuring proper joins, filters, and business logic implementation",
             backstory="""You are a quality assurance specialist for SQL queries. You check for 
             common errors like missing joins, incorrect filter logic, and policy violations. 
             You ensure queries follow best practices and will execute successfully. You can 
             identify issues and suggest fixes to make queries production-ready.""",
-            tools=[validate_sql],
-            llm=llm,
+            tools=[validate_sql.as_tool()],
+            llm=self.llm,
             verbose=True,
             allow_delegation=False
         )
         
-    @staticmethod
-    def orchestrator_agent():
+    def orchestrator_agent(self):
         """Meta-agent for orchestrating the pipeline"""
-        return Agent(
+        return _build_agent(
             role="Pipeline Orchestrator",
             goal="Coordinate the NL2SQL pipeline, ensuring smooth handoffs between agents and managing the overall workflow",
             backstory="""You are the conductor of the NL2SQL orchestra. You ensure each agent 
@@ -111,7 +153,7 @@ class NL2SQLAgents:
             You monitor the pipeline health and can intervene if issues arise. You maintain 
             the state and ensure the final SQL output meets all requirements.""",
             tools=[],
-            llm=llm,
+            llm=self.llm,
             verbose=True,
             allow_delegation=True
         )
@@ -0,0 +1,140 @@
+"""
+Vectorized intent classification for large question logs
+"""
+import time
+from typing import Dict, List, Any
+import numpy as np
+from sample_schema import INTENT_RULES
+from tools import classify_intent, QUARTER_PATTERN, YEAR_PATTERN
+
+
+# Columnar layout of a classified intent; empty strings stand in for None
+INTENT_DTYPE = np.dtype([
+    ("metric_type", "U32"),
+    ("scenario", "U32"),
+    ("aggregation_level", "U32"),
+    ("time_window", "U16"),
+    ("requires_currency_conversion", "?"),
+    ("target_currency", "U8")
+])
+
+
+def classify_intents(questions) -> np.ndarray:
+    """
+    Classify many questions at once
+    
+    Produces the same intent as classify_intent for every question, as one
+    structured array. Each synonym is searched across the whole column with
+    a single vectorized call and repeated questions are only classified once,
+    which is the common case when replaying query logs.
+    
+    Args:
+        questions: List or array of natural language queries
+        
+    Returns:
+        Structured array with INTENT_DTYPE, one row per question in input order
+    """
+    # Hash-based de-duplication keeps input order and avoids sorting strings
+    positions = {}
+    inverse = np.fromiter(
+        (positions.setdefault(question, len(positions)) for question in questions),
+        dtype=np.intp
+    )
+    unique = np.char.lower(np.array(list(positions), dtype=str))
+    
+    intents = np.zeros(len(unique), dtype=INTENT_DTYPE)
+    intents["scenario"] = "historical_actuals_only"
+    intents["aggregation_level"] = "company"
+    
+    # One boolean column per phrase
+    phrase_hits = {}
+    for rules in INTENT_RULES.values():
+        for _, phrases in rules:
+            for rule in phrases:
+                for phrase in (rule if isinstance(rule, tuple) else (rule,)):
+                    if phrase not in phrase_hits:
+                        phrase_hits[phrase] = np.char.find(unique, phrase) >= 0
+                        
+    # Resolve each field in rule priority order; earlier rules win
+    for field in ("metric_type", "scenario", "aggregation_level", "target_currency"):
+        resolved = np.zeros(len(unique), dtype=bool)
+        for value, phrases in INTENT_RULES[field]:
+            matched = np.zeros(len(unique), dtype=bool)
+            for rule in phrases:
+                if isinstance(rule, tuple):
+                    matched |= np.logical_and.reduce([phrase_hits[phrase] for phrase in rule])
+                else:
+                    matched |= phrase_hits[rule]
+            matched &= ~resolved
+            intents[field][matched] = value
+            resolved |= matched
+            
+    intents["requires_currency_conversion"] = intents["target_currency"] != ""
+    
+    # Time windows need the regexes, but only run once per distinct question
+    for i, question in enumerate(unique):
+        quarter_match = QUARTER_PATTERN.search(question)
+        year_match = YEAR_PATTERN.search(question)
+        if quarter_match:
+            year = quarter_match.group(2) or (year_match.group(1) if year_match else "2025")
+            intents["time_window"][i] = f"Q{quarter_match.group(1)} {year}"
+        elif year_match:
+            intents["time_window"][i] = year_match.group(1)
+            
+    return intents[inverse]
+
+
+def intents_to_dicts(intents: np.ndarray) -> List[Dict[str, Any]]:
+    """Convert a classify_intents result into classify_intent style dicts"""
+    results = []
+    for row in intents.tolist():
+        metric_type, scenario, aggregation_level, time_window, requires_conversion, currency = row
+        intent = {
+            "metric_type": metric_type or None,
+            "scenario": scenario,
+            "aggregation_level": aggregation_level,
+            "time_window": time_window or None,
+            "requires_currency_conversion": requires_conversion
+        }
+        if requires_conversion:
+            intent["target_currency"] = currency
+        results.append(intent)
+    return results
+
+
+def benchmark(num_questions: int = 100000, seed: int = 7):
+    """Compare the scalar and vectorized classifiers on a synthetic question log"""
+    sample_questions = [
+        "What is the fully loaded cost per employee by department for Q1 2025?",
+        "Show me headcount movements by quarter for 2025",
+        "Calculate the benefits ratio by location for current year",
+        "What are the total salary costs by department in USD?",
+        "Show me the average cost per employee in Engineering department",
+        "Budget vs actual total cost by location in rupees for 2024",
+        "Forecast salary to date for Q3",
+    ]
+    rng = np.random.default_rng(seed)
+    # Suffix with an id so only part of the log repeats, as in real logs
+    ids = rng.integers(0, num_questions // 10 or 1, size=num_questions)
+    picks = rng.integers(0, len(sample_questions), size=num_questions)
+    questions = [f"{sample_questions[p]} #{i}" for p, i in zip(picks, ids)]
+    
+    start = time.perf_counter()
+    scalar = [classify_intent.func(question) for question in questions]
+    scalar_seconds = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    vectorized = classify_intents(questions)
+    vectorized_seconds = time.perf_counter() - start
+    
+    if intents_to_dicts(vectorized) != scalar:
+        raise AssertionError("Vectorized intents differ from classify_intent")
+        
+    print(f"Questions:   {num_questions}")
+    print(f"Scalar:      {scalar_seconds:.3f}s")
+    print(f"Vectorized:  {vectorized_seconds:.3f}s")
+    print(f"Speedup:     {scalar_seconds / vectorized_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark()
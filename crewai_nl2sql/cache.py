@@ -0,0 +1,185 @@
+"""
+Semantic result cache for the NL2SQL pipeline
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from sample_schema import SAMPLE_SCHEMA, DATA_RULES, METRIC_TEMPLATES
+from materialized import MATERIALIZED_AGGREGATES
+
+
+def compute_schema_version() -> str:
+    """Fingerprint of the schema, rules, templates and aggregates the cached SQL was built against"""
+    payload = json.dumps(
+        {"schema": SAMPLE_SCHEMA, "rules": DATA_RULES, "templates": METRIC_TEMPLATES,
+         "aggregates": MATERIALIZED_AGGREGATES},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+SCHEMA_VERSION = compute_schema_version()
+
+
+class QueryCache:
+    """
+    LRU/TTL cache of pipeline results keyed on the canonical intent
+    
+    Differently phrased questions that classify to the same intent share an
+    entry. Hot entries live in memory; every entry is also written to a SQLite
+    table so the cache survives restarts when a file path is given. Each put
+    trims that table as well: rows of another schema version or past the TTL
+    are deleted and only the max_entries most recently used rows are kept.
+    
+    A context (e.g. the execution mode and the materialized aggregates
+    queries may be routed to) is part of the key, so SQL written for one
+    setup is never served to another sharing the cache file. Only SQL built
+    from the intent alone, as the direct tool chain's is, may be shared by
+    intent. SQL an LLM wrote can filter on details the intent does not
+    capture ("in Engineering" and "in Sales" classify alike), so callers
+    caching it add the normalized question to the context.
+    """
+    
+    def __init__(self, path: str = ":memory:", max_entries: int = 1024,
+                 ttl_seconds: Optional[float] = 24 * 3600,
+                 schema_version: str = SCHEMA_VERSION):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.schema_version = schema_version
+        self.hits = 0
+        self.misses = 0
+        
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_cache (
+                cache_key TEXT PRIMARY KEY,
+                schema_version TEXT,
+                intent TEXT,
+                final_sql TEXT,
+                validation TEXT,
+                created_at REAL,
+                parameters TEXT,
+                last_used REAL
+            )
+        """)
+        # Caches written by older versions lack the newer columns
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(query_cache)")]
+        if "parameters" not in columns:
+            self._conn.execute("ALTER TABLE query_cache ADD COLUMN parameters TEXT")
+        if "last_used" not in columns:
+            self._conn.execute("ALTER TABLE query_cache ADD COLUMN last_used REAL")
+        self._conn.commit()
+        
+    def make_key(self, intent: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> str:
+        """Build the cache key from the canonical intent, context and schema version"""
+        canonical = json.dumps(intent, sort_keys=True, default=str)
+        if context:
+            canonical += "|" + json.dumps(context, sort_keys=True, default=str)
+        return hashlib.sha256(f"{self.schema_version}|{canonical}".encode("utf-8")).hexdigest()
+    
+    def get(self, intent: Dict[str, Any], context: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for an intent in a context, or None on a miss"""
+        key = self.make_key(intent, context)
+        now = time.time()
+        
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                row = self._conn.execute(
+                    "SELECT final_sql, validation, created_at, parameters FROM query_cache "
+                    "WHERE cache_key = ? AND schema_version = ?",
+                    (key, self.schema_version)
+                ).fetchone()
+                if row is not None:
+                    entry = {
+                        "final_sql": row[0],
+                        "validation": json.loads(row[1]),
+                        "created_at": row[2],
+                        "parameters": json.loads(row[3]) if row[3] else None
+                    }
+                    
+            if entry is not None and self._is_expired(entry, now):
+                self._evict(key)
+                entry = None
+                
+            if entry is None:
+                self.misses += 1
+                return None
+                
+            self._conn.execute("UPDATE query_cache SET last_used = ? WHERE cache_key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, entry)
+            self.hits += 1
+            return dict(entry)
+        
+    def put(self, intent: Dict[str, Any], final_sql: str, validation: Any,
+            parameters: Optional[List[Any]] = None, context: Optional[Dict[str, Any]] = None):
+        """Store the final SQL, its bound parameters and validation outcome for an intent in a context"""
+        key = self.make_key(intent, context)
+        entry = {
+            "final_sql": final_sql,
+            "validation": validation,
+            "created_at": time.time(),
+            "parameters": parameters
+        }
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache "
+                "(cache_key, schema_version, intent, final_sql, validation, created_at, parameters, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, self.schema_version, json.dumps(intent, sort_keys=True, default=str),
+                 final_sql, json.dumps(validation, default=str), entry["created_at"],
+                 json.dumps(parameters, default=str) if parameters else None, entry["created_at"])
+            )
+            self._trim(entry["created_at"])
+            self._conn.commit()
+            self._remember(key, entry)
+            
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM query_cache")
+            self._conn.commit()
+            
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries_in_memory": len(self._memory)
+        }
+        
+    def _is_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry["created_at"] > self.ttl_seconds
+    
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            
+    def _trim(self, now: float):
+        """Apply the memory cache's limits to the SQLite table"""
+        self._conn.execute("DELETE FROM query_cache WHERE schema_version != ?", (self.schema_version,))
+        if self.ttl_seconds is not None:
+            self._conn.execute("DELETE FROM query_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM query_cache WHERE cache_key NOT IN ("
+            "SELECT cache_key FROM query_cache ORDER BY COALESCE(last_used, created_at) DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+        
+    def _evict(self, key: str):
+        self._memory.pop(key, None)
+        self._conn.execute("DELETE FROM query_cache WHERE cache_key = ?", (key,))
+        self._conn.commit()
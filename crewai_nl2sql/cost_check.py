@@ -0,0 +1,193 @@
+"""
+EXPLAIN-based cost check for generated SQL
+"""
+import math
+import re
+import threading
+from typing import Any, Dict, List
+from data_generator import FACT_TABLES
+from index_advisor import explain_plan, plan_accesses
+from sql_parser import ParsedQuery, parse_sql
+
+# Cost policies for CostChecker
+#   flag   - report problems as warnings, the query stays valid
+#   reject - report problems as validation issues
+COST_POLICIES = ("flag", "reject")
+
+EQUALITY_TERM_PATTERN = re.compile(r"\w+=\?")
+
+
+class CostChecker:
+    """
+    Asks the execution database how it would run a query before it runs
+    
+    The SQL is prepared with EXPLAIN QUERY PLAN, which also catches SQL that
+    does not compile. Problems are full scans of large fact tables and
+    cartesian joins (a joined table with no join predicate to the others).
+    The estimated cost is a nested-loop count of rows visited, using table
+    row counts and the access path of every plan step. Row counts are cached
+    until clear_statistics() is called.
+    
+    With an index advisor, a query with problems is shown to the advisor
+    before it is reported: with create_indexes the advised indexes are
+    created and the query is explained again, so only problems the indexes
+    do not fix remain. Otherwise the advice is attached to the report.
+    
+    Args:
+        backend: Execution backend with a connection() context manager (SQLite)
+        policy: "flag" or "reject", see COST_POLICIES
+        fact_tables: Tables whose full scans are checked
+        large_table_rows: Row count from which a fact table scan is a problem
+        max_cost: Estimated cost above which the query is a problem, None for no limit
+        index_advisor: Optional IndexAdvisor consulted for queries with problems
+        create_indexes: Create the advised indexes instead of only reporting them
+    """
+    
+    def __init__(self, backend, policy: str = "flag", fact_tables=FACT_TABLES,
+                 large_table_rows: int = 100000, max_cost: float = None,
+                 index_advisor=None, create_indexes: bool = False):
+        if policy not in COST_POLICIES:
+            raise ValueError(f"Unknown cost policy '{policy}', expected one of {COST_POLICIES}")
+        self.backend = backend
+        self.policy = policy
+        self.fact_tables = set(fact_tables)
+        self.large_table_rows = large_table_rows
+        self.max_cost = max_cost
+        self.index_advisor = index_advisor
+        self.create_indexes = create_indexes
+        
+        self._row_counts = {}
+        self._lock = threading.Lock()
+        
+    def clear_statistics(self):
+        """Forget cached table row counts, e.g. after loading data"""
+        with self._lock:
+            self._row_counts.clear()
+            
+    def _row_count(self, conn, table: str) -> int:
+        with self._lock:
+            count = self._row_counts.get(table)
+        if count is None:
+            try:
+                count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except Exception:
+                # Subquery or CTE names in the plan are not tables
+                return 0
+            with self._lock:
+                self._row_counts[table] = count
+        return count
+    
+    @staticmethod
+    def cartesian_joins(query: ParsedQuery) -> List[str]:
+        """Tables in a multi-table query that no join predicate connects"""
+        tables = {ref.name for ref in query.tables}
+        if len(tables) < 2:
+            return []
+            
+        joined = set()
+        for left, right in query.join_predicates:
+            # A side that is not a known table (e.g. a subquery) still joins the other
+            if left.qualifier != right.qualifier:
+                joined.update(table for table in (query.resolve(left.qualifier), query.resolve(right.qualifier)) if table)
+        return sorted(tables - joined)
+    
+    def _estimate(self, conn, accesses: List[Dict[str, Any]]) -> Dict[str, float]:
+        cost = 0.0
+        outer_rows = 1.0
+        for access in accesses:
+            table_rows = max(self._row_count(conn, access["table"]), 1)
+            detail = access["detail"]
+            if access["full_scan"]:
+                step_rows = float(table_rows)
+                step_cost = step_rows
+            else:
+                if access["automatic_index"]:
+                    # The index is built once, then probed
+                    cost += table_rows
+                if "PRIMARY KEY" in detail or "rowid=" in detail:
+                    step_rows = 1.0
+                else:
+                    # Assume each equality term narrows the table by 10x
+                    equalities = len(EQUALITY_TERM_PATTERN.findall(detail))
+                    step_rows = max(1.0, table_rows / 10 ** equalities) if equalities else float(table_rows)
+                step_cost = step_rows + math.log2(table_rows + 1)
+            cost += outer_rows * step_cost
+            outer_rows *= step_rows
+        return {"estimated_cost": round(cost, 1), "estimated_rows": round(outer_rows, 1)}
+    
+    def check(self, sql: str, parameters=None) -> Dict[str, Any]:
+        """
+        Explain a query and report its cost and problems
+        
+        Args:
+            sql: Query to check
+            parameters: Values for ? placeholders in the query
+            
+        Returns:
+            Dict with plan, estimated_cost, estimated_rows, full_scans,
+            cartesian_joins, problems and policy, plus index_advice when an
+            index advisor was consulted
+        """
+        report = self._inspect(sql, parameters)
+        if not report["problems"] or self.index_advisor is None or report["estimated_cost"] is None:
+            return report
+            
+        try:
+            advice = self.index_advisor.advise(sql, create=self.create_indexes, parameters=parameters)
+        except Exception as e:
+            report["index_advice"] = {"indexes": [], "created": False, "error": str(e)}
+            return report
+        if advice["created"]:
+            report = self._inspect(sql, parameters)
+        report["index_advice"] = {
+            "indexes": [index["ddl"] for index in advice["indexes"]],
+            "created": advice["created"],
+            "full_scans_after": advice["full_scans_after"]
+        }
+        return report
+    
+    def _inspect(self, sql: str, parameters=None) -> Dict[str, Any]:
+        query = parse_sql(sql)
+        problems = []
+        
+        with self.backend.connection() as conn:
+            try:
+                plan = explain_plan(conn, sql, parameters)
+            except Exception as e:
+                return {
+                    "plan": [],
+                    "estimated_cost": None,
+                    "estimated_rows": None,
+                    "full_scans": [],
+                    "cartesian_joins": [],
+                    "problems": [f"Query could not be prepared: {str(e)}"],
+                    "policy": self.policy
+                }
+                
+            accesses = plan_accesses(plan, query.aliases)
+            estimate = self._estimate(conn, accesses)
+            full_scans = []
+            for access in accesses:
+                table = access["table"]
+                if access["full_scan"] and table in self.fact_tables:
+                    rows = self._row_count(conn, table)
+                    full_scans.append(table)
+                    if rows >= self.large_table_rows:
+                        problems.append(f"Full scan of fact table '{table}' ({rows} rows)")
+                        
+        cartesian = self.cartesian_joins(query)
+        for table in cartesian:
+            problems.append(f"Cartesian join - no join predicate for '{table}'")
+        if self.max_cost is not None and estimate["estimated_cost"] > self.max_cost:
+            problems.append(
+                f"Estimated cost {estimate['estimated_cost']:.0f} exceeds limit {self.max_cost:.0f}"
+            )
+            
+        return {
+            "plan": plan,
+            **estimate,
+            "full_scans": full_scans,
+            "cartesian_joins": cartesian,
+            "problems": problems,
+            "policy": self.policy
+        }
@@ -1,25 +1,127 @@
 """
 CrewAI Crew and Tasks for NL2SQL Pipeline
 """
-from crewai import Crew, Task
 from agents import NL2SQLAgents
+from tools import (
+    classify_intent,
+    select_tables,
+    prune_columns,
+    generate_sql,
+    validate_sql
+)
+from sample_schema import SAMPLE_SCHEMA
+from schema_pruner import DEFAULT_TOKEN_BUDGET, prune_schema
+from planner import PLANNER_STAGE, build_planner_prompt, llm_config, parse_planner_response
+from repair import REPAIR_STAGE, build_repair_prompt, repair_loop
+from scheduler import Stage, StageScheduler
+from stage_outputs import SQLOutput, StageOutputs, ValidationOutput, task_models
+from statements import render_sql
+from tracing import STAGES, Tracer
+from concurrent.futures import ThreadPoolExecutor
 import json
+import threading
+import weakref
+
+
+def validation_passed(validation) -> bool:
+    """Check a validation outcome: a ValidationOutput, a validate_sql dict or agent text"""
+    validation = ValidationOutput.coerce(validation)
+    return validation is not None and validation.is_valid
+
+
+# Supported execution modes for NL2SQLCrew.run
+#   crew   - always run the five-agent LLM crew
+#   direct  - run the deterministic tool chain in-process and only fall back
+#             to the crew when the intent is ambiguous or validation fails
+#   planner - run the deterministic steps in-process and make a single LLM
+#             call that writes the SQL
+EXECUTION_MODES = ("crew", "direct", "planner")
+
+# Threads for concurrently scheduled stages of speculative planner runs
+STAGE_WORKERS = 4
+
+AGENT_NAMES = ("intent_agent", "table_agent", "schema_agent", "sql_agent", "validation_agent")
+
+
+def _lazy_agent(name: str):
+    """Property that builds one of the instance agents on first access"""
+    def getter(self):
+        agent = self._built_agents.get(name)
+        if agent is None:
+            agent = getattr(self.agents, name)()
+            self._built_agents[name] = agent
+        return agent
+    return property(getter)
 
 
 class NL2SQLCrew:
     """Orchestrates the NL2SQL pipeline using CrewAI"""
     
-    def __init__(self):
-        # Initialize all agents
-        self.agents = NL2SQLAgents()
-        self.intent_agent = self.agents.intent_agent()
-        self.table_agent = self.agents.table_agent()
-        self.schema_agent = self.agents.schema_agent()
-        self.sql_agent = self.agents.sql_agent()
-        self.validation_agent = self.agents.validation_agent()
+    intent_agent = _lazy_agent("intent_agent")
+    table_agent = _lazy_agent("table_agent")
+    schema_agent = _lazy_agent("schema_agent")
+    sql_agent = _lazy_agent("sql_agent")
+    validation_agent = _lazy_agent("validation_agent")
+    
+    def __init__(self, mode: str = "crew", cache=None, max_concurrency: int = 4,
+                 query_timeout: float = None, example_store=None, num_examples: int = 3,
+                 schema_token_budget: int = DEFAULT_TOKEN_BUDGET, llm=None,
+                 cost_checker=None, aggregates=None, tracer: Tracer = None,
+                 speculative: bool = False, max_repairs: int = 2, dialect: str = "SQL"):
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{mode}', expected one of {EXECUTION_MODES}")
+        self.mode = mode
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.query_timeout = query_timeout
+        self.example_store = example_store
+        self.num_examples = num_examples
+        self.schema_token_budget = schema_token_budget
+        self.cost_checker = cost_checker
+        self.aggregates = aggregates
+        self.tracer = tracer or Tracer()
+        self.speculative = speculative
+        self.max_repairs = max_repairs
+        self.dialect = dialect
+        
+        # Agents (and the LLM client) are built on first use, so runs
+        # answered by the cache or the direct path never construct them
+        self.agents = NL2SQLAgents(llm=llm, tracer=self.tracer)
+        self._built_agents = {}
+        
+        # State for the async API, created on first use
+        self._owner_thread = threading.current_thread()
+        self._thread_state = threading.local()
+        self._executor = None
+        self._stage_executor = None
+        self._semaphores = weakref.WeakKeyDictionary()
+        
+    def _agents_for_current_thread(self):
+        """
+        Return the five pipeline agents for the calling thread
+        
+        CrewAI agents keep per-execution state, so worker threads used by
+        arun() each get their own set instead of sharing the instance agents.
+        """
+        if threading.current_thread() is self._owner_thread:
+            return tuple(getattr(self, name) for name in AGENT_NAMES)
+            
+        agents = getattr(self._thread_state, "agents", None)
+        if agents is None:
+            agents = tuple(getattr(self.agents, name)() for name in AGENT_NAMES)
+            self._thread_state.agents = agents
+        return agents
         
-    def create_tasks(self, user_query: str):
+    def create_tasks(self, user_query: str, examples: str = None):
         """Create tasks for the NL2SQL pipeline"""
+        from crewai import Task
+        
+        if examples is None:
+            examples = self._examples_for(user_query)
+        intent_agent, table_agent, schema_agent, sql_agent, validation_agent = \
+            self._agents_for_current_thread()
+        # Each task exports its answer as a typed model, see _crew_outputs
+        models = task_models()
         
         # Task 1: Intent Classification
         intent_task = Task(
@@ -36,8 +138,9 @@ class NL2SQLCrew:
             
             Return a structured JSON with these fields.
             """,
-            agent=self.intent_agent,
-            expected_output="JSON object with intent classification"
+            agent=intent_agent,
+            expected_output="JSON object with intent classification",
+            output_pydantic=models["intent"]
         )
         
         # Task 2: Table Selection
@@ -51,10 +154,11 @@ class NL2SQLCrew:
             - Special tables for currency conversion or category rollups
             - Whether GL reconciliation tables are needed
             
-            Return a list of table names.
+            Return a JSON object with the list of table names under "tables".
             """,
-            agent=self.table_agent,
-            expected_output="List of required table names",
+            agent=table_agent,
+            expected_output='JSON object with a "tables" list of required table names',
+            output_pydantic=models["tables"],
             context=[intent_task]
         )
         
@@ -74,16 +178,17 @@ class NL2SQLCrew:
             - Audit columns
             - Unused attributes
             
-            Return a mapping of table names to required columns.
+            Return a JSON object mapping table names to required columns under "columns".
             """,
-            agent=self.schema_agent,
-            expected_output="Dictionary mapping tables to column lists",
+            agent=schema_agent,
+            expected_output='JSON object with a "columns" object mapping tables to column lists',
+            output_pydantic=models["schema"],
             context=[table_task]
         )
         
         # Task 4: SQL Generation
         sql_task = Task(
-            description="""
+            description=f"""
             Generate the SQL query using:
             - The classified intent
             - Selected tables
@@ -97,9 +202,12 @@ class NL2SQLCrew:
             - Currency conversion if required
             
             Document your decisions about negation, scenario, currency, and rollups.
+            
+            {examples}
             """,
-            agent=self.sql_agent,
-            expected_output="JSON with SQL query and reasoning",
+            agent=sql_agent,
+            expected_output='JSON object with "sql", "parameters", "decisions" and "notes"',
+            output_pydantic=models["sql_generation"],
             context=[intent_task, table_task, schema_task]
         )
         
@@ -116,69 +224,556 @@ class NL2SQLCrew:
             
             If issues are found, provide specific feedback for correction.
             """,
-            agent=self.validation_agent,
-            expected_output="Validation report with any issues and recommendations",
+            agent=validation_agent,
+            expected_output='JSON object with "is_valid", "issues" and "recommendations"',
+            output_pydantic=models["validation"],
             context=[sql_task, table_task]
         )
         
         return [intent_task, table_task, schema_task, sql_task, validation_task]
     
-    def run(self, user_query: str):
+    def run(self, user_query: str, mode: str = None):
         """Execute the NL2SQL pipeline"""
-        print(f"\n🚀 Processing query: '{user_query}'\n")
-        
-        # Create tasks
-        tasks = self.create_tasks(user_query)
-        
-        # Create and run crew
-        crew = Crew(
-            agents=[
-                self.intent_agent,
-                self.table_agent,
-                self.schema_agent,
-                self.sql_agent,
-                self.validation_agent
-            ],
-            tasks=tasks,
-            verbose=True
+        mode = mode or self.mode
+        print(f"\n🚀 Processing query: '{user_query}' (mode: {mode})\n")
+        
+        return self._run_with_cache(user_query, mode)
+    
+    def run_batch(self, user_queries, mode: str = None):
+        """
+        Execute the NL2SQL pipeline for a batch of queries
+        
+        The crew and its tasks are built once and re-used for every query that
+        needs the LLM. Queries that are the same text once normalized are
+        answered once and share the result; in direct mode so are queries
+        that classify to the same intent, unless their SQL came from the LLM.
+        
+        Returns:
+            List of result dicts in input order, each with the original query,
+            its own status and the index of the query it duplicates, if any
+        """
+        mode = mode or self.mode
+        print(f"\n🚀 Processing batch of {len(user_queries)} queries (mode: {mode})\n")
+        
+        answered = {}
+        batch_results = []
+        
+        for index, user_query in enumerate(user_queries):
+            key = self._batch_key(user_query, mode)
+            
+            if key in answered:
+                first_index, shared = answered[key]
+                batch_results.append(dict(shared, query=user_query, duplicate_of=first_index))
+                continue
+                
+            try:
+                results = self._run_with_cache(user_query, mode, shared_crew=True)
+            except Exception as e:
+                results = self._error_results(mode, str(e))
+                
+            if results["mode"] not in ("direct", "cache"):
+                # SQL the LLM wrote answers only its own question, see _cache_context
+                key = self._batch_key(user_query, results["mode"])
+            answered[key] = (index, results)
+            batch_results.append(dict(results, query=user_query, duplicate_of=None))
+            
+        return batch_results
+    
+    @staticmethod
+    def _cacheable_intent(user_query: str):
+        """
+        Classify the query for result sharing
+        
+        Only unambiguous intents are returned, otherwise unrelated questions
+        would collide on the same key.
+        """
+        intent = classify_intent.func(user_query)
+        return intent if intent["metric_type"] is not None else None
+    
+    def _batch_key(self, user_query: str, mode: str) -> str:
+        intent = self._cacheable_intent(user_query) if mode == "direct" else None
+        if intent is not None:
+            return "intent:" + json.dumps(intent, sort_keys=True)
+        return "text:" + " ".join(user_query.lower().split())
+    
+    def _run_with_cache(self, user_query: str, mode: str, shared_crew: bool = False):
+        """Execute the pipeline with a trace of its stages attached as results["trace"]"""
+        self.tracer.begin(user_query, mode)
+        try:
+            results = self._run_traced(user_query, mode, shared_crew)
+        except BaseException:
+            self.tracer.end("error")
+            raise
+        trace = self.tracer.end(results.get("status"), results.get("mode"))
+        results["trace"] = trace.to_dict()
+        return results
+    
+    def _run_traced(self, user_query: str, mode: str, shared_crew: bool = False):
+        """Execute the pipeline, answering from the cache when possible"""
+        intent = self._cacheable_intent(user_query) if self.cache is not None else None
+                
+        if intent is not None:
+            cached = self.cache.get(intent, self._cache_context(mode, user_query))
+            if cached is not None:
+                return {
+                    "status": "success",
+                    "mode": "cache",
+                    "pipeline_output": {"intent": json.dumps(intent)},
+                    "final_sql": cached["final_sql"],
+                    "parameters": cached.get("parameters"),
+                    "validation": cached["validation"]
+                }
+        
+        results = self._run_uncached(user_query, mode, shared_crew)
+        
+        if results.get("final_sql") and validation_passed(results.get("validation")):
+            if intent is not None:
+                # A direct run that fell back to the crew is cached as the crew's answer to this question
+                self.cache.put(intent, results["final_sql"], results["validation"], results.get("parameters"),
+                               self._cache_context(results["mode"], user_query))
+            if self.example_store is not None:
+                # Examples are prompt text, so they show the bound values inline
+                self.example_store.add(
+                    user_query,
+                    classify_intent.func(user_query),
+                    render_sql(results["final_sql"], results.get("parameters"))
+                )
+            
+        return results
+    
+    def _cache_context(self, mode: str, user_query: str):
+        """
+        What besides the intent decides the SQL: the mode, the aggregates it
+        may be routed to and, for SQL an LLM writes, the question itself
+        """
+        context = {
+            "mode": mode,
+            "aggregates": sorted(self.aggregates.available()) if self.aggregates is not None else []
+        }
+        if mode != "direct":
+            context["question"] = " ".join(user_query.lower().split())
+        return context
+    
+    def _examples_for(self, user_query: str) -> str:
+        """Few-shot examples for the SQL task, retrieved from the example store"""
+        if self.example_store is None:
+            return ""
+        return self.example_store.format_for_prompt(user_query, self.num_examples)
+    
+    def _run_uncached(self, user_query: str, mode: str, shared_crew: bool = False):
+        """Execute the pipeline in the given mode without consulting the cache"""
+        if mode == "direct":
+            results = self.run_direct(user_query)
+            if results is not None:
+                return results
+            print("↩️  Direct tool chain could not answer, falling back to the LLM crew\n")
+        elif mode == "planner":
+            return self.run_planner(user_query)
+        
+        if shared_crew:
+            # Re-use the pre-built crew, filling the query in at kickoff
+            crew, tasks = self._shared_scaffold()
+            self.tracer.start_stages()
+            crew.kickoff(inputs={
+                "user_query": user_query,
+                "examples": self._examples_for(user_query)
+            })
+        else:
+            # crewai is only needed once the crew actually runs
+            from crewai import Crew
+            
+            # Create tasks
+            tasks = self.create_tasks(user_query)
+            
+            # Create and run crew
+            crew = Crew(
+                agents=[task.agent for task in tasks],
+                tasks=tasks,
+                verbose=True,
+                task_callback=self.tracer.task_callback
+            )
+            
+            # Execute the crew
+            self.tracer.start_stages()
+            crew.kickoff()
+        
+        outputs = self._crew_outputs(tasks)
+        if outputs.sql_generation is None or outputs.sql_generation.sql is None:
+            results = self._results("crew", outputs, status="error")
+            results["error"] = "The SQL generation task returned no SQL"
+            return results
+        results = self._results("crew", outputs)
+        self._check_cost(results)
+        if not validation_passed(results.get("validation")):
+            self._repair_crew_results(user_query, outputs, results)
+        return results
+    
+    def _repair_crew_results(self, user_query: str, outputs: StageOutputs, results):
+        """
+        Repair SQL from the crew that failed validation
+        
+        The validation agent words its issues freely, so the SQL is validated
+        again with validate_sql to get issues the repair loop recognises.
+        """
+        intent = classify_intent(user_query)
+        tables = select_tables(intent) if intent["metric_type"] is not None else []
+        pruned_schema = prune_schema(intent, tables, self.schema_token_budget)["schema"]
+        
+        def validate(sql_output):
+            return validate_sql(sql_output["sql"], tables, SAMPLE_SCHEMA, self.cost_checker,
+                                sql_output.get("parameters"))
+        
+        sql_output = outputs.sql_generation.to_dict()
+        sql_output, validation, log = self._repair(
+            user_query, intent, tables, pruned_schema, sql_output, validate(sql_output), validate
         )
+        if log:
+            outputs.replace("sql_generation", SQLOutput.from_dict(sql_output))
+        outputs.replace("validation", ValidationOutput.from_dict(validation))
+        results.update(self._results("crew", outputs, repairs=log))
+    
+    def _repair(self, user_query, intent, tables, pruned_schema, sql_output, validation, validate,
+                use_llm: bool = True):
+        """
+        Run the bounded repair loop on SQL that failed validation
         
-        # Execute the crew
-        result = crew.kickoff()
+        Deterministic fixes are tried before the LLM; use_llm=False keeps
+        the repair free of LLM calls (for the direct path).
         
-        return self._format_results(result, tasks)
+        Returns:
+            (sql_output, validation, repair log)
+        """
+        if validation_passed(validation) or not self.max_repairs:
+            return sql_output, validation, []
+            
+        llm_repair = None
+        if use_llm:
+            def llm_repair(current, issues):
+                prompt = build_repair_prompt(user_query, current, issues, intent, tables, pruned_schema,
+                                             self.dialect)
+                response = self.agents.llm.invoke(prompt, config=llm_config(REPAIR_STAGE))
+                return parse_planner_response(getattr(response, "content", response))
+                
+        with self.tracer.stage("repair"):
+            sql_output, validation, log = repair_loop(
+                sql_output, validation, validate, intent, llm_repair, self.max_repairs
+            )
+        self.tracer.record_repairs(len(log))
+        return sql_output, validation, log
     
-    def _format_results(self, crew_output, tasks):
-        """Format the pipeline results"""
-        results = {
-            "status": "success",
+    def _check_cost(self, results):
+        """
+        Run the cost check on SQL produced by the crew
+        
+        The validation agent has no access to the execution database, so the
+        plan is checked here; under the reject policy problems fail validation.
+        """
+        if self.cost_checker is None or not results.get("final_sql"):
+            return
+        with self.tracer.stage("validation"):
+            cost = self.cost_checker.check(results["final_sql"], results.get("parameters"))
+        results["cost"] = cost
+        if cost["problems"] and cost["policy"] == "reject":
+            results["validation"] = {
+                "is_valid": False,
+                "issues": cost["problems"],
+                "recommendations": [],
+                "cost": cost
+            }
+    
+    def _shared_scaffold(self):
+        """Build the crew and its tasks once per thread with placeholders for the query"""
+        from crewai import Crew
+        
+        scaffold = getattr(self._thread_state, "scaffold", None)
+        if scaffold is None:
+            tasks = self.create_tasks("{user_query}", examples="{examples}")
+            crew = Crew(
+                agents=[task.agent for task in tasks],
+                tasks=tasks,
+                verbose=True,
+                task_callback=self.tracer.task_callback
+            )
+            scaffold = (crew, tasks)
+            self._thread_state.scaffold = scaffold
+        return scaffold
+    
+    async def arun(self, user_query: str, mode: str = None, timeout: float = None):
+        """
+        Execute the NL2SQL pipeline without blocking the event loop
+        
+        Queries run on a worker thread pool; at most max_concurrency of them
+        execute at once and the rest wait their turn. A query exceeding the
+        timeout (or query_timeout by default) returns an error result. Its
+        worker thread cannot be interrupted and finishes in the background.
+        """
+        import asyncio
+        
+        timeout = timeout if timeout is not None else self.query_timeout
+        loop = asyncio.get_running_loop()
+        
+        async with self._semaphore_for(loop):
+            future = loop.run_in_executor(self._get_executor(), self.run, user_query, mode)
+            try:
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                return self._error_results(mode or self.mode, f"Query timed out after {timeout} seconds")
+                
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix="nl2sql"
+            )
+        return self._executor
+    
+    def _get_stage_executor(self):
+        # Separate from the arun pool, whose workers submit stages here
+        if self._stage_executor is None:
+            self._stage_executor = ThreadPoolExecutor(
+                max_workers=STAGE_WORKERS,
+                thread_name_prefix="nl2sql-stage"
+            )
+        return self._stage_executor
+    
+    def _semaphore_for(self, loop):
+        # asyncio primitives must be created on the loop that awaits them
+        import asyncio
+        
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+    
+    def run_direct(self, user_query: str):
+        """
+        Run the deterministic tool chain in-process without any LLM calls
+        
+        Returns:
+            Results dict in the same shape as the crew output, or None when the
+            intent is ambiguous or the generated SQL fails validation
+        """
+        with self.tracer.stage("intent"):
+            intent = classify_intent(user_query)
+        if intent["metric_type"] is None:
+            return None
+            
+        with self.tracer.stage("tables"):
+            tables = select_tables(intent)
+        with self.tracer.stage("schema"):
+            pruning = prune_schema(intent, tables, self.schema_token_budget)
+        pruned_schema = pruning["schema"]
+        
+        # Metrics with a current materialized aggregate are answered from it
+        with self.tracer.stage("sql_generation"):
+            schema = SAMPLE_SCHEMA
+            available = None
+            if self.aggregates is not None:
+                available = self.aggregates.available()
+                schema = self.aggregates.validation_schema
+            sql_output = generate_sql(intent, tables, pruned_schema, available)
+        def validate(output):
+            return validate_sql(
+                output["sql"], output.get("tables", tables), schema,
+                self.cost_checker, output.get("parameters")
+            )
+            
+        with self.tracer.stage("validation"):
+            validation = validate(sql_output)
+            
+        # Only deterministic repairs here; anything needing the LLM falls back to the crew
+        sql_output, validation, repairs = self._repair(
+            user_query, intent, tables, pruned_schema, sql_output, validation, validate, use_llm=False
+        )
+        if not validation["is_valid"]:
+            return None
+            
+        outputs = StageOutputs(intent, tables, pruned_schema, SQLOutput.from_dict(sql_output),
+                               ValidationOutput.from_dict(validation), {})
+        return self._results("direct", outputs, pruning, repairs)
+    
+    def run_planner(self, user_query: str):
+        """
+        Run the pipeline with a single LLM call
+        
+        Intent, tables and schema come from the deterministic tools and the
+        SQL is validated by validate_sql, all in-process; only the SQL itself
+        is written by the LLM, from one prompt carrying the intent, pruned
+        schema, join paths and business rules. With speculative=True the
+        steps run as a stage graph instead, see _run_planner_speculative.
+        
+        Returns:
+            Results dict in the same shape as the crew output
+        """
+        if self.speculative:
+            return self._run_planner_speculative(user_query)
+            
+        with self.tracer.stage("intent"):
+            intent = classify_intent(user_query)
+        with self.tracer.stage("tables"):
+            tables = self._planner_tables(intent)
+        with self.tracer.stage("schema"):
+            pruning = prune_schema(intent, tables, self.schema_token_budget)
+        with self.tracer.stage("sql_generation"):
+            sql_output = self._planner_generate(user_query, intent, tables, pruning["schema"],
+                                                self._examples_for(user_query))
+        with self.tracer.stage("validation"):
+            validation = self._planner_validate(intent, tables, sql_output)
+            
+        sql_output, validation, repairs = self._repair(
+            user_query, intent, tables, pruning["schema"], sql_output, validation,
+            lambda output: self._planner_validate(intent, tables, output)
+        )
+        return self._planner_results(intent, tables, pruning, sql_output, validation, repairs)
+    
+    def _run_planner_speculative(self, user_query: str):
+        """
+        Run the planner steps as a stage graph on the stage thread pool
+        
+        Example retrieval runs alongside intent classification; once tables
+        are known the deterministic template path and the LLM call run
+        side by side, each validating its own SQL. The first valid SQL wins,
+        so a valid template answers without waiting for the LLM. A failing
+        stage or a run past query_timeout gives an error result, as arun does.
+        """
+        schema = self.aggregates.validation_schema if self.aggregates is not None else SAMPLE_SCHEMA
+        
+        def template_validate(tables, sql_output):
+            return validate_sql(
+                sql_output["sql"], sql_output.get("tables", tables), schema,
+                self.cost_checker, sql_output.get("parameters")
+            )
+        
+        def template_sql(intent, tables):
+            if intent["metric_type"] is None:
+                return None
+            available = self.aggregates.available() if self.aggregates is not None else None
+            sql_output = generate_sql(intent, tables, {}, available)
+            return sql_output, template_validate(tables, sql_output)
+        
+        def llm_sql(intent, tables, schema, examples):
+            sql_output = self._planner_generate(user_query, intent, tables, schema["schema"], examples)
+            return sql_output, self._planner_validate(intent, tables, sql_output)
+        
+        def valid(candidate):
+            return candidate is not None and validation_passed(candidate[1])
+        
+        stages = [
+            Stage("intent", lambda: classify_intent(user_query)),
+            Stage("examples", lambda: self._examples_for(user_query)),
+            Stage("tables", self._planner_tables, ("intent",)),
+            Stage("schema", lambda intent, tables: prune_schema(intent, tables, self.schema_token_budget),
+                  ("intent", "tables")),
+            Stage("template_sql", template_sql, ("intent", "tables"), accept=valid),
+            Stage("sql_generation", llm_sql, ("intent", "tables", "schema", "examples"), accept=valid)
+        ]
+        scheduler = StageScheduler(self._get_stage_executor(), wrap=self.tracer.wrap_stage)
+        try:
+            outcome = scheduler.run(stages, races={"sql": ("sql_generation", "template_sql")},
+                                    timeout=self.query_timeout)
+        except TimeoutError:
+            # Stages still running finish in the background, as with arun
+            return self._error_results("planner", f"Query timed out after {self.query_timeout} seconds")
+        except Exception as e:
+            return self._error_results("planner", str(e))
+        
+        intent, tables, pruning = outcome["intent"], outcome["tables"], outcome["schema"]
+        repairs = []
+        if outcome["sql"] is None:
+            sql_output = {"sql": None, "parameters": [], "notes": "Neither the template nor the LLM produced SQL"}
+            validation = {"is_valid": False, "issues": [sql_output["notes"]], "recommendations": []}
+        else:
+            sql_output, validation = outcome["sql"]
+            if outcome["sql.winner"] == "template_sql":
+                validate = lambda output: template_validate(tables, output)
+            else:
+                validate = lambda output: self._planner_validate(intent, tables, output)
+            sql_output, validation, repairs = self._repair(
+                user_query, intent, tables, pruning["schema"], sql_output, validation, validate
+            )
+        results = self._planner_results(intent, tables, pruning, sql_output, validation, repairs)
+        results["speculation"] = {"winner": outcome["sql.winner"]}
+        return results
+    
+    @staticmethod
+    def _planner_tables(intent):
+        # Without a recognised metric the LLM gets every table to choose from
+        return select_tables(intent) if intent["metric_type"] is not None else list(SAMPLE_SCHEMA)
+    
+    def _planner_generate(self, user_query, intent, tables, pruned_schema, examples):
+        """The planner's single LLM call"""
+        prompt = build_planner_prompt(user_query, intent, tables, pruned_schema, examples, self.dialect)
+        response = self.agents.llm.invoke(prompt, config=llm_config(PLANNER_STAGE))
+        return parse_planner_response(getattr(response, "content", response))
+    
+    def _planner_validate(self, intent, tables, sql_output):
+        if not sql_output["sql"]:
+            return {"is_valid": False, "issues": [sql_output["notes"]], "recommendations": []}
+        return validate_sql(
+            sql_output["sql"], tables if intent["metric_type"] is not None else [],
+            SAMPLE_SCHEMA, self.cost_checker, sql_output.get("parameters")
+        )
+    
+    def _planner_results(self, intent, tables, pruning, sql_output, validation, repairs):
+        outputs = StageOutputs(intent, tables, pruning["schema"], SQLOutput.from_dict(sql_output),
+                               ValidationOutput.from_dict(validation), {})
+        return self._results("planner", outputs, pruning, repairs,
+                             status="success" if sql_output["sql"] else "error")
+    
+    @staticmethod
+    def _error_results(mode: str, error: str):
+        """Results dict for a run that failed before producing SQL"""
+        return {
+            "status": "error",
+            "mode": mode,
             "pipeline_output": {},
             "final_sql": None,
-            "validation": None
+            "validation": None,
+            "error": error
         }
+    
+    @staticmethod
+    def _results(mode: str, outputs: StageOutputs, pruning=None, repairs=(), status: str = "success"):
+        """
+        Results dict for a run from its typed stage outputs
         
-        try:
-            # Extract outputs from each task
-            for i, task in enumerate(tasks):
-                task_name = ["intent", "tables", "schema", "sql_generation", "validation"][i]
-                if hasattr(task, 'output') and task.output:
-                    results["pipeline_output"][task_name] = task.output.raw_output
-                    
-                    # Extract final SQL if available
-                    if task_name == "sql_generation":
-                        try:
-                            sql_output = json.loads(task.output.raw_output)
-                            results["final_sql"] = sql_output.get("sql")
-                        except:
-                            # If not JSON, try to extract SQL from text
-                            if "SELECT" in task.output.raw_output:
-                                results["final_sql"] = task.output.raw_output
-                                
-                    elif task_name == "validation":
-                        results["validation"] = task.output.raw_output
-                        
-        except Exception as e:
-            results["status"] = "error"
-            results["error"] = str(e)
-            
+        The results stay plain JSON-serializable data; the typed outputs
+        only live between the stages of one run.
+        """
+        sql_output = outputs.sql_generation
+        results = {
+            "status": status,
+            "mode": mode,
+            "pipeline_output": outputs.pipeline_output(),
+            "final_sql": sql_output.sql if sql_output is not None else None,
+            "parameters": sql_output.parameters if sql_output is not None else None,
+            "validation": outputs.validation.to_dict() if outputs.validation is not None else None,
+            "repairs": len(repairs),
+            "repair_log": list(repairs)
+        }
+        if pruning is not None:
+            results["schema_tokens"] = {
+                "before": pruning["tokens_before"],
+                "after": pruning["tokens_after"],
+                "budget": pruning["token_budget"]
+            }
         return results
+    
+    @staticmethod
+    def _crew_outputs(tasks) -> StageOutputs:
+        """
+        Typed stage outputs of a finished crew run
+        
+        Every task exports its answer as its stage's model from task_models.
+        A stage CrewAI could not convert is read from the agent's text, see
+        StageOutputs.from_crew; without a readable validation the SQL is
+        validated again in-process.
+        """
+        exported, raw = {}, {}
+        for stage, task in zip(STAGES, tasks):
+            output = getattr(task, "output", None)
+            if output:
+                exported[stage] = output.exported_output
+                raw[stage] = output.raw_output
+        return StageOutputs.from_crew(exported, raw)
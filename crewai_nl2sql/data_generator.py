@@ -0,0 +1,304 @@
+"""
+Seeded synthetic data for the sample warehouse at configurable scale
+"""
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterable, List
+import numpy as np
+from sample_schema import SAMPLE_SCHEMA, METRIC_TEMPLATES
+
+# Fact tables hold many rows per key, so their *_id columns are not primary keys
+FACT_TABLES = ("a_personnel_details", "a_personnel_headcount", "a_personnel_summary")
+
+# Employees generated per unit of scale
+EMPLOYEES_PER_SCALE = 1000
+
+DEPARTMENT_NAMES = [
+    "Engineering", "Sales", "HR", "Finance", "Marketing",
+    "Operations", "Legal", "Support", "Product", "Research"
+]
+
+# (location_name, country, region, currency_id)
+LOCATIONS = [
+    ("New York", "USA", "AMER", "USD"),
+    ("Mumbai", "India", "APAC", "INR"),
+    ("London", "UK", "EMEA", "GBP"),
+    ("San Francisco", "USA", "AMER", "USD"),
+    ("Bangalore", "India", "APAC", "INR"),
+    ("Berlin", "Germany", "EMEA", "EUR"),
+    ("Tokyo", "Japan", "APAC", "JPY"),
+    ("Toronto", "Canada", "AMER", "CAD")
+]
+
+# (currency_id, currency_name, conversion_rate_to_usd)
+CURRENCIES = [
+    ("USD", "US Dollar", 1.0),
+    ("INR", "Indian Rupee", 0.012),
+    ("GBP", "British Pound", 1.27),
+    ("EUR", "Euro", 1.09),
+    ("JPY", "Japanese Yen", 0.0067),
+    ("CAD", "Canadian Dollar", 0.74)
+]
+
+# (category, category_rollup, rollup_level_1, rollup_level_2, is_compensation,
+#  requires_negation, share of monthly salary)
+CATEGORIES = [
+    ("salary", "compensation", "personnel", "payroll", 1, 1, 1.0),
+    ("benefits", "compensation", "personnel", "payroll", 1, 1, 0.2),
+    ("taxes", "compensation", "personnel", "payroll", 1, 1, 0.15),
+    ("other_compensation", "compensation", "personnel", "bonus", 1, 1, 0.05),
+    ("travel", "non_compensation", "operating", "travel", 0, 0, 0.03)
+]
+
+PLAN_VERSIONS = ["actual", "forecast", "budget"]
+PLAN_VERSION_WEIGHTS = [0.7, 0.15, 0.15]
+
+
+def create_schema(conn, schema: Dict = SAMPLE_SCHEMA):
+    """Create every table in the schema that does not exist yet"""
+    for table, info in schema.items():
+        columns = []
+        for column, column_type in info["columns"].items():
+            if table in FACT_TABLES:
+                column_type = column_type.replace(" PRIMARY KEY", "")
+            columns.append(f"{column} {column_type}")
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+    conn.commit()
+    
+    
+def _insert(conn, table: str, columns: List[str], rows: Iterable[tuple]) -> int:
+    placeholders = ", ".join("?" * len(columns))
+    cursor = conn.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", rows
+    )
+    return cursor.rowcount
+
+
+def _rows(*columns: np.ndarray):
+    """Turn NumPy columns into row tuples of plain Python values"""
+    return zip(*(column.tolist() for column in columns))
+
+
+def _periods(years):
+    periods = []
+    for year in years:
+        for month in range(1, 13):
+            end_day = [31, 29 if year % 4 == 0 else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1]
+            periods.append((
+                len(periods) + 1, f"{year}-{month:02d}", year, (month - 1) // 3 + 1, month,
+                f"{year}-{month:02d}-01", f"{year}-{month:02d}-{end_day}"
+            ))
+    return periods
+
+
+def populate_database(conn, scale: float = 1.0, seed: int = 42,
+                      years=(2023, 2024, 2025), closed_through: str = "2025-06",
+                      chunk_employees: int = 2000) -> Dict[str, int]:
+    """
+    Fill the sample schema with reproducible synthetic data
+    
+    Every employee gets one a_personnel_details row per period and category,
+    so detail volume is roughly 180k rows per unit of scale over three years.
+    Fact rows are generated with NumPy one chunk of employees at a time and
+    bulk inserted with executemany, keeping memory flat at any scale.
+    
+    Args:
+        conn: DB-API connection using the qmark paramstyle
+        scale: Multiplier on EMPLOYEES_PER_SCALE
+        seed: Random seed, the same seed always produces the same data
+        years: Fiscal years to generate periods for
+        closed_through: Last closed accounting period
+        chunk_employees: Employees generated per executemany batch
+        
+    Returns:
+        Row counts per table
+    """
+    rng = np.random.default_rng(seed)
+    create_schema(conn)
+    counts = {}
+    
+    # Masters
+    num_departments = max(3, int(len(DEPARTMENT_NAMES) * np.sqrt(scale)))
+    departments = []
+    for i in range(num_departments):
+        name = DEPARTMENT_NAMES[i] if i < len(DEPARTMENT_NAMES) else f"Department {i + 1}"
+        parent = None if i < len(DEPARTMENT_NAMES) else int(i % len(DEPARTMENT_NAMES)) + 1
+        departments.append((i + 1, name, f"D{i + 1:03d}", parent, 1))
+    counts["m_department"] = _insert(
+        conn, "m_department",
+        ["department_id", "department_name", "department_code", "parent_department_id", "is_active"],
+        departments
+    )
+    
+    locations = [
+        (i + 1, name, f"L{i + 1:03d}", country, region, 1)
+        for i, (name, country, region, _) in enumerate(LOCATIONS)
+    ]
+    counts["m_location"] = _insert(
+        conn, "m_location",
+        ["location_id", "location_name", "location_code", "country", "region", "is_active"],
+        locations
+    )
+    
+    periods = _periods(years)
+    counts["m_accounting_period"] = _insert(
+        conn, "m_accounting_period",
+        ["period_id", "name", "fiscal_year", "fiscal_quarter", "fiscal_month",
+         "start_date", "end_date", "is_closed"],
+        [period + (int(period[1] <= closed_through),) for period in periods]
+    )
+    
+    counts["master_rollup_mapping_details"] = _insert(
+        conn, "master_rollup_mapping_details",
+        ["category", "category_rollup", "rollup_level_1", "rollup_level_2",
+         "is_compensation", "requires_negation"],
+        [category[:6] for category in CATEGORIES]
+    )
+    
+    counts["currency_master"] = _insert(
+        conn, "currency_master",
+        ["currency_id", "currency_name", "conversion_rate_to_usd", "effective_date"],
+        [currency + (f"{years[0]}-01-01",) for currency in CURRENCIES]
+    )
+    
+    # Lookup arrays indexed by period / category / location position
+    period_names = np.array([period[1] for period in periods])
+    period_years = np.array([period[2] for period in periods])
+    period_ends = np.array([period[6] for period in periods])
+    period_closed = (period_names <= closed_through).astype(np.int64)
+    category_names = np.array([category[0] for category in CATEGORIES])
+    category_rollups = np.array([category[1] for category in CATEGORIES])
+    category_shares = np.array([category[6] for category in CATEGORIES])
+    location_currencies = np.array([location[3] for location in LOCATIONS])
+    plan_versions = np.array(PLAN_VERSIONS)
+    
+    num_employees = max(1, int(EMPLOYEES_PER_SCALE * scale))
+    num_periods = len(periods)
+    num_categories = len(CATEGORIES)
+    detail_columns = [
+        "employee_id", "department_id", "location_id", "accounting_period", "amount",
+        "currency_id", "category", "category_rollup", "closed", "plan_version_name",
+        "aggregation_type", "created_date", "fiscal_year"
+    ]
+    headcount_columns = [
+        "employee_id", "department_id", "location_id", "accounting_period",
+        "headcount", "movement_type", "effective_date", "fiscal_year"
+    ]
+    counts["a_personnel_details"] = 0
+    counts["a_personnel_headcount"] = 0
+    
+    for start in range(0, num_employees, chunk_employees):
+        size = min(chunk_employees, num_employees - start)
+        employee_ids = np.arange(start, start + size) + 101
+        department_ids = rng.integers(1, num_departments + 1, size)
+        location_index = rng.integers(0, len(LOCATIONS), size)
+        monthly_salary = np.round(rng.lognormal(np.log(8000), 0.35, size), 2)
+        
+        # One detail row per employee x period x category
+        per_employee = num_periods * num_categories
+        emp = np.repeat(np.arange(size), per_employee)
+        period_index = np.tile(np.repeat(np.arange(num_periods), num_categories), size)
+        category_index = np.tile(np.arange(num_categories), size * num_periods)
+        noise = rng.normal(1.0, 0.05, emp.size)
+        amount = np.round(monthly_salary[emp] * category_shares[category_index] * noise, 2)
+        plan_index = rng.choice(len(PLAN_VERSIONS), emp.size, p=PLAN_VERSION_WEIGHTS)
+        # Closed periods only carry actuals
+        plan_index[period_closed[period_index] == 1] = 0
+        
+        counts["a_personnel_details"] += _insert(conn, "a_personnel_details", detail_columns, _rows(
+            employee_ids[emp],
+            department_ids[emp],
+            location_index[emp] + 1,
+            period_names[period_index],
+            amount,
+            location_currencies[location_index[emp]],
+            category_names[category_index],
+            category_rollups[category_index],
+            period_closed[period_index],
+            plan_versions[plan_index],
+            np.full(emp.size, "monthly"),
+            period_ends[period_index],
+            period_years[period_index]
+        ))
+        
+        # Every employee is hired once; some later transfer or leave
+        hire_period = rng.integers(0, num_periods, size)
+        later = np.minimum(hire_period + rng.integers(1, num_periods, size), num_periods - 1)
+        moves = rng.random(size)
+        transfer = (moves < 0.1) & (later > hire_period)
+        terminate = (moves > 0.8) & (later > hire_period)
+        
+        movement_emp = np.concatenate([np.arange(size), np.flatnonzero(transfer), np.flatnonzero(terminate)])
+        movement_period = np.concatenate([hire_period, later[transfer], later[terminate]])
+        movement_type = np.concatenate([
+            np.full(size, "hire"),
+            np.full(transfer.sum(), "transfer"),
+            np.full(terminate.sum(), "termination")
+        ])
+        headcount = np.concatenate([
+            np.ones(size, dtype=np.int64),
+            np.zeros(transfer.sum(), dtype=np.int64),
+            -np.ones(terminate.sum(), dtype=np.int64)
+        ])
+        
+        counts["a_personnel_headcount"] += _insert(conn, "a_personnel_headcount", headcount_columns, _rows(
+            employee_ids[movement_emp],
+            department_ids[movement_emp],
+            location_index[movement_emp] + 1,
+            period_names[movement_period],
+            headcount,
+            movement_type,
+            period_ends[movement_period],
+            period_years[movement_period]
+        ))
+        
+    # The summary table is the GL roll-up of the details
+    cursor = conn.execute("""
+        INSERT INTO a_personnel_summary (
+            department_id, location_id, accounting_period, total_amount, currency_id,
+            category_rollup, plan_version_name, headcount, fiscal_year
+        )
+        SELECT department_id, location_id, accounting_period, ROUND(SUM(amount), 2), currency_id,
+               category_rollup, plan_version_name, COUNT(DISTINCT employee_id), fiscal_year
+        FROM a_personnel_details
+        GROUP BY department_id, location_id, accounting_period, currency_id,
+                 category_rollup, plan_version_name, fiscal_year
+    """)
+    counts["a_personnel_summary"] = cursor.rowcount
+    
+    conn.commit()
+    return counts
+
+
+def benchmark_templates(conn, year: int = 2025, runs: int = 3) -> Dict[str, float]:
+    """Best-of-runs execution time in ms for each metric template"""
+    from statements import compile_metric_template
+    
+    timings = {}
+    for name in METRIC_TEMPLATES:
+        statement = compile_metric_template(name, "historical_actuals_only")
+        parameters = statement.bind(year=year)
+        best = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            conn.execute(statement.sql, parameters).fetchall()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+
+if __name__ == "__main__":
+    # Usage: python data_generator.py [scale] [database path]
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    path = sys.argv[2] if len(sys.argv) > 2 else ":memory:"
+    
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    counts = populate_database(conn, scale=scale)
+    print(f"Generated scale {scale} in {time.perf_counter() - start:.1f}s")
+    for table, count in counts.items():
+        print(f"  {table:32s} {count:>10,d} rows")
+    for name, ms in benchmark_templates(conn).items():
+        print(f"{name:32s} {ms:8.1f} ms")
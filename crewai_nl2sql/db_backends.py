@@ -0,0 +1,194 @@
+"""
+Pooled execution backends for running generated SQL
+"""
+import importlib
+import os
+import queue
+import shutil
+import sqlite3
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Union
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of DB-API connections
+    
+    At most max_size connections are checked out at once, which is also the
+    concurrency limit for queries. Connections are opened on demand and kept
+    idle between checkouts until the pool is closed.
+    """
+    
+    def __init__(self, connect: Callable[[], Any], max_size: int = 4,
+                 timeout: Optional[float] = None):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self.timeout = timeout
+        
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._connections = []
+        self._closed = False
+        
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the with block"""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection free after {self.timeout}s")
+            
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                with self._lock:
+                    self._connections.append(conn)
+                    
+            try:
+                yield conn
+            except BaseException:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                raise
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+            
+    def stats(self) -> Dict[str, int]:
+        """Open and idle connection counts"""
+        with self._lock:
+            opened = len(self._connections)
+        return {"max_size": self.max_size, "open": opened, "idle": self._idle.qsize()}
+    
+    def close(self):
+        """Close every connection the pool has opened"""
+        self._closed = True
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+            
+            
+class DBAPIBackend:
+    """
+    Execution backend for any DB-API 2.0 driver
+    
+    Args:
+        driver: Driver module name (e.g. "psycopg2") or a connect callable
+        *args, **kwargs: Passed to the driver's connect on every new connection
+        max_connections: Pool size, i.e. how many queries may run at once
+        timeout: Seconds to wait for a free connection, None waits forever
+        dialect: SQL flavour named in LLM prompts, e.g. "PostgreSQL"
+    """
+    
+    dialect = "SQL"
+    
+    def __init__(self, driver: Union[str, Callable[..., Any]], *args,
+                 max_connections: int = 4, timeout: Optional[float] = None,
+                 dialect: Optional[str] = None, **kwargs):
+        if dialect is not None:
+            self.dialect = dialect
+        if isinstance(driver, str):
+            driver = importlib.import_module(driver).connect
+        self._driver_connect = driver
+        self._args = args
+        self._kwargs = kwargs
+        self.pool = ConnectionPool(self.connect, max_connections, timeout)
+        
+    def connect(self):
+        """Open a new connection to the database"""
+        return self._driver_connect(*self._args, **self._kwargs)
+    
+    def connection(self):
+        """Check a connection out of the pool, for use as a context manager"""
+        return self.pool.connection()
+    
+    def close(self):
+        self.pool.close()
+        
+        
+class SQLiteBackend(DBAPIBackend):
+    """
+    Built-in local backend on SQLite
+    
+    The database is a file opened in WAL mode, so readers don't block each
+    other or the writer and a writer waits up to busy_timeout_ms for
+    another one. Without a path it is a temporary file that is deleted when
+    the backend is closed. ":memory:" asks for a shared-cache in-memory
+    database instead; it needs no disk, but shared-cache locking fails
+    concurrent writers at once rather than waiting on busy_timeout_ms.
+    """
+    
+    dialect = "SQLite"
+    
+    def __init__(self, path: str = None, max_connections: int = 4,
+                 timeout: Optional[float] = None, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 256):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._temp_dir = None
+        if path == ":memory:":
+            self._database = f"file:nl2sql-{uuid.uuid4().hex}?mode=memory&cache=shared"
+            self._uri = True
+        else:
+            if path is None:
+                self._temp_dir = tempfile.mkdtemp(prefix="nl2sql-")
+                path = os.path.join(self._temp_dir, "nl2sql.db")
+            self._database = path
+            self._uri = False
+        super().__init__(sqlite3.connect, max_connections=max_connections, timeout=timeout)
+        
+    def connect(self):
+        # Pooled connections move between threads, but only one uses them at a time
+        # Parameterized statements are prepared once per connection and re-used
+        conn = sqlite3.connect(self._database, uri=self._uri, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if not self._uri:
+            conn.execute("PRAGMA journal_mode = WAL")
+        return conn
+    
+    def close(self):
+        super().close()
+        if self._temp_dir is not None:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+    
+    
+# Registry of backend name -> factory returning an object with connection() and close()
+EXECUTION_BACKENDS: Dict[str, Callable[..., Any]] = {
+    "sqlite": SQLiteBackend,
+    "dbapi": DBAPIBackend
+}
+
+
+def register_backend(name: str, factory: Callable[..., Any]):
+    """Register a factory that builds an execution backend for a name"""
+    EXECUTION_BACKENDS[name] = factory
+    
+    
+def create_backend(name: str = "sqlite", *args, **kwargs):
+    """
+    Build an execution backend
+    
+    Args:
+        name: Registered backend name
+        *args, **kwargs: Passed through to the backend factory
+        
+    Returns:
+        Backend whose connection() context manager checks out a pooled connection
+    """
+    if name not in EXECUTION_BACKENDS:
+        raise ValueError(f"Unknown execution backend '{name}', expected one of {sorted(EXECUTION_BACKENDS)}")
+    return EXECUTION_BACKENDS[name](*args, **kwargs)
@@ -0,0 +1,118 @@
+"""
+Few-shot example store with a local TF-IDF similarity index
+"""
+import json
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens plus adjacent-word bigrams"""
+    words = TOKEN_PATTERN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class ExampleStore:
+    """
+    Stores past (question, intent, SQL) answers and retrieves the closest ones
+    
+    Questions are indexed as L2-normalised TF-IDF vectors in a NumPy matrix,
+    so a lookup is one matrix-vector product. The index is rebuilt lazily
+    after new examples are added.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.examples = []
+        self._lock = threading.Lock()
+        self._vocabulary = {}
+        self._idf = None
+        self._matrix = None
+        
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.examples = [json.loads(line) for line in f if line.strip()]
+            except FileNotFoundError:
+                pass
+                
+    def add(self, question: str, intent: Dict[str, Any], sql: str) -> bool:
+        """Add an example, returning False if the question is already stored"""
+        example = {"question": question, "intent": intent, "sql": sql}
+        with self._lock:
+            if any(e["question"] == question for e in self.examples):
+                return False
+            self.examples.append(example)
+            self._matrix = None
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(example) + "\n")
+        return True
+    
+    def search(self, question: str, k: int = 3, min_score: float = 0.1) -> List[Dict[str, Any]]:
+        """Return up to k stored examples most similar to the question, best first"""
+        with self._lock:
+            if not self.examples:
+                return []
+            if self._matrix is None:
+                self._build_index()
+            matrix, vocabulary, idf, examples = self._matrix, self._vocabulary, self._idf, self.examples
+            
+        query = np.zeros(len(vocabulary))
+        for token, count in Counter(tokenize(question)).items():
+            column = vocabulary.get(token)
+            if column is not None:
+                query[column] = count * idf[column]
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+            
+        scores = matrix @ (query / norm)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        
+        return [
+            dict(examples[i], score=float(scores[i]))
+            for i in top if scores[i] >= min_score
+        ]
+    
+    def format_for_prompt(self, question: str, k: int = 3) -> str:
+        """Render the nearest examples as a prompt section, or an empty string"""
+        matches = self.search(question, k)
+        if not matches:
+            return ""
+        sections = [
+            f"Example {i}: {m['question']}\nSQL:\n{m['sql']}"
+            for i, m in enumerate(matches, 1)
+        ]
+        return "Reference examples from previously validated answers:\n\n" + "\n\n".join(sections)
+        
+    def _build_index(self):
+        documents = [Counter(tokenize(e["question"])) for e in self.examples]
+        
+        vocabulary = {}
+        for document in documents:
+            for token in document:
+                vocabulary.setdefault(token, len(vocabulary))
+                
+        counts = np.zeros((len(documents), len(vocabulary)))
+        for row, document in enumerate(documents):
+            for token, count in document.items():
+                counts[row, vocabulary[token]] = count
+                
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+        matrix = counts * idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        
+        self._vocabulary = vocabulary
+        self._idf = idf
+        self._matrix = matrix / norms
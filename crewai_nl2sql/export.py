@@ -0,0 +1,126 @@
+"""
+Columnar export of executed query results
+"""
+import csv
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Sequence
+import numpy as np
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError(
+            "pyarrow is required for Arrow and Parquet export: pip install pyarrow"
+        ) from e
+    return pyarrow
+
+
+def _column_array(values: Sequence) -> np.ndarray:
+    """Convert one column of DB-API values into a NumPy array"""
+    sample = next((value for value in values if value is not None), None)
+    if isinstance(sample, Decimal):
+        return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+    if isinstance(sample, (bool, int, float)) and None not in values:
+        return np.array(values)
+    return np.array(values, dtype=object)
+
+
+def numpy_batches(batches: Iterable[List[tuple]], columns: List[str]) -> Iterator[Dict[str, np.ndarray]]:
+    """Turn batches of row tuples into dicts of column name -> NumPy array"""
+    for rows in batches:
+        yield {
+            name: _column_array(values)
+            for name, values in zip(columns, zip(*rows))
+        }
+
+
+def arrow_batches(batches: Iterable[List[tuple]], columns: List[str]):
+    """
+    Turn batches of row tuples into Arrow record batches
+    
+    The schema is inferred from the first batch and later batches are cast
+    to it, so every batch can go to the same Parquet or CSV writer.
+    """
+    pa = _require_pyarrow()
+    schema = None
+    for rows in batches:
+        arrays = []
+        for index, values in enumerate(zip(*rows)):
+            target = schema.field(index).type if schema is not None else None
+            try:
+                arrays.append(pa.array(values, type=target))
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                raise ValueError(
+                    f"Column '{columns[index]}' changed type between batches ({e}); "
+                    f"cast it in the SQL or use a larger batch size"
+                ) from e
+        batch = pa.RecordBatch.from_arrays(arrays, names=columns)
+        if schema is None:
+            schema = batch.schema
+        yield batch
+
+
+def write_parquet(batches: Iterable[List[tuple]], columns: List[str], path: str) -> int:
+    """Stream batches into a Parquet file, returning the number of rows written"""
+    pa = _require_pyarrow()
+    import pyarrow.parquet as pq
+    
+    writer = None
+    row_count = 0
+    try:
+        for batch in arrow_batches(batches, columns):
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+            writer.write_table(pa.Table.from_batches([batch]))
+            row_count += batch.num_rows
+        if writer is None:
+            # No rows: still write a file with the column names
+            empty = pa.table({name: pa.array([], type=pa.null()) for name in columns})
+            pq.write_table(empty, path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return row_count
+
+
+def write_csv(batches: Iterable[List[tuple]], columns: List[str], path: str) -> int:
+    """Stream batches into a CSV file, returning the number of rows written"""
+    try:
+        pa = _require_pyarrow()
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        pa = None
+        
+    row_count = 0
+    if pa is None:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for rows in batches:
+                writer.writerows(rows)
+                row_count += len(rows)
+        return row_count
+        
+    writer = None
+    try:
+        for batch in arrow_batches(batches, columns):
+            if writer is None:
+                writer = pa_csv.CSVWriter(path, batch.schema)
+            writer.write_batch(batch)
+            row_count += batch.num_rows
+        if writer is None:
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(columns)
+    finally:
+        if writer is not None:
+            writer.close()
+    return row_count
+
+
+# File extension -> writer
+EXPORT_FORMATS = {
+    "csv": write_csv,
+    "parquet": write_parquet
+}
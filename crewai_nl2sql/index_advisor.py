@@ -0,0 +1,209 @@
+"""
+Index advisor for generated SQL on the SQLite execution backend
+"""
+import hashlib
+import re
+from typing import Any, Dict, List, Optional
+from sql_parser import ParsedQuery, parse_sql, tokenize
+
+EQUALITY_FILTER_PATTERN = re.compile(
+    r"(?:(\w+)\.)?(\w+)\s*(?:=\s*(?:'[^']*'|-?\d+(?:\.\d+)?|\?)|IN\s*\()", re.IGNORECASE
+)
+RANGE_FILTER_PATTERN = re.compile(
+    r"(?:(\w+)\.)?(\w+)\s*(?:<=|>=|<|>|BETWEEN\b|LIKE\b)", re.IGNORECASE
+)
+
+# "SCAN pd", "SEARCH ap USING AUTOMATIC COVERING INDEX (name=?)"
+PLAN_PATTERN = re.compile(r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\w+)(?:\s+AS\s+(\w+))?(.*)$")
+
+
+def explain_plan(conn, sql: str, parameters=None) -> List[str]:
+    """
+    Detail lines of EXPLAIN QUERY PLAN for a statement
+    
+    Without parameters, ? placeholders are bound to NULL; the plan does not
+    depend on the values.
+    """
+    if parameters is None:
+        parameters = [None] * sum(1 for token in tokenize(sql) if token.value == "?")
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()]
+
+
+def plan_accesses(plan: List[str], aliases: Dict[str, str]) -> List[Dict[str, Any]]:
+    """
+    Table accesses in a query plan
+    
+    Returns:
+        One dict per SCAN/SEARCH step with table, alias, full_scan and
+        automatic_index (SQLite built a throwaway index at run time)
+    """
+    accesses = []
+    for detail in plan:
+        match = PLAN_PATTERN.match(detail)
+        if not match:
+            continue
+        operation, name, alias, rest = match.groups()
+        alias = alias or name
+        accesses.append({
+            "table": aliases.get(alias.lower(), name),
+            "alias": alias,
+            "full_scan": operation == "SCAN" and "INDEX" not in rest,
+            "automatic_index": "AUTOMATIC" in rest,
+            "detail": detail
+        })
+    return accesses
+
+
+def table_aliases(sql: str) -> Dict[str, str]:
+    """Map each alias (and bare table name) in FROM/JOIN clauses to its table"""
+    return parse_sql(sql).aliases
+
+
+class IndexAdvisor:
+    """
+    Proposes covering indexes for the tables a query scans
+    
+    Candidate key columns come from the query itself: equality filters first,
+    then range filters, then join columns, then the remaining columns the
+    query reads from that table so the index covers it. Only tables that
+    EXPLAIN QUERY PLAN shows as automatic indexes, or as full scans of at
+    least min_rows rows, get a proposal. Proposals are tried inside a savepoint so the report shows the
+    plan with them before anything is kept.
+    
+    Args:
+        backend: Execution backend with a connection() context manager (SQLite)
+        max_columns: Widest index to propose
+        min_rows: Smallest table worth indexing against full scans
+    """
+    
+    def __init__(self, backend, max_columns: int = 12, min_rows: int = 1000):
+        self.backend = backend
+        self.max_columns = max_columns
+        self.min_rows = min_rows
+        
+    def _table_columns(self, conn, table: str) -> List[str]:
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    
+    def _row_count(self, conn, table: str) -> int:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    
+    def _existing_indexes(self, conn, table: str) -> List[List[str]]:
+        indexes = []
+        for row in conn.execute(f"PRAGMA index_list({table})").fetchall():
+            indexes.append([col[2] for col in conn.execute(f"PRAGMA index_info({row[1]})").fetchall()])
+        return indexes
+    
+    def candidate_columns(self, conn, query: ParsedQuery) -> Dict[str, List[str]]:
+        """Columns worth indexing per table, in index key order"""
+        aliases = query.aliases
+        tables = {ref.name for ref in query.tables}
+        columns = {table: self._table_columns(conn, table) for table in tables}
+        single_table = next(iter(tables)) if len(tables) == 1 else None
+        
+        def resolve(alias, column):
+            table = aliases.get(alias) if alias else single_table
+            if table and column in columns.get(table, []):
+                return table
+            return None
+        
+        ordered = {table: [] for table in tables}
+        
+        def add(table, column):
+            if table and column not in ordered[table]:
+                ordered[table].append(column)
+                
+        for term in query.where_terms:
+            for alias, column in EQUALITY_FILTER_PATTERN.findall(term):
+                add(resolve(alias.lower(), column.lower()), column.lower())
+        for term in query.where_terms:
+            for alias, column in RANGE_FILTER_PATTERN.findall(term):
+                add(resolve(alias.lower(), column.lower()), column.lower())
+        for left, right in query.join_predicates:
+            add(resolve(left.qualifier, left.column), left.column)
+            add(resolve(right.qualifier, right.column), right.column)
+        for column in query.columns:
+            add(resolve(column.qualifier, column.column), column.column)
+        return ordered
+    
+    def recommend(self, sql: str, parameters=None) -> List[Dict[str, Any]]:
+        """Index proposals for the tables a query scans"""
+        with self.backend.connection() as conn:
+            return self._recommend(conn, sql, parameters)
+        
+    def _recommend(self, conn, sql: str, parameters=None) -> List[Dict[str, Any]]:
+        query = parse_sql(sql)
+        accesses = plan_accesses(explain_plan(conn, sql, parameters), query.aliases)
+        candidates = self.candidate_columns(conn, query)
+        
+        recommendations = []
+        seen = set()
+        for access in accesses:
+            table = access["table"]
+            if table in seen or not (access["full_scan"] or access["automatic_index"]):
+                continue
+            seen.add(table)
+            if not access["automatic_index"] and self._row_count(conn, table) < self.min_rows:
+                continue
+            
+            columns = candidates.get(table, [])[:self.max_columns]
+            if not columns:
+                continue
+            if any(existing[:len(columns)] == columns for existing in self._existing_indexes(conn, table)):
+                continue
+                
+            digest = hashlib.sha1(",".join(columns).encode("utf-8")).hexdigest()[:8]
+            name = f"idx_{table}_{columns[0]}_{digest}"
+            recommendations.append({
+                "table": table,
+                "columns": columns,
+                "ddl": f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})",
+                "reason": "full scan" if access["full_scan"] else "automatic index",
+                "plan_step": access["detail"]
+            })
+        return recommendations
+    
+    def advise(self, sql: str, create: bool = False, parameters=None) -> Dict[str, Any]:
+        """
+        Propose indexes for a query and report how the plan changes with them
+        
+        Args:
+            sql: Generated query
+            create: Keep the indexes instead of rolling them back
+            parameters: Values for ? placeholders in the query
+            
+        Returns:
+            Dict with indexes, plan_before, plan_after, full_scans_before,
+            full_scans_after and created
+        """
+        with self.backend.connection() as conn:
+            aliases = table_aliases(sql)
+            plan_before = explain_plan(conn, sql, parameters)
+            recommendations = self._recommend(conn, sql, parameters)
+            
+            plan_after = plan_before
+            if recommendations:
+                conn.execute("SAVEPOINT index_advisor")
+                try:
+                    for recommendation in recommendations:
+                        conn.execute(recommendation["ddl"])
+                    conn.execute("ANALYZE")
+                    plan_after = explain_plan(conn, sql, parameters)
+                except Exception:
+                    conn.execute("ROLLBACK TO index_advisor")
+                    conn.execute("RELEASE index_advisor")
+                    raise
+                if not create:
+                    conn.execute("ROLLBACK TO index_advisor")
+                conn.execute("RELEASE index_advisor")
+                
+        def full_scans(plan):
+            return [access["table"] for access in plan_accesses(plan, aliases) if access["full_scan"]]
+        
+        return {
+            "indexes": recommendations,
+            "plan_before": plan_before,
+            "plan_after": plan_after,
+            "full_scans_before": full_scans(plan_before),
+            "full_scans_after": full_scans(plan_after),
+            "created": create and bool(recommendations)
+        }
@@ -0,0 +1,49 @@
+"""
+Pluggable LLM backends for the NL2SQL agents
+"""
+import os
+from typing import Any, Callable, Dict
+
+
+def _openai_llm(model: str = "gpt-4", temperature: float = 0, **kwargs):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, temperature=temperature, **kwargs)
+
+
+def _mock_llm(**kwargs):
+    from mock_llm import MockChatModel
+    return MockChatModel(**kwargs)
+
+
+# Registry of provider name -> factory returning a LangChain chat model
+LLM_PROVIDERS: Dict[str, Callable[..., Any]] = {
+    "openai": _openai_llm,
+    "mock": _mock_llm
+}
+
+
+def register_llm_provider(name: str, factory: Callable[..., Any]):
+    """Register a factory that builds a LangChain chat model for a provider name"""
+    LLM_PROVIDERS[name] = factory
+    
+    
+def default_provider() -> str:
+    """Provider used when none is given, configurable with NL2SQL_LLM_PROVIDER"""
+    return os.getenv("NL2SQL_LLM_PROVIDER", "openai")
+
+
+def create_llm(provider: str = None, **kwargs):
+    """
+    Build the chat model for a provider
+    
+    Args:
+        provider: Registered provider name, defaults to default_provider()
+        **kwargs: Passed through to the provider factory
+        
+    Returns:
+        LangChain chat model usable as a CrewAI agent llm
+    """
+    provider = provider or default_provider()
+    if provider not in LLM_PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{provider}', expected one of {sorted(LLM_PROVIDERS)}")
+    return LLM_PROVIDERS[provider](**kwargs)
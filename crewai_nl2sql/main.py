@@ -3,11 +3,14 @@ Main NL2SQL Application
 """
 import os
 from dotenv import load_dotenv
-from crew import NL2SQLCrew
+from crew import NL2SQLCrew, validation_passed
+from cache import QueryCache
+from llm_providers import default_provider
+from db_backends import SQLiteBackend, create_backend
+from tracing import Tracer
 import json
+import threading
 from datetime import datetime
-import sqlite3
-from tabulate import tabulate
 from colorama import init, Fore, Style
 
 # Initialize colorama for colored output
@@ -19,14 +22,100 @@ load_dotenv()
 class NL2SQLApp:
     """Main application for NL2SQL conversion"""
     
-    def __init__(self):
-        self.crew = NL2SQLCrew()
-        self.setup_sample_database()
+    def __init__(self, mode: str = "crew", cache: QueryCache = None,
+                 max_concurrency: int = 4, query_timeout: float = None,
+                 example_store=None, llm=None, result_batch_size: int = 500,
+                 max_result_rows: int = None, backend=None, max_connections: int = 4,
+                 data_scale: float = None, auto_index: bool = False,
+                 cost_policy: str = None, materialize: bool = False,
+                 trace_path: str = None, speculative: bool = False, max_repairs: int = 2):
+        self.crew = NL2SQLCrew(
+            mode=mode,
+            cache=cache,
+            max_concurrency=max_concurrency,
+            query_timeout=query_timeout,
+            example_store=example_store,
+            llm=llm,
+            tracer=Tracer(path=trace_path),
+            speculative=speculative,
+            max_repairs=max_repairs,
+            # Prompts name the SQL flavour of the backend queries will run on
+            dialect=getattr(backend, "dialect", "SQL") if backend is not None else SQLiteBackend.dialect
+        )
+        self.result_batch_size = result_batch_size
+        self.max_result_rows = max_result_rows
+        self.max_connections = max_connections
+        self.data_scale = data_scale
+        self.auto_index = auto_index
         
-    def setup_sample_database(self):
-        """Create sample database with test data"""
-        self.conn = sqlite3.connect(':memory:')
-        cursor = self.conn.cursor()
+        self._backend = backend
+        self._backend_lock = threading.Lock()
+        
+        # The cost check needs the execution database while validating. The
+        # index advisor runs before a query is rejected; with auto_index its
+        # indexes are created so the query can pass.
+        if cost_policy is not None:
+            from cost_check import CostChecker
+            from index_advisor import IndexAdvisor
+            self.crew.cost_checker = CostChecker(
+                self.backend, policy=cost_policy,
+                index_advisor=IndexAdvisor(self.backend), create_indexes=auto_index
+            )
+            
+        # Hot metrics are answered from incrementally maintained aggregates
+        if materialize:
+            from materialized import MaterializedAggregates
+            self.crew.aggregates = MaterializedAggregates(
+                self.backend, on_refresh=lambda results: self._clear_cost_statistics()
+            )
+            self.crew.aggregates.refresh()
+        
+    @property
+    def backend(self):
+        """
+        Execution backend, created on first use
+        
+        Without an explicit backend the app uses a pooled SQLite database in
+        a temporary WAL-mode file, loaded with the sample data, or with synthetic data when
+        data_scale is set.
+        """
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    backend = create_backend("sqlite", max_connections=self.max_connections)
+                    self.setup_sample_database(backend, scale=self.data_scale)
+                    self._backend = backend
+        return self._backend
+        
+    def setup_sample_database(self, backend=None, scale: float = None, seed: int = 42):
+        """
+        Create sample database with test data
+        
+        With a scale, every SAMPLE_SCHEMA table is filled by the seeded
+        synthetic generator instead (about 180k detail rows per unit of scale).
+        """
+        with (backend or self.backend).connection() as conn:
+            if scale:
+                from data_generator import populate_database
+                populate_database(conn, scale=scale, seed=seed)
+            else:
+                self._create_sample_tables(conn)
+        self._clear_cost_statistics()
+        
+    def _clear_cost_statistics(self):
+        """Make the cost check count rows again after data changed"""
+        cost_checker = getattr(getattr(self, "crew", None), "cost_checker", None)
+        if cost_checker is not None:
+            cost_checker.clear_statistics()
+            
+    def close(self):
+        """Close the execution backend's pooled connections"""
+        if self._backend is not None:
+            self._backend.close()
+            self._backend = None
+            
+    def _create_sample_tables(self, conn):
+        cursor = conn.cursor()
         
         # Create tables
         cursor.execute("""
@@ -112,7 +201,7 @@ class NL2SQLApp:
             INSERT INTO master_rollup_mapping_details VALUES (?, ?, ?, ?)
         """, rollup_data)
         
-        self.conn.commit()
+        conn.commit()
         
     def process_query(self, user_query: str):
         """Process a natural language query through the pipeline"""
@@ -127,10 +216,60 @@ class NL2SQLApp:
         self._display_results(results)
         
         # Execute SQL if validation passed
-        if results.get("final_sql") and "is_valid': true" in str(results.get("validation", "")):
-            self._execute_sql(results["final_sql"])
+        if results.get("final_sql") and validation_passed(results.get("validation")):
+            if self.auto_index:
+                self._auto_index(results["final_sql"], results.get("parameters"))
+            self._execute_sql(results["final_sql"], parameters=results.get("parameters"))
+        else:
+            self._report_not_executed(results)
             
         return results
+    
+    def _report_not_executed(self, results):
+        """Say why a query's SQL was not run"""
+        if not results.get("final_sql"):
+            print(f"{Fore.RED}❌ No SQL was generated, nothing executed")
+            return
+        validation = results.get("validation")
+        issues = validation.get("issues") if isinstance(validation, dict) else None
+        repairs = results.get("repairs", 0)
+        print(f"{Fore.RED}❌ SQL failed validation after {repairs} repair attempt(s), not executed")
+        for issue in issues or []:
+            print(f"{Fore.RED}  - {issue}")
+        
+    async def aprocess_query(self, user_query: str, timeout: float = None):
+        """Process a natural language query without blocking the event loop"""
+        results = await self.crew.arun(user_query, timeout=timeout)
+        
+        self._display_results(results)
+        if results.get("error"):
+            print(f"{Fore.RED}❌ {results['error']}")
+            
+        # Execute SQL on a pooled connection so concurrent queries run in parallel,
+        # streaming and rendering batch by batch on the worker thread as process_query does
+        if results.get("final_sql") and validation_passed(results.get("validation")):
+            import asyncio
+            
+            loop = asyncio.get_running_loop()
+            if self.auto_index:
+                await loop.run_in_executor(
+                    None, self._auto_index, results["final_sql"], results.get("parameters")
+                )
+            await loop.run_in_executor(
+                None, self._execute_sql, results["final_sql"], None, results.get("parameters")
+            )
+        elif not results.get("error"):
+            self._report_not_executed(results)
+                
+        return results
+    
+    async def aprocess_queries(self, user_queries, timeout: float = None):
+        """Process several queries concurrently, returning results in input order"""
+        import asyncio
+        
+        return await asyncio.gather(
+            *(self.aprocess_query(query, timeout=timeout) for query in user_queries)
+        )
         
     def _display_results(self, results):
         """Display pipeline results in a formatted way"""
@@ -148,6 +287,8 @@ class NL2SQLApp:
             print(f"\n{Fore.MAGENTA}🔍 GENERATED SQL:")
             print(f"{Fore.MAGENTA}{'-'*80}")
             print(f"{Fore.WHITE}{results['final_sql']}")
+            if results.get("parameters"):
+                print(f"{Fore.MAGENTA}Parameters: {results['parameters']}")
             print()
             
         # Display validation results
@@ -156,31 +297,179 @@ class NL2SQLApp:
             print(f"{Fore.CYAN}{'-'*80}")
             print(results["validation"])
             
-    def _execute_sql(self, sql):
-        """Execute the generated SQL and display results"""
+        # Display repair attempts
+        for attempt in results.get("repair_log") or []:
+            outcome = "valid" if attempt["is_valid"] else "still invalid"
+            print(f"{Fore.CYAN}🔧 {attempt['kind']} repair of {len(attempt['issues'])} issue(s): {outcome}")
+            
+        # Display per-stage timings
+        trace = results.get("trace")
+        if trace and trace["stages"]:
+            print(f"\n{Fore.BLUE}⏱ STAGES ({trace['total_time'] * 1000:.1f} ms total):")
+            for stage in trace["stages"]:
+                print(f"{Fore.BLUE}  {stage['stage']:<15} {stage['wall_time'] * 1000:8.1f} ms"
+                      f"  llm {stage['llm_time'] * 1000:8.1f} ms  tools {stage['tool_time'] * 1000:8.1f} ms"
+                      f"  tokens {stage['prompt_tokens']}/{stage['completion_tokens']}")
+            
+    def metrics_text(self) -> str:
+        """Per-stage latency and token totals in the Prometheus text format"""
+        return self.crew.tracer.prometheus_text()
+    
+    def export_traces(self, path: str) -> int:
+        """Write the recorded query traces to a JSON lines file"""
+        return self.crew.tracer.export_jsonl(path)
+    
+    def advise_indexes(self, sql, create: bool = False, parameters=None):
+        """
+        Propose covering indexes for a query's scanned tables with IndexAdvisor
+        
+        Returns the advisor report, including the query plan before and after.
+        With create=True the indexes are kept on the execution database.
+        """
+        from index_advisor import IndexAdvisor
+        
+        return IndexAdvisor(self.backend).advise(sql, create=create, parameters=parameters)
+    
+    def refresh_aggregates(self, include_open: bool = False, rebuild: bool = False):
+        """
+        Fold newly loaded fact rows into the materialized aggregates
+        
+        Only partitions that received rows are recomputed; include_open also
+        recomputes open accounting periods after in-place updates.
+        """
+        if self.crew.aggregates is None:
+            raise RuntimeError("Materialized aggregates are not enabled, pass materialize=True")
+        return self.crew.aggregates.refresh(include_open=include_open, rebuild=rebuild)
+    
+    def _auto_index(self, sql, parameters=None):
+        """Create advised indexes before running generated SQL"""
         try:
-            print(f"\n{Fore.GREEN}📊 QUERY EXECUTION RESULTS:")
-            print(f"{Fore.GREEN}{'-'*80}\n")
+            report = self.advise_indexes(sql, create=True, parameters=parameters)
+        except Exception as e:
+            print(f"{Fore.YELLOW}⚠ Index advisor skipped: {str(e)}")
+            return
+        for index in report["indexes"]:
+            print(f"{Fore.BLUE}🗂 Created index on {index['table']}({', '.join(index['columns'])}) - {index['reason']}")
             
-            cursor = self.conn.cursor()
-            cursor.execute(sql)
+    def stream_query(self, sql, batch_size: int = None, max_rows: int = None,
+                     parameters=None):
+        """
+        Execute SQL and yield the column names, then rows in batches
+        
+        Rows are pulled with fetchmany so memory stays bounded by batch_size.
+        Fetching stops, and the cursor is closed, once max_rows rows have
+        been yielded. A pooled connection is checked out for as long as the
+        generator is running. Parameters are bound to ? placeholders, so
+        repeated statements re-use the connection's prepared statement cache.
+        
+        Yields:
+            The list of column names first, then lists of row tuples
+        """
+        batch_size = batch_size or self.result_batch_size
+        max_rows = max_rows if max_rows is not None else self.max_result_rows
+        
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, parameters or ())
+                yield [desc[0] for desc in cursor.description]
+                
+                remaining = max_rows
+                while remaining is None or remaining > 0:
+                    size = batch_size if remaining is None else min(batch_size, remaining)
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield rows
+                    if remaining is not None:
+                        remaining -= len(rows)
+            finally:
+                cursor.close()
             
-            # Get column names
-            columns = [desc[0] for desc in cursor.description]
+    def fetch_columnar(self, sql, batch_size: int = None, max_rows: int = None, parameters=None):
+        """Execute SQL and yield results as dicts of column name -> NumPy array"""
+        from export import numpy_batches
+        
+        batches = self.stream_query(sql, batch_size, max_rows, parameters)
+        columns = next(batches)
+        yield from numpy_batches(batches, columns)
+        
+    def fetch_arrow(self, sql, batch_size: int = None, max_rows: int = None, parameters=None):
+        """Execute SQL and yield results as Arrow record batches (requires pyarrow)"""
+        from export import arrow_batches
+        
+        batches = self.stream_query(sql, batch_size, max_rows, parameters)
+        columns = next(batches)
+        yield from arrow_batches(batches, columns)
+        
+    def export_results(self, sql, path: str, file_format: str = None,
+                       batch_size: int = None, max_rows: int = None, parameters=None) -> int:
+        """
+        Stream the results of SQL into a CSV or Parquet file
+        
+        The format defaults to the file extension. Returns the number of rows written.
+        """
+        from export import EXPORT_FORMATS
+        
+        file_format = (file_format or os.path.splitext(path)[1].lstrip(".")).lower()
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format '{file_format}', expected one of {sorted(EXPORT_FORMATS)}")
             
-            # Fetch results
-            rows = cursor.fetchall()
+        batches = self.stream_query(sql, batch_size, max_rows, parameters)
+        columns = next(batches)
+        return EXPORT_FORMATS[file_format](batches, columns, path)
+    
+    def export_csv(self, sql, path: str, batch_size: int = None, max_rows: int = None,
+                   parameters=None) -> int:
+        """Stream the results of SQL into a CSV file, returning the number of rows written"""
+        return self.export_results(sql, path, "csv", batch_size, max_rows, parameters)
             
-            if rows:
-                # Display as table
-                print(tabulate(rows, headers=columns, tablefmt="grid"))
-                print(f"\n{Fore.GREEN}✓ Query returned {len(rows)} rows")
-            else:
-                print(f"{Fore.YELLOW}⚠ Query returned no results")
+    def _execute_sql(self, sql, max_rows: int = None, parameters=None):
+        """Execute the generated SQL and display results batch by batch"""
+        max_rows = max_rows if max_rows is not None else self.max_result_rows
+        try:
+            # One row past the limit tells a truncated result from one that just fits
+            batches = self.stream_query(sql, max_rows=max_rows + 1 if max_rows is not None else None,
+                                        parameters=parameters)
+            
+            # Get column names
+            columns = next(batches)
+            
+            # Render each batch as soon as it is fetched
+            self._render_result(columns, batches, max_rows)
                 
         except Exception as e:
             print(f"{Fore.RED}❌ Query execution failed: {str(e)}")
             
+    def _render_result(self, columns, batches, max_rows: int = None):
+        """
+        Display result batches as tables
+        
+        At most max_rows rows are shown; the limit is only reported as
+        reached when batches held more rows than that.
+        """
+        from tabulate import tabulate
+        
+        print(f"\n{Fore.GREEN}📊 QUERY EXECUTION RESULTS:")
+        print(f"{Fore.GREEN}{'-'*80}\n")
+        
+        row_count = 0
+        truncated = False
+        for rows in batches:
+            if max_rows is not None and row_count + len(rows) > max_rows:
+                rows = rows[:max_rows - row_count]
+                truncated = True
+            if rows:
+                print(tabulate(rows, headers=columns, tablefmt="grid"))
+                row_count += len(rows)
+        
+        if row_count:
+            print(f"\n{Fore.GREEN}✓ Query returned {row_count} rows")
+            if truncated:
+                print(f"{Fore.YELLOW}⚠ Output stopped at the {max_rows} row limit")
+        else:
+            print(f"{Fore.YELLOW}⚠ Query returned no results")
+            
     def run_demo(self):
         """Run demo with sample queries"""
         demo_queries = [
@@ -232,12 +521,29 @@ class NL2SQLApp:
 
 if __name__ == "__main__":
     # Check for OpenAI API key
-    if not os.getenv("OPENAI_API_KEY"):
+    if default_provider() == "openai" and not os.getenv("OPENAI_API_KEY"):
         print(f"{Fore.RED}Error: OPENAI_API_KEY not found in environment variables")
         print(f"{Fore.YELLOW}Please set your OpenAI API key in a .env file or environment variable")
         exit(1)
         
-    app = NL2SQLApp()
+    from examples import ExampleStore
+    
+    cache_path = os.getenv("NL2SQL_CACHE_PATH")
+    examples_path = os.getenv("NL2SQL_EXAMPLES_PATH")
+    data_scale = os.getenv("NL2SQL_DATA_SCALE")
+    cost_policy = os.getenv("NL2SQL_COST_POLICY")
+    max_repairs = os.getenv("NL2SQL_MAX_REPAIRS")
+    app = NL2SQLApp(
+        mode=os.getenv("NL2SQL_MODE", "crew"),
+        cache=QueryCache(path=cache_path) if cache_path else None,
+        example_store=ExampleStore(path=examples_path) if examples_path else None,
+        data_scale=float(data_scale) if data_scale else None,
+        cost_policy=cost_policy or None,
+        materialize=os.getenv("NL2SQL_MATERIALIZE", "").lower() in ("1", "true", "yes"),
+        trace_path=os.getenv("NL2SQL_TRACE_PATH"),
+        speculative=os.getenv("NL2SQL_SPECULATIVE", "").lower() in ("1", "true", "yes"),
+        max_repairs=int(max_repairs) if max_repairs else 2
+    )
     
     # Run in interactive mode
     app.interactive_mode()
@@ -0,0 +1,379 @@
+"""
+Incrementally maintained aggregates for the hot metric templates
+"""
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from sample_schema import SAMPLE_SCHEMA
+from sql_parser import parse_sql
+from statements import CompiledStatement, compile_template
+
+# Aggregate tables derived from the fact tables. Each one is refreshed per
+# partition: source rows past the stored rowid watermark mark their partitions
+# as changed, and only those partitions are recomputed. Closed accounting
+# periods receive no new rows, so once built they are never recomputed.
+#
+#   source_table      - fact table whose new rows trigger a refresh
+#   requires          - tables the populate query reads
+#   partition         - aggregate columns identifying one refresh unit
+#   partition_source  - expressions computing the partition from the source query
+#   changed           - partitions of source rows with rowid in (?, ?]
+#   open              - partitions of open accounting periods
+#   populate          - INSERT ... SELECT with a {partitions} filter slot
+#   source_index      - source columns indexed so one partition is cheap to recompute
+#   templates         - METRIC_TEMPLATES keys answered from the aggregate
+MATERIALIZED_AGGREGATES = {
+    "agg_compensation_cost": {
+        "columns": {
+            "accounting_period": "VARCHAR(7)",
+            "fiscal_year": "INTEGER",
+            "department_id": "INTEGER",
+            "location_id": "INTEGER",
+            "plan_version_name": "VARCHAR(50)",
+            "closed": "BOOLEAN",
+            "employee_id": "INTEGER",
+            "compensation_cost": "DECIMAL(15,2)",
+            "source_rows": "INTEGER"
+        },
+        "description": "Signed compensation cost per employee, accounting period, department and location",
+        "source_table": "a_personnel_details",
+        "requires": ["a_personnel_details", "master_rollup_mapping_details"],
+        "partition": ["accounting_period"],
+        "partition_source": ["pd.accounting_period"],
+        "changed": """
+            SELECT DISTINCT pd.accounting_period
+            FROM a_personnel_details pd
+            WHERE pd.rowid > ? AND pd.rowid <= ?
+        """,
+        "open": "SELECT name FROM m_accounting_period WHERE is_closed = 0",
+        "populate": """
+            INSERT INTO agg_compensation_cost
+                (accounting_period, fiscal_year, department_id, location_id,
+                 plan_version_name, closed, employee_id, compensation_cost, source_rows)
+            SELECT
+                pd.accounting_period,
+                pd.fiscal_year,
+                pd.department_id,
+                pd.location_id,
+                pd.plan_version_name,
+                pd.closed,
+                pd.employee_id,
+                SUM(CASE WHEN mrm.requires_negation = 1 THEN -pd.amount ELSE pd.amount END),
+                COUNT(*)
+            FROM a_personnel_details pd
+            JOIN master_rollup_mapping_details mrm ON pd.category = mrm.category
+            WHERE mrm.is_compensation = 1
+                AND {partitions}
+            GROUP BY pd.accounting_period, pd.fiscal_year, pd.department_id, pd.location_id,
+                pd.plan_version_name, pd.closed, pd.employee_id
+        """,
+        "source_index": ["accounting_period"],
+        "index": ["fiscal_year", "plan_version_name", "closed"],
+        "templates": {
+            "fully_loaded_cost_per_employee": """
+                SELECT
+                    d.department_name,
+                    l.location_name,
+                    SUM(ac.compensation_cost) / COUNT(DISTINCT ac.employee_id) as cost_per_employee
+                FROM agg_compensation_cost ac
+                JOIN m_department d ON ac.department_id = d.department_id
+                JOIN m_location l ON ac.location_id = l.location_id
+                JOIN m_accounting_period ap ON ac.accounting_period = ap.name
+                WHERE {scenario_filter}
+                    AND ac.fiscal_year = {year}
+                GROUP BY d.department_name, l.location_name
+            """
+        }
+    },
+    
+    "agg_headcount_movement": {
+        "columns": {
+            "fiscal_year": "INTEGER",
+            "fiscal_quarter": "INTEGER",
+            "movement_type": "VARCHAR(20)",
+            "employee_count": "INTEGER",
+            "source_rows": "INTEGER"
+        },
+        "description": "Distinct employees per fiscal quarter and movement type",
+        "source_table": "a_personnel_headcount",
+        "requires": ["a_personnel_headcount", "m_accounting_period"],
+        "partition": ["fiscal_year", "fiscal_quarter"],
+        "partition_source": ["ph.fiscal_year", "ap.fiscal_quarter"],
+        "changed": """
+            SELECT DISTINCT ph.fiscal_year, ap.fiscal_quarter
+            FROM a_personnel_headcount ph
+            JOIN m_accounting_period ap ON ph.accounting_period = ap.name
+            WHERE ph.rowid > ? AND ph.rowid <= ?
+        """,
+        "open": "SELECT DISTINCT fiscal_year, fiscal_quarter FROM m_accounting_period WHERE is_closed = 0",
+        "populate": """
+            INSERT INTO agg_headcount_movement
+                (fiscal_year, fiscal_quarter, movement_type, employee_count, source_rows)
+            SELECT
+                ph.fiscal_year,
+                ap.fiscal_quarter,
+                ph.movement_type,
+                COUNT(DISTINCT ph.employee_id),
+                COUNT(*)
+            FROM a_personnel_headcount ph
+            JOIN m_accounting_period ap ON ph.accounting_period = ap.name
+            WHERE {partitions}
+            GROUP BY ph.fiscal_year, ap.fiscal_quarter, ph.movement_type
+        """,
+        "index": ["fiscal_year", "movement_type"],
+        "templates": {
+            "headcount_movement": """
+                SELECT
+                    ah.fiscal_quarter,
+                    ah.movement_type,
+                    ah.employee_count
+                FROM agg_headcount_movement ah
+                WHERE ah.fiscal_year = {year}
+                    AND ah.movement_type IN ('hire', 'termination')
+                ORDER BY ah.fiscal_quarter
+            """
+        }
+    }
+}
+
+# Partitions per DELETE / INSERT statement, well below SQLite's variable limit
+PARTITION_CHUNK = 200
+
+STATE_TABLE = "materialized_state"
+
+
+def aggregate_schema() -> Dict[str, Dict[str, Any]]:
+    """The aggregate tables in SAMPLE_SCHEMA form"""
+    return {
+        name: {"columns": spec["columns"], "description": spec["description"]}
+        for name, spec in MATERIALIZED_AGGREGATES.items()
+    }
+
+
+def aggregate_route(template_key: str, available: Optional[Iterable[str]]) -> Optional[str]:
+    """The available aggregate that answers a metric template, if any"""
+    for name in available or ():
+        if template_key in MATERIALIZED_AGGREGATES.get(name, {}).get("templates", {}):
+            return name
+    return None
+
+
+@lru_cache(maxsize=None)
+def compile_aggregate_template(aggregate: str, template_key: str, scenario: Optional[str] = None,
+                               with_quarter: bool = False) -> CompiledStatement:
+    """Compile an aggregate's variant of a metric template, like compile_metric_template"""
+    spec = MATERIALIZED_AGGREGATES[aggregate]
+    quarter_column = None
+    if "fiscal_quarter" in spec["columns"]:
+        # The aggregate carries the quarter itself, no period join needed
+        quarter_column = f"{_template_alias(spec['templates'][template_key], aggregate)}.fiscal_quarter"
+    return compile_template(spec["templates"][template_key], scenario, with_quarter,
+                            columns=spec["columns"], quarter_column=quarter_column)
+
+
+def _template_alias(template: str, table: str) -> str:
+    for ref in parse_sql(template).tables:
+        if ref.name == table:
+            return ref.alias or ref.name
+    return table
+
+
+def _partition_filter(expressions: List[str], count: int) -> str:
+    row = "(" + ", ".join("?" * len(expressions)) + ")"
+    return f"({', '.join(expressions)}) IN (VALUES {', '.join([row] * count)})"
+
+
+class MaterializedAggregates:
+    """
+    Keeps the MATERIALIZED_AGGREGATES tables in step with the fact tables
+    
+    The first refresh builds each aggregate in one pass. Later refreshes only
+    look at source rows added since the last one (rowids above the stored
+    watermark) and recompute the partitions those rows belong to, so closed
+    periods are left alone. Open accounting periods can be recomputed as well
+    with include_open, for loaders that update rows in place. Deleted or
+    updated rows in closed periods are not detected; use rebuild() after them.
+    
+    Aggregates whose source tables are missing are skipped and never offered
+    for routing.
+    
+    Args:
+        backend: Execution backend with a connection() context manager (SQLite)
+        aggregates: Names of the aggregates to maintain, default all
+        auto_refresh: Pick up new source rows in available() before routing
+        on_refresh: Called with the refresh results whenever a refresh wrote
+            aggregate rows, e.g. to drop cached table statistics
+    """
+    
+    def __init__(self, backend, aggregates: Optional[Iterable[str]] = None, auto_refresh: bool = True,
+                 on_refresh: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        names = list(aggregates) if aggregates is not None else list(MATERIALIZED_AGGREGATES)
+        unknown = [name for name in names if name not in MATERIALIZED_AGGREGATES]
+        if unknown:
+            raise ValueError(f"Unknown materialized aggregates: {', '.join(unknown)}")
+        self.backend = backend
+        self.aggregates = names
+        self.auto_refresh = auto_refresh
+        self.on_refresh = on_refresh
+        
+        self._watermarks = {}
+        self._refreshed = False
+        self._lock = threading.Lock()
+    
+    @property
+    def validation_schema(self) -> Dict[str, Dict[str, Any]]:
+        """SAMPLE_SCHEMA plus the maintained aggregate tables"""
+        schema = dict(SAMPLE_SCHEMA)
+        schema.update({name: spec for name, spec in aggregate_schema().items() if name in self.aggregates})
+        return schema
+    
+    def _create(self, conn, name: str):
+        spec = MATERIALIZED_AGGREGATES[name]
+        columns = ", ".join(f"{column} {kind}" for column, kind in spec["columns"].items())
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_partition ON {name} ({', '.join(spec['partition'])})")
+        if spec.get("index"):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_lookup ON {name} ({', '.join(spec['index'])})")
+        if spec.get("source_index"):
+            source = spec["source_table"]
+            conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{source}_{'_'.join(spec['source_index'])} "
+                f"ON {source} ({', '.join(spec['source_index'])})"
+            )
+    
+    def _load_state(self, conn):
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} "
+            "(aggregate_name TEXT PRIMARY KEY, source_watermark INTEGER, refreshed_at TEXT)"
+        )
+        for name, watermark in conn.execute(f"SELECT aggregate_name, source_watermark FROM {STATE_TABLE}"):
+            self._watermarks[name] = watermark
+    
+    @staticmethod
+    def _has_tables(conn, tables: List[str]) -> bool:
+        placeholders = ", ".join("?" * len(tables))
+        found = conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE type IN ('table', 'view') AND name IN ({placeholders})",
+            tables
+        ).fetchone()[0]
+        return found == len(set(tables))
+    
+    @staticmethod
+    def _open_partitions(conn, spec) -> set:
+        try:
+            return {tuple(row) for row in conn.execute(spec["open"])}
+        except Exception:
+            # Period masters without is_closed have no open periods to track
+            return set()
+    
+    def _recompute(self, conn, name: str, partitions: List[tuple]) -> int:
+        spec = MATERIALIZED_AGGREGATES[name]
+        rows = 0
+        for start in range(0, len(partitions), PARTITION_CHUNK):
+            chunk = partitions[start:start + PARTITION_CHUNK]
+            values = [value for partition in chunk for value in partition]
+            conn.execute(f"DELETE FROM {name} WHERE {_partition_filter(spec['partition'], len(chunk))}", values)
+            cursor = conn.execute(
+                spec["populate"].format(partitions=_partition_filter(spec["partition_source"], len(chunk))), values
+            )
+            rows += cursor.rowcount
+        return rows
+    
+    def _refresh_one(self, conn, name: str, include_open: bool, rebuild: bool) -> Optional[Dict[str, Any]]:
+        spec = MATERIALIZED_AGGREGATES[name]
+        if not self._has_tables(conn, spec["requires"]):
+            return None
+        started = time.perf_counter()
+        self._create(conn, name)
+        
+        watermark = None if rebuild else self._watermarks.get(name)
+        high = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {spec['source_table']}").fetchone()[0]
+        
+        if watermark is None:
+            # Full build in one pass over the source
+            conn.execute(f"DELETE FROM {name}")
+            rows = conn.execute(spec["populate"].format(partitions="1 = 1")).rowcount
+            partitions = None
+        else:
+            changed = set()
+            if high != watermark:
+                changed = {tuple(row) for row in conn.execute(spec["changed"], (watermark, high))}
+            if include_open:
+                changed |= self._open_partitions(conn, spec)
+            partitions = sorted(changed, key=repr)
+            if not partitions and high == watermark:
+                # Nothing to do, leave the stored state alone
+                return None
+            rows = self._recompute(conn, name, partitions) if partitions else 0
+        
+        conn.execute(
+            f"INSERT OR REPLACE INTO {STATE_TABLE} (aggregate_name, source_watermark, refreshed_at) VALUES (?, ?, ?)",
+            (name, high, datetime.now().isoformat())
+        )
+        self._watermarks[name] = high
+        return {
+            "aggregate": name,
+            "full_build": partitions is None,
+            "partitions": len(partitions) if partitions is not None else None,
+            "rows_written": rows,
+            "watermark": high,
+            "seconds": round(time.perf_counter() - started, 4)
+        }
+    
+    def refresh(self, include_open: bool = False, rebuild: bool = False) -> List[Dict[str, Any]]:
+        """
+        Bring the aggregates up to date with their source tables
+        
+        Args:
+            include_open: Also recompute partitions of open accounting periods
+            rebuild: Recompute everything from scratch
+        
+        Returns:
+            Per refreshed aggregate: aggregate, full_build, partitions
+            (recomputed, None for a full build), rows_written, watermark and
+            seconds. Aggregates that were already current are left out.
+        """
+        results = []
+        with self._lock, self.backend.connection() as conn:
+            self._load_state(conn)
+            for name in self.aggregates:
+                result = self._refresh_one(conn, name, include_open, rebuild)
+                if result is not None:
+                    results.append(result)
+            conn.commit()
+            self._refreshed = True
+        if results and self.on_refresh is not None:
+            self.on_refresh(results)
+        return results
+    
+    def rebuild(self) -> List[Dict[str, Any]]:
+        """Recompute every aggregate from scratch"""
+        return self.refresh(rebuild=True)
+    
+    def available(self) -> List[str]:
+        """
+        Aggregates that are built and current, safe to route queries to
+        
+        With auto_refresh, rows added since the last refresh are folded in
+        first. When nothing was added this only reads one MAX(rowid) per
+        aggregate and writes nothing.
+        """
+        if self.auto_refresh and (not self._refreshed or self._stale()):
+            self.refresh()
+        with self._lock:
+            return [name for name in self.aggregates if name in self._watermarks]
+    
+    def _stale(self) -> bool:
+        """Whether any built aggregate's source table has rows past its watermark"""
+        with self._lock, self.backend.connection() as conn:
+            for name in self.aggregates:
+                watermark = self._watermarks.get(name)
+                if watermark is None:
+                    continue
+                source = MATERIALIZED_AGGREGATES[name]["source_table"]
+                high = conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {source}").fetchone()[0]
+                if high != watermark:
+                    return True
+        return False
@@ -0,0 +1,193 @@
+"""
+Deterministic local chat model for running the crew without an LLM service
+"""
+import itertools
+import json
+import re
+import threading
+import time
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+from tools import (
+    classify_intent,
+    select_tables,
+    prune_columns,
+    generate_sql,
+    validate_sql
+)
+from sample_schema import SAMPLE_SCHEMA
+from planner import LLM_STAGE_KEY
+from repair import (
+    MISSING_TABLE_PATTERN,
+    MISSING_WHERE_ISSUE,
+    PERIOD_MAPPING_ISSUE,
+    add_missing_joins,
+    add_scenario_filter
+)
+from sql_parser import TOKEN_PATTERN
+
+
+# Agent roles from agents.py mapped to the pipeline stage they run
+STAGE_BY_ROLE = {
+    "Intent Strategist": "intent",
+    "Table Curator": "tables",
+    "Schema Trimmer": "schema",
+    "SQL Composer": "sql_generation",
+    "Query Auditor": "validation"
+}
+
+CONTEXT_MARKER = "This is the context you're working with:"
+QUERY_PATTERN = re.compile(r"classify the intent:\s*'(.*?)'\s*\n", re.DOTALL)
+JSON_START_PATTERN = re.compile(r"[\[{]")
+# "Label: text" sections of the planner and repair prompts, up to a blank line or the next label
+SECTION_PATTERN = re.compile(r"^(\w+):[ \t]*(.*?)(?=\n\n|\n\w+:|\Z)", re.MULTILINE | re.DOTALL)
+UNSUPPORTED_PATTERN = re.compile(r"Unsupported character (.+) in query")
+
+
+def _json_values(text: str) -> List[Any]:
+    """Decode every JSON object or array embedded in text, in order"""
+    decoder = json.JSONDecoder()
+    values = []
+    position = 0
+    while True:
+        match = JSON_START_PATTERN.search(text, position)
+        if match is None:
+            return values
+        try:
+            value, end = decoder.raw_decode(text, match.start())
+        except ValueError:
+            position = match.start() + 1
+            continue
+        values.append(value)
+        position = end
+
+
+def _sections(prompt: str) -> dict:
+    """The labelled sections of a planner or repair prompt, first occurrence of each"""
+    sections = {}
+    for label, text in SECTION_PATTERN.findall(prompt):
+        sections.setdefault(label, text.strip())
+    return sections
+
+
+def repair_response(sql: str, parameters: List[Any], issues: List[str], intent: Optional[dict]) -> dict:
+    """
+    Fix what the validation issues point at, as a model following them would
+    
+    Unsupported characters are dropped, missing tables joined and a missing
+    WHERE clause gets the scenario filter. Anything else is left as it is,
+    so issues the mock cannot address stay for the next validation.
+    """
+    fixes = []
+    if any(UNSUPPORTED_PATTERN.match(issue) for issue in issues):
+        sql = "".join(match.group() for match in TOKEN_PATTERN.finditer(sql) if match.lastgroup != "unknown")
+        fixes.append("removed unsupported characters")
+        
+    missing = [match.group(1) for match in map(MISSING_TABLE_PATTERN.match, issues) if match]
+    if any(issue.startswith(PERIOD_MAPPING_ISSUE) for issue in issues):
+        missing.append("m_accounting_period")
+    joined = add_missing_joins(sql, parameters, list(dict.fromkeys(missing))) if missing else None
+    if joined is not None:
+        sql, parameters = joined
+        fixes.append("joined the missing tables")
+        
+    filtered = add_scenario_filter(sql, parameters, (intent or {}).get("scenario")) \
+        if MISSING_WHERE_ISSUE in issues else None
+    if filtered is not None:
+        sql, parameters = filtered
+        fixes.append("added the scenario filter")
+        
+    return {"sql": sql, "parameters": parameters, "notes": "; ".join(fixes) or "No issue could be fixed"}
+
+
+def tool_derived_response(prompt: str, stage: Optional[str] = None) -> str:
+    """
+    Answer a prompt by running the matching deterministic tool
+    
+    Direct planner and repair calls name their stage in the run metadata
+    and get the bare JSON answer, built from the labelled prompt sections.
+    Crew task stages are recognised from the agent role in the prompt and
+    the tool inputs are read from the JSON answers of earlier stages in the
+    context.
+    """
+    if stage in ("planner", "repair"):
+        sections = _sections(prompt)
+        intent = json.loads(sections.get("Intent") or "null")
+        tables = json.loads(sections.get("Tables") or "[]")
+        if stage == "planner":
+            return json.dumps(generate_sql.func(intent, tables, prune_columns.func(tables, intent)))
+        issues = [line[2:] for line in sections.get("Issues", "").splitlines() if line.startswith("- ")]
+        parameters = json.loads(sections.get("Parameters") or "[]")
+        return json.dumps(repair_response(sections.get("Query", ""), parameters, issues, intent))
+        
+    stage = next(
+        (stage for role, stage in STAGE_BY_ROLE.items() if f"You are {role}." in prompt),
+        None
+    )
+    context = prompt.split(CONTEXT_MARKER, 1)[1] if CONTEXT_MARKER in prompt else ""
+    values = _json_values(context)
+    # Earlier stages answered in the shapes of stage_outputs.task_models
+    intent = next((v for v in values if isinstance(v, dict) and "metric_type" in v), None)
+    tables = next((v["tables"] for v in values if isinstance(v, dict) and isinstance(v.get("tables"), list)), None)
+    
+    try:
+        if stage == "intent":
+            match = QUERY_PATTERN.search(prompt)
+            output = classify_intent.func(match.group(1) if match else "")
+        elif stage == "tables":
+            output = {"tables": select_tables.func(intent)}
+        elif stage == "schema":
+            output = {"columns": prune_columns.func(tables)}
+        elif stage == "sql_generation":
+            schema = next(
+                (v["columns"] for v in values if isinstance(v, dict) and "columns" in v), {}
+            )
+            output = generate_sql.func(intent, tables, schema)
+        elif stage == "validation":
+            sql = next(v["sql"] for v in values if isinstance(v, dict) and "sql" in v)
+            output = validate_sql.func(sql, tables or [], SAMPLE_SCHEMA)
+        else:
+            output = {"error": "Unrecognised task"}
+    except Exception as e:
+        output = {"error": f"Could not derive a {stage} answer: {e}"}
+        
+    return f"Thought: I now can give a great answer\nFinal Answer: {json.dumps(output)}"
+
+
+class MockChatModel(BaseChatModel):
+    """
+    Local stand-in for a chat model with configurable simulated latency
+    
+    Replies with the canned responses in rotation when given, otherwise with
+    the answer the deterministic tools produce for the task in the prompt.
+    """
+    
+    latency: float = 0.0
+    responses: Optional[List[str]] = None
+    
+    _calls = PrivateAttr(default_factory=itertools.count)
+    _lock = PrivateAttr(default_factory=threading.Lock)
+    
+    @property
+    def _llm_type(self) -> str:
+        return "nl2sql-mock"
+    
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+            
+        with self._lock:
+            call = next(self._calls)
+            
+        if self.responses:
+            text = self.responses[call % len(self.responses)]
+        else:
+            prompt = "\n".join(str(message.content) for message in messages)
+            metadata = getattr(run_manager, "metadata", None) or {}
+            text = tool_derived_response(prompt, metadata.get(LLM_STAGE_KEY))
+            
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
@@ -0,0 +1,111 @@
+"""
+Single-call planner: deterministic pipeline steps around one LLM call
+"""
+import json
+import textwrap
+from typing import Any, Dict, List, Optional
+from sample_schema import DATA_RULES, METRIC_TEMPLATES
+from schema_index import SCHEMA_INDEX
+from schema_pruner import render_schema
+from stage_outputs import SQLOutput
+
+# Run metadata key naming the pipeline stage of a direct LLM call, see llm_config
+LLM_STAGE_KEY = "nl2sql_stage"
+PLANNER_STAGE = "planner"
+
+PLANNER_PROMPT = """Write one {dialect} query answering a business question about HR and financial data.
+
+Question: {question}
+
+Schema (only these tables and columns may be used):
+{schema}
+
+Join paths:
+{joins}
+
+Rules:
+{rules}
+{template}{examples}
+Respond with a single JSON object and nothing else, with the keys:
+- "sql": the query, using ? placeholders for literal values
+- "parameters": the values for the placeholders, in order
+- "decisions": how negation, scenario, currency and rollups were handled
+- "notes": anything the reader should know
+
+Intent: {intent}
+Tables: {tables}
+"""
+
+
+def llm_config(stage: str) -> Dict[str, Any]:
+    """
+    Invoke config for a direct LLM call of a stage
+    
+    The stage goes into the run metadata, where callbacks and tracing
+    (and the mock model) can tell planner and repair calls apart without
+    reading the prompt.
+    """
+    return {"metadata": {LLM_STAGE_KEY: stage}}
+
+
+def _rules(intent: Dict[str, Any]) -> List[str]:
+    """The DATA_RULES that apply to an intent, as prompt lines"""
+    rules = []
+    scenario = DATA_RULES["scenario_filters"].get(intent.get("scenario"))
+    if scenario:
+        rules.append(f"Scenario filter: {scenario['filter']} ({scenario['description']})")
+    negation = DATA_RULES["negation_rules"].get(intent.get("metric_type"))
+    if negation:
+        rules.append(f"Negation: {negation['description']}")
+    if intent.get("requires_currency_conversion"):
+        rules.extend(DATA_RULES["currency_rules"].values())
+    rules.extend(DATA_RULES["join_rules"])
+    return [f"- {rule}" for rule in rules]
+
+
+def _template_key(intent: Dict[str, Any]) -> Optional[str]:
+    metric_type = intent.get("metric_type")
+    if metric_type is None:
+        return None
+    if intent.get("aggregation_level") == "employee_level" and f"{metric_type}_per_employee" in METRIC_TEMPLATES:
+        return f"{metric_type}_per_employee"
+    return metric_type if metric_type in METRIC_TEMPLATES else None
+
+
+def build_planner_prompt(question: str, intent: Dict[str, Any], tables: List[str],
+                         pruned_schema: Dict[str, List[str]], examples: str = "",
+                         dialect: str = "SQL") -> str:
+    """
+    Prompt for the single SQL-writing LLM call of the planner mode
+    
+    Carries everything the table, schema and validation agents would have
+    worked out: the intent, the selected tables with their pruned columns,
+    the join paths between them and the business rules for the intent.
+    dialect names the execution backend's SQL flavour, e.g. "SQLite".
+    """
+    root = tables[0] if tables else None
+    joins = SCHEMA_INDEX.join_clauses(root, tables[1:]) if root else []
+    template_key = _template_key(intent)
+    template = ""
+    if template_key:
+        template = (
+            f"\nReference template for {template_key} "
+            f"({{scenario_filter}} and {{year}} are filled in per question):\n"
+            f"{textwrap.dedent(METRIC_TEMPLATES[template_key]).strip()}\n"
+        )
+    return PLANNER_PROMPT.format(
+        dialect=dialect,
+        question=question,
+        schema=render_schema(pruned_schema),
+        joins="\n".join([f"FROM {root} {SCHEMA_INDEX.alias(root)}"] + joins) if root else "(no tables)",
+        rules="\n".join(_rules(intent)),
+        template=template,
+        examples=f"\n{examples}\n" if examples else "",
+        intent=json.dumps(intent),
+        tables=json.dumps(tables)
+    )
+
+
+def parse_planner_response(text: str) -> Dict[str, Any]:
+    """Read the SQL generation result out of the planner's reply, see SQLOutput.parse"""
+    return SQLOutput.parse(text, source="Planner reply").to_dict()
@@ -0,0 +1,253 @@
+"""
+Bounded repair loop for generated SQL that fails validation
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from schema_index import SCHEMA_INDEX
+from schema_pruner import render_schema
+from sql_parser import TOKEN_PATTERN, parse_sql
+from statements import CompiledStatement, parameterize_filter, scenario_filter_sql, to_qmark
+
+REPAIR_STAGE = "repair"
+
+MISSING_TABLE_PATTERN = re.compile(r"Expected table '(\w+)' not found in query")
+MISSING_WHERE_ISSUE = "Missing WHERE clause for scenario filter"
+PERIOD_MAPPING_ISSUE = "Incorrect period mapping"
+
+# Top-level keywords after the FROM list, in clause order
+FROM_END_KEYWORDS = ("where", "group", "having", "order", "limit", "union", "except", "intersect")
+
+REPAIR_PROMPT = """A generated {dialect} query failed validation. Rewrite it so every issue is fixed.
+
+Question: {question}
+
+Query:
+{sql}
+
+Parameters: {parameters}
+
+Issues:
+{issues}
+
+Schema (only these tables and columns may be used):
+{schema}
+
+Join paths:
+{joins}
+
+Respond with a single JSON object and nothing else, with the keys:
+- "sql": the corrected query, using ? placeholders for literal values
+- "parameters": the values for the placeholders, in order
+- "notes": what was changed
+
+Intent: {intent}
+Tables: {tables}
+"""
+
+
+def _top_level_positions(sql: str) -> Dict[str, int]:
+    """
+    Offsets of the outermost query's clause keywords
+    
+    Only keywords at parenthesis depth 0 after the last top-level FROM count,
+    so subqueries and CTE bodies are skipped.
+    """
+    depth = 0
+    positions = {}
+    for match in TOKEN_PATTERN.finditer(sql):
+        value = match.group().lower()
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and match.lastgroup == "ident":
+            if value == "from":
+                positions = {"from": match.start()}
+            elif value in FROM_END_KEYWORDS and "from" in positions:
+                positions.setdefault(value, match.start())
+    return positions
+
+
+def _insert(sql: str, parameters: List[Any], offset: int, text: str,
+            values: List[Any] = ()) -> Tuple[str, List[Any]]:
+    """Insert SQL text (with its own ? values) at offset, keeping parameters in order"""
+    before = sum(
+        1 for match in TOKEN_PATTERN.finditer(sql[:offset])
+        if match.lastgroup == "param" and match.group() == "?"
+    )
+    parameters = list(parameters or [])
+    # Match the indentation of the clause the text goes in front of
+    line = sql[sql.rfind("\n", 0, offset) + 1:offset]
+    indent = line if not line.strip() else ""
+    text = "\n".join(indent + part for part in text.split("\n"))
+    rest = sql[offset:].lstrip()
+    sql = f"{sql[:offset].rstrip()}\n{text}" + (f"\n{indent}{rest}" if rest else "")
+    return sql, parameters[:before] + list(values) + parameters[before:]
+
+
+def _from_end(sql: str) -> Optional[int]:
+    """Offset where the outermost FROM list ends (its first following clause, or the end)"""
+    positions = _top_level_positions(sql)
+    if "from" not in positions:
+        return None
+    following = [offset for keyword, offset in positions.items() if keyword != "from"]
+    return min(following) if following else len(sql)
+
+
+def add_missing_joins(sql: str, parameters: List[Any], missing: List[str]) -> Optional[Tuple[str, List[Any]]]:
+    """
+    Join each missing table along its shortest schema join path
+    
+    The path starts from whichever table already in the query is closest;
+    intermediate tables are joined too. Returns None when nothing could be
+    joined.
+    """
+    query = parse_sql(sql)
+    offset = _from_end(sql)
+    if query.errors or offset is None or not query.tables:
+        return None
+    
+    aliases = {}
+    for ref in query.tables:
+        aliases.setdefault(ref.name, ref.alias or ref.name)
+    used = set(query.aliases)
+    
+    clauses = []
+    for target in missing:
+        if target in aliases:
+            continue
+        paths = [SCHEMA_INDEX.join_path(source, target) for source in list(aliases)]
+        paths = [path for path in paths if path]
+        if not paths:
+            continue
+        path = min(paths, key=len)
+        for left, right in zip(path, path[1:]):
+            if right in aliases:
+                continue
+            alias = SCHEMA_INDEX.alias(right)
+            if alias in used:
+                alias = right
+            left_column, right_column = SCHEMA_INDEX.edges[left][right]
+            clauses.append(f"JOIN {right} {alias} ON {aliases[left]}.{left_column} = {alias}.{right_column}")
+            aliases[right] = alias
+            used.add(alias)
+    
+    if not clauses:
+        return None
+    return _insert(sql, parameters, offset, "\n".join(clauses))
+
+
+def add_scenario_filter(sql: str, parameters: List[Any], scenario: Optional[str]) -> Optional[Tuple[str, List[Any]]]:
+    """Add the scenario's DATA_RULES filter as the WHERE clause of a query without one"""
+    query = parse_sql(sql)
+    positions = _top_level_positions(sql)
+    if query.errors or not query.tables or "from" not in positions or "where" in positions:
+        return None
+    main = query.tables[0]
+    filter_sql, constants = parameterize_filter(scenario_filter_sql(scenario), main.alias or main.name, main.name)
+    filter_sql, values = _bind_named(filter_sql, constants)
+    return _insert(sql, parameters, _from_end(sql), f"WHERE {filter_sql}", values)
+
+
+def _bind_named(sql: str, constants: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    qmark_sql, names = to_qmark(sql)
+    return qmark_sql, CompiledStatement(qmark_sql, names, tuple(constants.items())).bind()
+
+
+def _deterministic(issue: str) -> bool:
+    return bool(MISSING_TABLE_PATTERN.match(issue)) or issue == MISSING_WHERE_ISSUE or \
+        issue.startswith(PERIOD_MAPPING_ISSUE)
+
+
+def deterministic_repair(sql_output: Dict[str, Any], issues: List[str],
+                         intent: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Fix the issues that need no LLM, returning the repaired output or None
+    
+    Handles tables the query should reference but doesn't (and a missing
+    period join) by joining them along the schema join paths, and a missing
+    WHERE clause by adding the intent's scenario filter. Returns None when
+    any issue is of another kind, so the LLM sees the query as generated.
+    """
+    sql, parameters = sql_output.get("sql"), list(sql_output.get("parameters") or [])
+    if not sql or not all(_deterministic(issue) for issue in issues):
+        return None
+    fixes = []
+    
+    missing = [match.group(1) for match in map(MISSING_TABLE_PATTERN.match, issues) if match]
+    if any(issue.startswith(PERIOD_MAPPING_ISSUE) for issue in issues) and \
+            "m_accounting_period" not in {ref.name for ref in parse_sql(sql).tables}:
+        missing.append("m_accounting_period")
+    if missing:
+        joined = add_missing_joins(sql, parameters, list(dict.fromkeys(missing)))
+        if joined is not None:
+            sql, parameters = joined
+            fixes.append(f"joined {', '.join(dict.fromkeys(missing))} along the schema join paths")
+    
+    if MISSING_WHERE_ISSUE in issues:
+        filtered = add_scenario_filter(sql, parameters, (intent or {}).get("scenario"))
+        if filtered is not None:
+            sql, parameters = filtered
+            fixes.append("added the scenario filter")
+    
+    if not fixes:
+        return None
+    repaired = dict(sql_output, sql=sql, parameters=parameters)
+    repaired["notes"] = f"{sql_output.get('notes', '')}; repaired: {', '.join(fixes)}".lstrip("; ")
+    return repaired
+
+
+def build_repair_prompt(question: str, sql_output: Dict[str, Any], issues: List[str],
+                        intent: Dict[str, Any], tables: List[str], pruned_schema: Dict[str, List[str]],
+                        dialect: str = "SQL") -> str:
+    """Prompt asking the LLM to fix a query given validate_sql's issues"""
+    root = tables[0] if tables else None
+    joins = SCHEMA_INDEX.join_clauses(root, tables[1:]) if root else []
+    return REPAIR_PROMPT.format(
+        dialect=dialect,
+        question=question,
+        sql=sql_output.get("sql"),
+        parameters=json.dumps(sql_output.get("parameters") or []),
+        issues="\n".join(f"- {issue}" for issue in issues),
+        schema=render_schema(pruned_schema),
+        joins="\n".join([f"FROM {root} {SCHEMA_INDEX.alias(root)}"] + joins) if root else "(no tables)",
+        intent=json.dumps(intent),
+        tables=json.dumps(tables)
+    )
+
+
+def repair_loop(sql_output: Dict[str, Any], validation: Dict[str, Any],
+                validate: Callable[[Dict[str, Any]], Dict[str, Any]],
+                intent: Optional[Dict[str, Any]] = None,
+                llm_repair: Optional[Callable[[Dict[str, Any], List[str]], Dict[str, Any]]] = None,
+                max_repairs: int = 2) -> Tuple[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Feed validation issues back into repairs until the SQL is valid
+    
+    Each attempt tries deterministic_repair first and only calls llm_repair
+    (when given) if no deterministic fix applies. At most max_repairs
+    attempts are made.
+    
+    Returns:
+        The final SQL output, its validation and one log entry per attempt
+        with kind ("deterministic" or "llm"), the issues it addressed and
+        whether the result was valid
+    """
+    log = []
+    while not validation.get("is_valid") and len(log) < max_repairs:
+        issues = list(validation.get("issues") or [])
+        repaired = deterministic_repair(sql_output, issues, intent)
+        kind = "deterministic"
+        if repaired is None:
+            if llm_repair is None:
+                break
+            repaired = llm_repair(sql_output, issues)
+            kind = "llm"
+        if not repaired or not repaired.get("sql"):
+            log.append({"kind": kind, "issues": issues, "is_valid": False})
+            break
+        sql_output = repaired
+        validation = validate(sql_output)
+        log.append({"kind": kind, "issues": issues, "is_valid": bool(validation.get("is_valid"))})
+    return sql_output, validation, log
@@ -111,6 +111,27 @@ SAMPLE_SCHEMA = {
     }
 }
 
+# Joins that cannot be inferred from shared *_id key columns
+# (table, column, referenced_table, referenced_column)
+EXTRA_JOINS = [
+    ("a_personnel_details", "accounting_period", "m_accounting_period", "name"),
+    ("a_personnel_headcount", "accounting_period", "m_accounting_period", "name"),
+    ("a_personnel_summary", "accounting_period", "m_accounting_period", "name"),
+    ("a_personnel_details", "category", "master_rollup_mapping_details", "category")
+]
+
+# Conventional table aliases used in generated SQL
+TABLE_ALIASES = {
+    "a_personnel_details": "pd",
+    "a_personnel_headcount": "ph",
+    "a_personnel_summary": "ps",
+    "m_department": "d",
+    "m_location": "l",
+    "m_accounting_period": "ap",
+    "master_rollup_mapping_details": "mrm",
+    "currency_master": "cm"
+}
+
 # Sample data dictionary rules
 DATA_RULES = {
     "negation_rules": {
@@ -153,6 +174,33 @@ DATA_RULES = {
     ]
 }
 
+# Intent synonym table used by classify_intent.
+# Each field lists (value, phrases) rules in priority order; the first rule
+# with a matching phrase wins. A tuple of phrases only matches when every
+# phrase in it appears in the question.
+INTENT_RULES = {
+    "metric_type": [
+        ("fully_loaded_cost", ["fully loaded cost", "total cost"]),
+        ("benefits_ratio", [("benefits", "ratio")]),
+        ("headcount_movement", ["headcount", "movement"]),
+        ("salary", ["salary"])
+    ],
+    "scenario": [
+        ("current_year_totals", ["current year", "to date"]),
+        ("budget_vs_actual", ["budget"]),
+        ("current_year_totals", ["forecast"])
+    ],
+    "aggregation_level": [
+        ("employee_level", ["per employee", "by employee"]),
+        ("department", ["department"]),
+        ("location", ["location"])
+    ],
+    "target_currency": [
+        ("INR", ["inr", "rupees"]),
+        ("USD", ["usd", "dollars"])
+    ]
+}
+
 # Sample metric templates
 METRIC_TEMPLATES = {
     "fully_loaded_cost_per_employee": """
@@ -0,0 +1,119 @@
+"""
+DAG scheduler running independent pipeline stages concurrently
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One node of the stage graph
+    
+    Attributes:
+        name: Key of the stage's result
+        func: Called with the results of deps as keyword arguments
+        deps: Names of stages or races whose results func needs; race
+            candidates themselves cannot be dependencies
+        accept: For race candidates, whether a result may win the race
+    """
+    name: str
+    func: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    accept: Optional[Callable[[Any], bool]] = None
+
+
+class StageScheduler:
+    """
+    Runs a graph of stages on a thread pool, each as soon as its inputs exist
+    
+    Races let several candidate stages compute the same result speculatively:
+    the first candidate to finish with an accepted result wins and the race
+    resolves without waiting for the others, which keep running in the
+    background and are ignored. When no candidate is accepted, the first
+    candidate in race order that returned a result (not None) wins.
+    
+    Args:
+        executor: Thread pool to run stages on
+        wrap: Called as wrap(name, func) to decorate every stage function,
+            e.g. for tracing on the worker thread
+    """
+    
+    def __init__(self, executor: ThreadPoolExecutor, wrap: Callable[[str, Callable], Callable] = None):
+        self.executor = executor
+        self.wrap = wrap
+    
+    def run(self, stages: Sequence[Stage], races: Dict[str, Sequence[str]] = None,
+            timeout: float = None) -> Dict[str, Any]:
+        """
+        Run the stages and return every result by name
+        
+        Race names map to the winning candidate's result, and "<race>.winner"
+        to the winning candidate's name. Stages that fail (other than race
+        candidates) re-raise their exception here.
+        """
+        races = {name: tuple(candidates) for name, candidates in (races or {}).items()}
+        candidate_of = {candidate: race for race, candidates in races.items() for candidate in candidates}
+        by_name = {stage.name: stage for stage in stages}
+        unknown = [dep for stage in stages for dep in stage.deps if dep not in by_name and dep not in races]
+        if unknown:
+            raise ValueError(f"Unknown stage dependencies: {', '.join(sorted(set(unknown)))}")
+        
+        results = {}
+        finished = {}
+        futures = {}
+        started = set()
+        
+        def submit_ready():
+            for stage in stages:
+                if stage.name in started or not all(dep in results for dep in stage.deps):
+                    continue
+                func = self.wrap(stage.name, stage.func) if self.wrap else stage.func
+                inputs = {dep: results[dep] for dep in stage.deps}
+                futures[self.executor.submit(func, **inputs)] = stage
+                started.add(stage.name)
+        
+        def resolve(race: str, candidate: Optional[str]):
+            results[race] = finished.get(candidate)
+            results[f"{race}.winner"] = candidate
+        
+        def required_done() -> bool:
+            return all(
+                race in results for race in races
+            ) and all(
+                stage.name in results for stage in stages if stage.name not in candidate_of
+            )
+        
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        submit_ready()
+        while not required_done():
+            if not futures:
+                raise RuntimeError("Stage graph cannot make progress, check for cycles")
+            remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            done, _ = wait(list(futures), timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"Stage graph did not finish within {timeout}s")
+            
+            for future in done:
+                stage = futures.pop(future)
+                race = candidate_of.get(stage.name)
+                error = future.exception()
+                if race is None:
+                    if error is not None:
+                        raise error
+                    results[stage.name] = future.result()
+                    continue
+                
+                finished[stage.name] = None if error is not None else future.result()
+                if race in results:
+                    continue
+                if error is None and stage.accept is not None and stage.accept(finished[stage.name]):
+                    resolve(race, stage.name)
+                elif all(candidate in finished for candidate in races[race]):
+                    fallback = next((c for c in races[race] if finished[c] is not None), None)
+                    resolve(race, fallback)
+            submit_ready()
+        
+        return results
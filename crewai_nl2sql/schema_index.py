@@ -0,0 +1,104 @@
+"""
+Schema index with a precomputed join graph
+"""
+from collections import deque
+from typing import Dict, List, Any, Tuple
+from sample_schema import SAMPLE_SCHEMA, EXTRA_JOINS, TABLE_ALIASES
+
+
+class SchemaIndex:
+    """
+    Join graph over the schema with all shortest join paths precomputed
+    
+    Edges come from *_id columns that are another table's primary key, plus
+    the declared EXTRA_JOINS. Everything is computed once at construction so
+    table selection and join generation are dictionary lookups.
+    """
+    
+    def __init__(self, schema: Dict[str, Any], extra_joins=(), aliases: Dict[str, str] = None):
+        self.schema = schema
+        self.aliases = dict(aliases or {})
+        self.edges = {table: {} for table in schema}
+        
+        primary_keys = {}
+        for table, info in schema.items():
+            for column, column_type in info["columns"].items():
+                if column.endswith("_id") and "PRIMARY KEY" in column_type.upper():
+                    primary_keys.setdefault(column, []).append(table)
+                    
+        for table, info in schema.items():
+            for column, column_type in info["columns"].items():
+                if "PRIMARY KEY" in column_type.upper():
+                    continue
+                for referenced in primary_keys.get(column, []):
+                    self._add_edge(table, column, referenced, column)
+                    
+        for table, column, referenced, referenced_column in extra_joins:
+            self._add_edge(table, column, referenced, referenced_column)
+            
+        self.paths = {table: self._shortest_paths_from(table) for table in schema}
+        
+    def _add_edge(self, table: str, column: str, referenced: str, referenced_column: str):
+        self.edges[table][referenced] = (column, referenced_column)
+        self.edges[referenced][table] = (referenced_column, column)
+        
+    def _shortest_paths_from(self, source: str) -> Dict[str, List[str]]:
+        paths = {source: [source]}
+        queue = deque([source])
+        while queue:
+            table = queue.popleft()
+            for neighbour in sorted(self.edges[table]):
+                if neighbour not in paths:
+                    paths[neighbour] = paths[table] + [neighbour]
+                    queue.append(neighbour)
+        return paths
+    
+    def alias(self, table: str) -> str:
+        """Alias used for a table in generated SQL"""
+        return self.aliases.get(table) or "".join(part[0] for part in table.split("_"))
+    
+    def join_path(self, source: str, target: str) -> List[str]:
+        """Shortest list of tables joining source to target, or [] if unreachable"""
+        return self.paths.get(source, {}).get(target, [])
+    
+    def join_tree(self, root: str, tables: List[str]) -> List[Tuple[str, str, str, str]]:
+        """
+        Joins connecting root to every table in tables
+        
+        Returns:
+            (table, column, joined_table, joined_column) tuples ordered so that
+            each one references a table already joined earlier
+        """
+        joined = {root}
+        joins = []
+        for target in sorted(tables):
+            path = self.join_path(root, target)
+            for left, right in zip(path, path[1:]):
+                if right in joined:
+                    continue
+                left_column, right_column = self.edges[left][right]
+                joins.append((left, left_column, right, right_column))
+                joined.add(right)
+        return joins
+    
+    def connected_tables(self, tables: List[str]) -> List[str]:
+        """Add any intermediate tables needed to join the given tables together"""
+        if not tables:
+            return []
+        connected = list(tables)
+        for _, _, right, _ in self.join_tree(tables[0], tables):
+            if right not in connected:
+                connected.append(right)
+        return connected
+    
+    def join_clauses(self, root: str, tables: List[str]) -> List[str]:
+        """SQL JOIN clauses connecting root to every table in tables"""
+        return [
+            f"JOIN {right} {self.alias(right)} "
+            f"ON {self.alias(left)}.{left_column} = {self.alias(right)}.{right_column}"
+            for left, left_column, right, right_column in self.join_tree(root, tables)
+        ]
+
+
+# Built once at import so lookups never touch the raw schema again
+SCHEMA_INDEX = SchemaIndex(SAMPLE_SCHEMA, EXTRA_JOINS, TABLE_ALIASES)
@@ -0,0 +1,190 @@
+"""
+Intent-aware, token-budgeted schema pruning
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, Any
+from sample_schema import SAMPLE_SCHEMA, DATA_RULES
+from schema_index import SCHEMA_INDEX
+
+
+# Columns kept for each table when no intent is available
+DEFAULT_COLUMNS = {
+    "a_personnel_details": [
+        "employee_id", "department_id", "location_id", 
+        "accounting_period", "amount", "currency_id",
+        "category", "category_rollup", "closed",
+        "plan_version_name", "fiscal_year"
+    ],
+    "a_personnel_headcount": [
+        "employee_id", "department_id", "location_id",
+        "accounting_period", "headcount", "movement_type",
+        "fiscal_year"
+    ],
+    "a_personnel_summary": [
+        "department_id", "location_id", "accounting_period",
+        "total_amount", "currency_id", "category_rollup",
+        "plan_version_name", "headcount", "fiscal_year"
+    ],
+    "m_department": ["department_id", "department_name"],
+    "m_location": ["location_id", "location_name", "country"],
+    "m_accounting_period": [
+        "period_id", "name", "fiscal_year", 
+        "fiscal_quarter", "fiscal_month"
+    ],
+    "master_rollup_mapping_details": [
+        "category", "category_rollup", "rollup_level_1",
+        "is_compensation", "requires_negation"
+    ],
+    "currency_master": [
+        "currency_id", "conversion_rate_to_usd"
+    ]
+}
+
+# Columns each part of the intent needs
+METRIC_COLUMNS = {
+    "fully_loaded_cost": ["amount", "category", "employee_id", "is_compensation", "requires_negation"],
+    "benefits_ratio": ["amount", "category", "category_rollup", "is_compensation"],
+    "salary": ["amount", "category"],
+    "headcount_movement": ["employee_id", "headcount", "movement_type"]
+}
+AGGREGATION_COLUMNS = {
+    "employee_level": ["employee_id", "department_name", "location_name"],
+    "department": ["department_name"],
+    "location": ["location_name"],
+    "company": []
+}
+TIME_COLUMNS = ["fiscal_year", "fiscal_quarter", "fiscal_month"]
+CURRENCY_COLUMNS = ["currency_id", "conversion_rate_to_usd"]
+
+# Relevance scores; join keys are never dropped
+REQUIRED = 3
+RELEVANT = 2
+DEFAULT = 1
+IRRELEVANT = 0
+
+# Fits the REQUIRED and RELEVANT columns of every metric intent, leaving
+# little room for DEFAULT ones
+DEFAULT_TOKEN_BUDGET = 150
+
+
+@lru_cache(maxsize=1)
+def _get_encoder():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4")
+    except Exception:
+        # tiktoken missing or its encoding files unavailable offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count prompt tokens with tiktoken, or estimate at ~4 characters per token"""
+    encoder = _get_encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text))
+
+
+def render_schema(pruned_schema: Dict[str, List[str]]) -> str:
+    """Render a table -> columns mapping the way it appears in prompts"""
+    lines = []
+    for table, columns in pruned_schema.items():
+        types = SAMPLE_SCHEMA[table]["columns"]
+        lines.append(f"{table}({', '.join(f'{column} {types[column]}' for column in columns)})")
+    return "\n".join(lines)
+
+
+def score_columns(intent: Dict[str, Any], tables: List[str]) -> Dict[str, Dict[str, int]]:
+    """Score every column of the selected tables by relevance to the intent"""
+    join_columns = set()
+    root = tables[0] if tables else None
+    for left, left_column, right, right_column in SCHEMA_INDEX.join_tree(root, tables):
+        join_columns.add((left, left_column))
+        join_columns.add((right, right_column))
+        
+    relevant = set(METRIC_COLUMNS.get(intent.get("metric_type"), []))
+    relevant.update(AGGREGATION_COLUMNS.get(intent.get("aggregation_level"), []))
+    scenario_filter = DATA_RULES["scenario_filters"].get(
+        intent.get("scenario"),
+        DATA_RULES["scenario_filters"]["historical_actuals_only"]
+    )["filter"]
+    relevant.update(re.findall(r"[a-z_]+", scenario_filter))
+    if intent.get("time_window"):
+        relevant.update(TIME_COLUMNS)
+    if intent.get("requires_currency_conversion"):
+        relevant.update(CURRENCY_COLUMNS)
+        
+    scores = {}
+    for table in tables:
+        scores[table] = {}
+        for column in SAMPLE_SCHEMA.get(table, {}).get("columns", {}):
+            if (table, column) in join_columns:
+                scores[table][column] = REQUIRED
+            elif column in relevant:
+                scores[table][column] = RELEVANT
+            elif column in DEFAULT_COLUMNS.get(table, []):
+                scores[table][column] = DEFAULT
+            else:
+                scores[table][column] = IRRELEVANT
+    return scores
+
+
+def prune_schema(intent: Dict[str, Any], tables: List[str],
+                 token_budget: int = DEFAULT_TOKEN_BUDGET) -> Dict[str, Any]:
+    """
+    Prune the selected tables to the columns the intent needs within a token budget
+    
+    The schema starts from the REQUIRED and RELEVANT columns. DEFAULT columns
+    are then added, in schema order, only while the rendered schema stays
+    within the budget; with no budget they are all added. If the starting
+    columns are already over budget, RELEVANT columns are dropped one at a
+    time, but join keys are always kept, so the result can exceed a very
+    small budget.
+    
+    Returns:
+        Dict with the pruned schema and token counts before and after pruning
+    """
+    tables = [table for table in tables if table in SAMPLE_SCHEMA]
+    scores = score_columns(intent, tables)
+    full_schema = {table: list(SAMPLE_SCHEMA[table]["columns"]) for table in tables}
+    
+    def keep(minimum):
+        return {
+            table: [column for column in columns if scores[table][column] >= minimum]
+            for table, columns in full_schema.items()
+        }
+        
+    if token_budget is None:
+        pruned = keep(DEFAULT)
+        tokens = count_tokens(render_schema(pruned))
+    else:
+        pruned = keep(RELEVANT)
+        tokens = count_tokens(render_schema(pruned))
+        if tokens > token_budget:
+            candidates = [
+                (table, column) for table, columns in pruned.items()
+                for column in reversed(columns) if scores[table][column] < REQUIRED
+            ]
+            for table, column in candidates:
+                pruned[table].remove(column)
+                tokens = count_tokens(render_schema(pruned))
+                if tokens <= token_budget:
+                    break
+        else:
+            for table, columns in full_schema.items():
+                for column in columns:
+                    if scores[table][column] != DEFAULT:
+                        continue
+                    candidate = dict(pruned)
+                    candidate[table] = [c for c in columns if c in pruned[table] or c == column]
+                    candidate_tokens = count_tokens(render_schema(candidate))
+                    if candidate_tokens <= token_budget:
+                        pruned, tokens = candidate, candidate_tokens
+                        
+    return {
+        "schema": pruned,
+        "tokens_before": count_tokens(render_schema(full_schema)),
+        "tokens_after": tokens,
+        "token_budget": token_budget
+    }
@@ -0,0 +1,396 @@
+"""
+Lightweight SQL parser for validating generated queries
+"""
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*|"[^"]+"|`[^`]+`)
+  | (?P<param>\?|:\w+)
+  | (?P<op><=|>=|<>|!=|\|\||[=<>+\-*/%,.();{}])
+  | (?P<unknown>.)
+""", re.VERBOSE | re.DOTALL)
+
+KEYWORDS = {
+    "select", "from", "where", "join", "left", "right", "inner", "outer", "full",
+    "cross", "natural", "on", "using", "and", "or", "not", "in", "is", "null",
+    "as", "group", "by", "order", "having", "limit", "offset", "union", "all",
+    "distinct", "case", "when", "then", "else", "end", "between", "like", "exists",
+    "asc", "desc", "with", "cast", "true", "false", "current_date",
+    "current_timestamp", "current_time", "interval", "over", "partition", "rows",
+    "range", "filter", "escape", "glob", "except", "intersect", "values"
+}
+
+# Keywords that end a FROM clause's table list
+CLAUSE_KEYWORDS = {"where", "group", "having", "order", "limit", "union", "except", "intersect", "on", "using"}
+JOIN_MODIFIERS = {"left", "right", "inner", "outer", "full", "cross", "natural"}
+
+
+@dataclass(frozen=True)
+class Token:
+    kind: str
+    value: str
+    
+    @property
+    def lower(self) -> str:
+        return self.value.lower()
+    
+    def is_keyword(self, *words: str) -> bool:
+        return self.kind == "ident" and self.lower in (words or KEYWORDS)
+    
+    
+@dataclass(frozen=True)
+class TableRef:
+    name: str
+    alias: Optional[str] = None
+    
+    
+@dataclass(frozen=True)
+class ColumnRef:
+    qualifier: Optional[str]
+    column: str
+    
+    def __str__(self):
+        return f"{self.qualifier}.{self.column}" if self.qualifier else self.column
+    
+    
+@dataclass
+class ParsedQuery:
+    """
+    Structure of a SQL statement, built in one pass over its tokens
+    
+    Identifiers are lowercased. Tables and column references are collected
+    from every nesting level; where_terms are the top-level AND terms of the
+    outermost WHERE clause and scope_where_terms those of every WHERE clause
+    (one list per SELECT scope, CTEs and subqueries included, in order).
+    JOIN ... USING (column) counts as a join predicate on column. Characters
+    no SQL token starts with are kept in unknown_tokens rather than failing
+    the parse.
+    """
+    tables: List[TableRef] = field(default_factory=list)
+    aliases: Dict[str, str] = field(default_factory=dict)
+    derived_tables: Set[str] = field(default_factory=set)
+    columns: List[ColumnRef] = field(default_factory=list)
+    output_aliases: Set[str] = field(default_factory=set)
+    join_predicates: List[Tuple[ColumnRef, ColumnRef]] = field(default_factory=list)
+    where_terms: List[str] = field(default_factory=list)
+    scope_where_terms: List[List[str]] = field(default_factory=list)
+    unknown_tokens: List[str] = field(default_factory=list)
+    functions: Set[str] = field(default_factory=set)
+    casts: List[Tuple[List[ColumnRef], str]] = field(default_factory=list)
+    has_case: bool = False
+    errors: List[str] = field(default_factory=list)
+    
+    def resolve(self, qualifier: Optional[str]) -> Optional[str]:
+        """Table name for an alias or table name, None if unknown"""
+        if qualifier is None:
+            return None
+        return self.aliases.get(qualifier)
+    
+    def joins(self, table: str, column: str) -> List[ColumnRef]:
+        """Columns that table.column is equated with in join predicates"""
+        matches = []
+        for left, right in self.join_predicates:
+            if self.resolve(left.qualifier) == table and left.column == column:
+                matches.append(right)
+            elif self.resolve(right.qualifier) == table and right.column == column:
+                matches.append(left)
+        return matches
+    
+    
+def tokenize(sql: str) -> List[Token]:
+    """Split SQL into tokens, dropping whitespace and comments"""
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = TOKEN_PATTERN.match(sql, position)
+        if match is None:
+            raise ValueError(f"Unexpected character {sql[position]!r} at position {position}")
+        kind = match.lastgroup
+        if kind not in ("space", "comment"):
+            value = match.group()
+            if kind == "ident" and value[0] in "\"`":
+                value = value[1:-1]
+            tokens.append(Token(kind, value))
+        position = match.end()
+    return tokens
+
+
+def _render(values: List[str]) -> str:
+    """Join token values back into readable SQL"""
+    text = ""
+    for value in values:
+        if text and not (value in (".", ",", ")") or text.endswith((".", "("))):
+            text += " "
+        text += value
+    return text
+
+
+def _matching_paren(tokens: List[Token], start: int) -> int:
+    depth = 0
+    for index in range(start, len(tokens)):
+        if tokens[index].value == "(":
+            depth += 1
+        elif tokens[index].value == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    raise ValueError("Unbalanced parentheses")
+
+
+class _Parser:
+    """Single pass over the token list that fills a ParsedQuery"""
+    
+    def __init__(self, tokens: List[Token]):
+        self.tokens = tokens
+        self.query = ParsedQuery()
+        # Token positions already consumed as table names, aliases or cast types
+        self.claimed = set()
+        
+    def token(self, index: int) -> Optional[Token]:
+        return self.tokens[index] if 0 <= index < len(self.tokens) else None
+    
+    def parse(self) -> ParsedQuery:
+        if not any(token.is_keyword("select") for token in self.tokens):
+            raise ValueError("No SELECT statement found")
+        _matching_paren([Token("op", "(")] + self.tokens + [Token("op", ")")], 0)
+        
+        self.query.unknown_tokens = [token.value for token in self.tokens if token.kind == "unknown"]
+        self._table_refs()
+        self._expressions()
+        self._where_terms()
+        return self.query
+    
+    def _add_table(self, name: str, alias: Optional[str]):
+        name = name.lower()
+        alias = alias.lower() if alias else None
+        self.query.tables.append(TableRef(name, alias))
+        self.query.aliases[name] = name
+        if alias:
+            self.query.aliases[alias] = name
+            
+    def _alias_at(self, index: int) -> Tuple[Optional[str], int]:
+        """Read an optional [AS] alias at index, returning it and the next index"""
+        token = self.token(index)
+        if token is not None and token.is_keyword("as"):
+            self.claimed.add(index)
+            index += 1
+            token = self.token(index)
+        if token is not None and token.kind == "ident" and not token.is_keyword():
+            self.claimed.add(index)
+            return token.value, index + 1
+        return None, index
+    
+    def _table_refs(self):
+        tokens = self.tokens
+        # CTE names behave like tables whose columns are unknown
+        for index, token in enumerate(tokens):
+            if token.kind == "ident" and not token.is_keyword():
+                following = self.token(index + 1)
+                after = self.token(index + 2)
+                previous = self.token(index - 1)
+                if (following is not None and following.is_keyword("as") and after is not None
+                        and after.value == "(" and previous is not None
+                        and (previous.is_keyword("with") or previous.value == ",")):
+                    self.query.derived_tables.add(token.lower)
+                    self.query.aliases[token.lower] = token.lower
+                    self.claimed.add(index)
+                    
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            if not token.is_keyword("from", "join"):
+                index += 1
+                continue
+                
+            index += 1
+            while index < len(tokens):
+                current = tokens[index]
+                if current.value == "(":
+                    # Derived table: its alias follows the closing parenthesis
+                    close = _matching_paren(tokens, index)
+                    alias, _ = self._alias_at(close + 1)
+                    if alias:
+                        self.query.derived_tables.add(alias.lower())
+                        self.query.aliases[alias.lower()] = alias.lower()
+                    break
+                if current.kind != "ident" or current.is_keyword():
+                    break
+                    
+                name = current.value
+                self.claimed.add(index)
+                # schema.table
+                if self.token(index + 1) is not None and self.token(index + 1).value == "." \
+                        and self.token(index + 2) is not None:
+                    index += 2
+                    name = tokens[index].value
+                    self.claimed.add(index)
+                alias, index = self._alias_at(index + 1)
+                self._add_table(name, alias)
+                if self.token(index) is not None and self.token(index).is_keyword("using"):
+                    self._using(index + 1)
+                
+                # Comma separated FROM lists continue with another table
+                if self.token(index) is not None and self.token(index).value == ",":
+                    index += 1
+                    continue
+                break
+                
+    def _using(self, open_index: int):
+        """Record JOIN ... USING (columns) as predicates between the joined table and the ones before it"""
+        if self.token(open_index) is None or self.token(open_index).value != "(":
+            return
+        joined = self.query.tables[-1]
+        columns = [
+            token.lower for token in self.tokens[open_index + 1:_matching_paren(self.tokens, open_index)]
+            if token.kind == "ident" and not token.is_keyword()
+        ]
+        for ref in self.query.tables[:-1]:
+            for column in columns:
+                self.query.join_predicates.append(
+                    (ColumnRef(ref.alias or ref.name, column), ColumnRef(joined.alias or joined.name, column))
+                )
+                
+    def _column_at(self, index: int) -> Tuple[Optional[ColumnRef], int]:
+        """Read a column reference at index, returning it and the next index"""
+        token = self.token(index)
+        if token is None or token.kind != "ident" or index in self.claimed or token.is_keyword():
+            return None, index + 1
+        following = self.token(index + 1)
+        if following is not None and following.value == "(":
+            return None, index + 1
+        if following is not None and following.value == ".":
+            column = self.token(index + 2)
+            if column is not None and (column.kind == "ident" or column.value == "*"):
+                if column.value == "*":
+                    return None, index + 3
+                return ColumnRef(token.lower, column.lower), index + 3
+            return None, index + 1
+        return ColumnRef(None, token.lower), index + 1
+    
+    def _expressions(self):
+        tokens = self.tokens
+        index = 0
+        previous_column = None
+        while index < len(tokens):
+            token = tokens[index]
+            previous = self.token(index - 1)
+            
+            if token.is_keyword("case"):
+                self.query.has_case = True
+            elif token.is_keyword("cast") and self.token(index + 1) is not None \
+                    and self.token(index + 1).value == "(":
+                self._cast(index + 1)
+            elif token.kind == "ident" and not token.is_keyword() and index not in self.claimed:
+                following = self.token(index + 1)
+                if following is not None and following.value == "(":
+                    self.query.functions.add(token.lower)
+                elif previous is not None and (
+                    previous.is_keyword("as")
+                    or previous.value == ")"
+                    or previous.is_keyword("end")
+                    or (previous.kind in ("ident", "number", "string") and not previous.is_keyword())
+                ) and not (previous.value == "." or (following is not None and following.value == ".")):
+                    # Output alias, with or without AS
+                    self.query.output_aliases.add(token.lower)
+                    self.claimed.add(index)
+                else:
+                    column, end = self._column_at(index)
+                    if column is not None:
+                        self.query.columns.append(column)
+                        # column = column is a join predicate
+                        if previous_column is not None and previous_column[1] == index - 1:
+                            self.query.join_predicates.append((previous_column[0], column))
+                        following = self.token(end)
+                        if following is not None and following.value == "=":
+                            previous_column = (column, end)
+                        else:
+                            previous_column = None
+                        index = end
+                        continue
+            index += 1
+            
+    def _cast(self, open_index: int):
+        close = _matching_paren(self.tokens, open_index)
+        as_index = None
+        depth = 0
+        for index in range(open_index + 1, close):
+            value = self.tokens[index].value
+            if value == "(":
+                depth += 1
+            elif value == ")":
+                depth -= 1
+            elif depth == 0 and self.tokens[index].is_keyword("as"):
+                as_index = index
+        if as_index is None:
+            return
+        columns = []
+        index = open_index + 1
+        while index < as_index:
+            column, index = self._column_at(index)
+            if column is not None:
+                columns.append(column)
+        target = " ".join(token.value for token in self.tokens[as_index + 1:close]).upper()
+        for index in range(as_index, close):
+            self.claimed.add(index)
+        self.query.casts.append((columns, target))
+        
+    def _where_terms(self):
+        depth = 0
+        for index, token in enumerate(self.tokens):
+            if token.value == "(":
+                depth += 1
+            elif token.value == ")":
+                depth -= 1
+            elif token.is_keyword("where"):
+                terms = self._where_clause(index + 1)
+                self.query.scope_where_terms.append(terms)
+                if depth == 0 and not self.query.where_terms:
+                    self.query.where_terms = terms
+                    
+    def _where_clause(self, start: int) -> List[str]:
+        """AND terms of the WHERE clause starting at start, up to the end of its scope"""
+        tokens = self.tokens
+        terms, current, depth, in_between = [], [], 0, False
+        for token in tokens[start:]:
+            if token.value == "(":
+                depth += 1
+            elif token.value == ")":
+                depth -= 1
+                if depth < 0:
+                    break
+            if depth == 0 and token.is_keyword("group", "order", "having", "limit", "union", "except", "intersect"):
+                break
+            if depth == 0 and token.is_keyword("between"):
+                in_between = True
+            elif depth == 0 and token.is_keyword("and"):
+                if in_between:
+                    in_between = False
+                else:
+                    terms.append(current)
+                    current = []
+                    continue
+            current.append(token.value)
+        terms.append(current)
+        return [_render(term) for term in terms if term]
+        
+        
+@lru_cache(maxsize=256)
+def parse_sql(sql: str) -> ParsedQuery:
+    """
+    Parse a SQL statement once
+    
+    Results are cached per statement text and shared by the validator, the
+    cost check and the index advisor, so treat them as read-only. Parse
+    failures are reported in errors rather than raised.
+    """
+    try:
+        return _Parser(tokenize(sql)).parse()
+    except ValueError as e:
+        return ParsedQuery(errors=[str(e)])
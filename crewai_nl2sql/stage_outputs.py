@@ -0,0 +1,358 @@
+"""
+Typed outputs of the pipeline stages
+"""
+import ast
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+SQL_START_PATTERN = re.compile(r"\b(SELECT|WITH)\b", re.IGNORECASE)
+VALUE_START_PATTERN = re.compile(r"[\{\[]")
+IS_VALID_PATTERN = re.compile(r"""["']?is_valid["']?\s*[:=]\s*(true|false)\b""", re.IGNORECASE)
+
+CLOSING = {"{": "}", "[": "]"}
+
+
+def _balanced(text: str, start: int) -> Optional[str]:
+    """The bracketed text opening at start, up to its matching close"""
+    stack = []
+    quote = None
+    escaped = False
+    for position in range(start, len(text)):
+        char = text[position]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in ("'", '"'):
+            quote = char
+        elif char in CLOSING:
+            stack.append(CLOSING[char])
+        elif stack and char == stack[-1]:
+            stack.pop()
+            if not stack:
+                return text[start:position + 1]
+    return None
+
+
+def find_value(text: str, kind: type, key: Optional[str] = None,
+               convert: Optional[Callable[[Any], Any]] = None) -> Any:
+    """
+    First JSON value of the given kind embedded in text
+    
+    Agents wrap their answers in prose and code fences, and tool results
+    reach them as Python reprs, so every {...} and [...] is tried from left
+    to right as JSON and then as a Python literal. With key, only dicts
+    holding that key count; with convert, only values it converts without
+    a ValueError, and the converted value is returned. Returns None when
+    nothing matches.
+    """
+    if not isinstance(text, str):
+        return None
+    decoder = json.JSONDecoder()
+    position = 0
+    while True:
+        match = VALUE_START_PATTERN.search(text, position)
+        if match is None:
+            return None
+        try:
+            value, end = decoder.raw_decode(text, match.start())
+        except (ValueError, RecursionError):
+            literal = _balanced(text, match.start())
+            try:
+                value = ast.literal_eval(literal) if literal else None
+            except (ValueError, SyntaxError, TypeError, RecursionError, MemoryError):
+                # Not a literal, or one that cannot be built, e.g. {{}} or {[1]: 2}
+                value = None
+            end = match.start() + len(literal) if value is not None else match.start() + 1
+        if isinstance(value, kind) and (key is None or value.get(key) is not None):
+            if convert is None:
+                return value
+            try:
+                return convert(value)
+            except ValueError:
+                pass
+        # Containers of the wrong kind may still hold the value, so look inside
+        position = match.start() + 1 if isinstance(value, (dict, list)) else end
+
+
+@dataclass
+class SQLOutput:
+    """
+    Result of the SQL generation stage
+    
+    Attributes:
+        sql: Query with ? placeholders, None when nothing was generated
+        parameters: Values bound to the placeholders, in order
+        decisions: How negation, scenario, currency and rollups were handled
+        notes: Reasoning for the reader
+        tables: Tables a materialized query reads instead of the selected ones
+        materialized: Aggregate a routed query is answered from
+    """
+    __slots__ = ("sql", "parameters", "decisions", "notes", "tables", "materialized")
+    sql: Optional[str]
+    parameters: List[Any]
+    decisions: Dict[str, Any]
+    notes: str
+    tables: Optional[List[str]]
+    materialized: Optional[str]
+    
+    @classmethod
+    def from_dict(cls, output: Dict[str, Any]) -> "SQLOutput":
+        """Build from a generate_sql style dict, raising ValueError on wrong types"""
+        sql = output.get("sql")
+        parameters = output.get("parameters") or []
+        decisions = output.get("decisions") or {}
+        tables = output.get("tables")
+        if sql is not None and not isinstance(sql, str):
+            raise ValueError("sql must be a string")
+        if not isinstance(parameters, list):
+            raise ValueError("parameters must be a list")
+        if not isinstance(decisions, dict):
+            raise ValueError("decisions must be an object")
+        if tables is not None and not (isinstance(tables, list) and all(isinstance(t, str) for t in tables)):
+            raise ValueError("tables must be a list of table names")
+        return cls(sql, parameters, decisions, str(output.get("notes") or ""), tables, output.get("materialized"))
+    
+    @classmethod
+    def parse(cls, text: str, source: str = "Reply") -> "SQLOutput":
+        """
+        Read the SQL generation result out of an LLM reply
+        
+        The first well-formed JSON object with a "sql" key wins; a reply
+        without one is taken as bare SQL from its first SELECT or WITH on.
+        """
+        output = find_value(text, dict, "sql", cls.from_dict)
+        if output is not None:
+            return output
+        
+        match = SQL_START_PATTERN.search(text) if isinstance(text, str) else None
+        if match is None:
+            return cls(None, [], {}, f"{source} contained no SQL", None, None)
+        sql = text[match.start():].split("```", 1)[0].strip().rstrip(";")
+        return cls(sql, [], {}, f"Parsed from a plain SQL {source.lower()}", None, None)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        output = {
+            "sql": self.sql,
+            "parameters": self.parameters,
+            "decisions": self.decisions,
+            "notes": self.notes
+        }
+        if self.tables is not None:
+            output["tables"] = self.tables
+        if self.materialized is not None:
+            output["materialized"] = self.materialized
+        return output
+
+
+@dataclass
+class ValidationOutput:
+    """
+    Result of the validation stage
+    
+    Attributes:
+        is_valid: Whether the SQL may be executed
+        issues: Problems that make it invalid
+        recommendations: Suggested fixes
+        warnings: Cost problems reported without failing validation
+        cost: The cost check report, when a cost checker ran
+    """
+    __slots__ = ("is_valid", "issues", "recommendations", "warnings", "cost")
+    is_valid: bool
+    issues: List[str]
+    recommendations: List[str]
+    warnings: Optional[List[str]]
+    cost: Optional[Dict[str, Any]]
+    
+    @classmethod
+    def from_dict(cls, validation: Dict[str, Any]) -> "ValidationOutput":
+        """Build from a validate_sql style dict, raising ValueError on wrong types"""
+        is_valid = validation.get("is_valid")
+        if not isinstance(is_valid, bool):
+            raise ValueError("is_valid must be a boolean")
+        issues = validation.get("issues") or []
+        recommendations = validation.get("recommendations") or []
+        if not isinstance(issues, list) or not isinstance(recommendations, list):
+            raise ValueError("issues and recommendations must be lists")
+        return cls(is_valid, [str(issue) for issue in issues], [str(r) for r in recommendations],
+                   validation.get("warnings"), validation.get("cost"))
+    
+    @classmethod
+    def parse(cls, text: str) -> Optional["ValidationOutput"]:
+        """
+        Read the validation result out of an agent's reply
+        
+        Falls back to a bare is_valid flag when the reply carries no whole
+        result; returns None when it has neither.
+        """
+        validation = find_value(text, dict, "is_valid", cls.from_dict)
+        if validation is not None:
+            return validation
+        match = IS_VALID_PATTERN.search(text) if isinstance(text, str) else None
+        if match is None:
+            return None
+        return cls(match.group(1).lower() == "true", [], [], None, None)
+    
+    @classmethod
+    def coerce(cls, validation: Any) -> Optional["ValidationOutput"]:
+        """Typed validation from a ValidationOutput, a dict or reply text; None if unreadable"""
+        if isinstance(validation, cls):
+            return validation
+        if isinstance(validation, dict):
+            try:
+                return cls.from_dict(validation)
+            except ValueError:
+                return None
+        if isinstance(validation, str):
+            return cls.parse(validation)
+        return None
+    
+    def to_dict(self) -> Dict[str, Any]:
+        validation = {
+            "is_valid": self.is_valid,
+            "issues": self.issues,
+            "recommendations": self.recommendations
+        }
+        if self.warnings is not None:
+            validation["warnings"] = self.warnings
+        if self.cost is not None:
+            validation["cost"] = self.cost
+        return validation
+
+
+@dataclass
+class StageOutputs:
+    """
+    Typed output of every pipeline stage, named like tracing.STAGES
+    
+    In-process stages fill the values directly. Crew stages fill them from
+    the models their tasks export (see task_models) and keep the agent's
+    text in raw; a stage whose answer could not be exported stays None
+    rather than failing the whole result.
+    """
+    __slots__ = ("intent", "tables", "schema", "sql_generation", "validation", "raw")
+    intent: Optional[Dict[str, Any]]
+    tables: Optional[List[str]]
+    schema: Optional[Dict[str, List[str]]]
+    sql_generation: Optional[SQLOutput]
+    validation: Optional[ValidationOutput]
+    raw: Dict[str, str]
+    
+    @classmethod
+    def from_crew(cls, exported: Dict[str, Any], raw: Dict[str, str]) -> "StageOutputs":
+        """
+        Typed outputs from the crew tasks' exported models, keyed by stage
+        
+        CrewAI leaves the agent's text in place of a model it could not
+        convert, so such a stage is read from its raw text instead, the way
+        the planner's reply is: SQLOutput.parse and ValidationOutput.parse
+        for the last two stages, the first JSON object the stage's model
+        accepts for the others. A stage that is still unreadable stays None.
+        """
+        models = task_models()
+        values = {stage: model.model_dump() for stage, model in exported.items()
+                  if stage in models and isinstance(model, models[stage])}
+        
+        def from_text(stage, key):
+            model = find_value(raw.get(stage), dict, key, models[stage].model_validate)
+            return model.model_dump() if model is not None else None
+        
+        tables = values.get("tables") or from_text("tables", "tables")
+        schema = values.get("schema") or from_text("schema", "columns")
+        if "sql_generation" in values:
+            sql_generation = SQLOutput.from_dict(values["sql_generation"])
+        elif raw.get("sql_generation") is not None:
+            sql_generation = SQLOutput.parse(raw["sql_generation"], source="Agent reply")
+        else:
+            sql_generation = None
+        if "validation" in values:
+            validation = ValidationOutput.from_dict(values["validation"])
+        else:
+            validation = ValidationOutput.parse(raw.get("validation"))
+        return cls(
+            values.get("intent") or from_text("intent", "metric_type"),
+            tables["tables"] if tables is not None else None,
+            schema["columns"] if schema is not None else None,
+            sql_generation,
+            validation,
+            dict(raw)
+        )
+    
+    def replace(self, stage: str, value: Any):
+        """Set a stage's value, e.g. after a repair; its raw text no longer applies"""
+        setattr(self, stage, value)
+        self.raw.pop(stage, None)
+    
+    def render(self, stage: str) -> Optional[str]:
+        """A stage's output as text: the agent's reply, or the value as JSON"""
+        if stage in self.raw:
+            return self.raw[stage]
+        value = getattr(self, stage)
+        if value is None:
+            return None
+        return json.dumps(value.to_dict() if hasattr(value, "to_dict") else value, default=str)
+    
+    def pipeline_output(self) -> Dict[str, str]:
+        """Stage -> text of every stage with an output, the results["pipeline_output"] shape"""
+        rendered = {stage: self.render(stage) for stage in self.__slots__ if stage != "raw"}
+        return {stage: text for stage, text in rendered.items() if text is not None}
+
+
+_task_models = None
+
+
+def task_models() -> Dict[str, type]:
+    """
+    Pydantic models the crew tasks export their answers as, keyed by stage
+    
+    Each is passed to its Task as output_pydantic, so CrewAI checks the
+    agent's answer against the stage's schema and task.output.exported_output
+    holds the typed model. Built on first use: only the crew path needs
+    pydantic, which CrewAI imports anyway.
+    """
+    global _task_models
+    if _task_models is None:
+        from pydantic import BaseModel, ConfigDict
+        
+        class IntentModel(BaseModel):
+            model_config = ConfigDict(extra="allow")
+            metric_type: Optional[str] = None
+            scenario: Optional[str] = None
+            aggregation_level: Optional[str] = None
+            time_window: Optional[str] = None
+            requires_currency_conversion: bool = False
+            
+        class TablesModel(BaseModel):
+            tables: List[str]
+            
+        class SchemaModel(BaseModel):
+            columns: Dict[str, List[str]]
+            
+        class SQLModel(BaseModel):
+            sql: Optional[str] = None
+            parameters: List[Any] = []
+            decisions: Dict[str, Any] = {}
+            notes: str = ""
+            tables: Optional[List[str]] = None
+            materialized: Optional[str] = None
+            
+        class ValidationModel(BaseModel):
+            is_valid: bool
+            issues: List[str] = []
+            recommendations: List[str] = []
+            warnings: Optional[List[str]] = None
+            cost: Optional[Dict[str, Any]] = None
+            
+        _task_models = {
+            "intent": IntentModel,
+            "tables": TablesModel,
+            "schema": SchemaModel,
+            "sql_generation": SQLModel,
+            "validation": ValidationModel
+        }
+    return _task_models
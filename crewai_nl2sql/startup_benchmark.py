@@ -0,0 +1,57 @@
+"""
+Cold start benchmark for the NL2SQL app
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+# Runs in a fresh interpreter so every measurement is a true cold start
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.NL2SQLApp(mode="direct")
+constructed = time.perf_counter()
+app.crew.run("What is the fully loaded cost per employee by department for Q1 2025?")
+answered = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "construct_ms": (constructed - imported) * 1000,
+    "first_query_ms": (answered - constructed) * 1000,
+    "heavy_modules": sorted(
+        name for name in ("crewai", "crewai_tools", "langchain_core", "langchain_openai", "numpy", "asyncio")
+        if name in sys.modules
+    )
+}))
+"""
+
+
+def measure_startup(runs: int = 5):
+    """Run the cold start in fresh interpreters and return the median timings"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD_CODE],
+            cwd=here, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+        
+    return {
+        "import_ms": statistics.median(s["import_ms"] for s in samples),
+        "construct_ms": statistics.median(s["construct_ms"] for s in samples),
+        "first_query_ms": statistics.median(s["first_query_ms"] for s in samples),
+        "heavy_modules": samples[-1]["heavy_modules"]
+    }
+
+
+if __name__ == "__main__":
+    results = measure_startup()
+    print(f"Import main:          {results['import_ms']:.1f} ms")
+    print(f"Construct NL2SQLApp:  {results['construct_ms']:.1f} ms")
+    print(f"First direct query:   {results['first_query_ms']:.1f} ms")
+    print(f"Heavy modules loaded: {', '.join(results['heavy_modules']) or 'none'}")
@@ -0,0 +1,184 @@
+"""
+Parameterized statements compiled from the metric templates
+"""
+import re
+from dataclasses import dataclass
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sample_schema import SAMPLE_SCHEMA, DATA_RULES, METRIC_TEMPLATES, TABLE_ALIASES
+from sql_parser import TOKEN_PATTERN, parse_sql
+
+DEFAULT_SCENARIO = "historical_actuals_only"
+DEFAULT_YEAR = 2025
+
+# YEAR(CURRENT_DATE) in the scenario filters is bound per execution instead
+CURRENT_YEAR_PATTERN = re.compile(r"YEAR\s*\(\s*CURRENT_DATE\s*\)", re.IGNORECASE)
+YEAR_IN_WINDOW_PATTERN = re.compile(r"20\d{2}")
+QUARTER_IN_WINDOW_PATTERN = re.compile(r"Q([1-4])", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class CompiledStatement:
+    """
+    A SQL statement with ? placeholders and the names bound to them
+    
+    Attributes:
+        sql: Statement text, identical for every execution so the database
+            can re-use its prepared plan
+        parameters: Parameter name for each ? in order
+        constants: Values fixed at compile time, e.g. scenario literals
+    """
+    sql: str
+    parameters: Tuple[str, ...]
+    constants: Tuple[Tuple[str, Any], ...] = ()
+    
+    def bind(self, **values) -> List[Any]:
+        """Parameter values in placeholder order"""
+        bound = dict(self.constants)
+        bound.setdefault("current_year", date.today().year)
+        bound.update(values)
+        missing = [name for name in self.parameters if name not in bound]
+        if missing:
+            raise ValueError(f"Missing statement parameters: {', '.join(missing)}")
+        return [bound[name] for name in self.parameters]
+    
+    
+def _literal(token_value: str, kind: str):
+    if kind == "string":
+        return token_value[1:-1].replace("''", "'")
+    return float(token_value) if "." in token_value else int(token_value)
+
+
+def to_qmark(sql: str) -> Tuple[str, Tuple[str, ...]]:
+    """Replace :name placeholders with ? and return the names in order"""
+    parts, names = [], []
+    position = 0
+    for match in TOKEN_PATTERN.finditer(sql):
+        if match.lastgroup == "param" and match.group() != "?":
+            parts.append(sql[position:match.start()])
+            parts.append("?")
+            names.append(match.group()[1:])
+            position = match.end()
+    parts.append(sql[position:])
+    return "".join(parts), tuple(names)
+
+
+def parameterize_filter(filter_sql: str, alias: Optional[str] = None,
+                        table: Optional[str] = None, prefix: str = "scenario",
+                        columns: Optional[Dict[str, str]] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Turn a scenario filter into named placeholders
+    
+    Literals become :<prefix>_<n> with their values returned as constants,
+    YEAR(CURRENT_DATE) becomes :current_year, and bare columns of table are
+    qualified with alias so they stay unambiguous once other tables are joined.
+    Columns default to the table's SAMPLE_SCHEMA entry.
+    """
+    filter_sql = CURRENT_YEAR_PATTERN.sub(":current_year", filter_sql)
+    if columns is None:
+        columns = SAMPLE_SCHEMA.get(table, {}).get("columns", {}) if table else {}
+    
+    parts, constants = [], {}
+    position = 0
+    previous = None
+    for match in TOKEN_PATTERN.finditer(filter_sql):
+        kind, value = match.lastgroup, match.group()
+        replacement = None
+        if kind in ("string", "number"):
+            name = f"{prefix}_{len(constants)}"
+            constants[name] = _literal(value, kind)
+            replacement = f":{name}"
+        elif kind == "ident" and alias and value in columns and previous != ".":
+            replacement = f"{alias}.{value}"
+        if replacement is not None:
+            parts.append(filter_sql[position:match.start()])
+            parts.append(replacement)
+            position = match.end()
+        if kind not in ("space", "comment"):
+            previous = value
+    parts.append(filter_sql[position:])
+    return "".join(parts), constants
+
+
+def scenario_filter_sql(scenario: Optional[str]) -> str:
+    """The DATA_RULES filter for a scenario, defaulting to historical actuals"""
+    filters = DATA_RULES["scenario_filters"]
+    return filters.get(scenario, filters[DEFAULT_SCENARIO])["filter"]
+
+
+def _main_table(sql: str) -> Tuple[Optional[str], Optional[str]]:
+    query = parse_sql(sql)
+    if not query.tables:
+        return None, None
+    first = query.tables[0]
+    return first.name, first.alias or first.name
+
+
+def compile_template(template: str, scenario: Optional[str] = None, with_quarter: bool = False,
+                     columns: Optional[Dict[str, str]] = None,
+                     quarter_column: Optional[str] = None) -> CompiledStatement:
+    """
+    Compile a metric template with {scenario_filter} and {year} slots
+    
+    The scenario filter, fiscal year and (optionally) fiscal quarter become
+    bound parameters, so every year and quarter share one statement text.
+    Columns describe the template's main table when it is not in SAMPLE_SCHEMA;
+    the quarter filter defaults to the joined m_accounting_period.
+    """
+    table, alias = _main_table(template)
+    filter_sql, constants = parameterize_filter(scenario_filter_sql(scenario), alias, table, columns=columns)
+    
+    year_sql = ":year"
+    if with_quarter:
+        if quarter_column is None:
+            period_alias = TABLE_ALIASES["m_accounting_period"]
+            if parse_sql(template).resolve(period_alias) != "m_accounting_period":
+                raise ValueError("Template does not join m_accounting_period")
+            quarter_column = f"{period_alias}.fiscal_quarter"
+        year_sql += f" AND {quarter_column} = :quarter"
+        
+    sql, names = to_qmark(template.format(scenario_filter=filter_sql, year=year_sql).strip())
+    return CompiledStatement(sql, names, tuple(constants.items()))
+
+
+@lru_cache(maxsize=None)
+def compile_metric_template(template_key: str, scenario: Optional[str] = None,
+                            with_quarter: bool = False) -> CompiledStatement:
+    """Compile a METRIC_TEMPLATES entry once per scenario and quarter variant"""
+    return compile_template(METRIC_TEMPLATES[template_key], scenario, with_quarter)
+
+
+def time_window_values(time_window: Optional[str]) -> Dict[str, int]:
+    """Fiscal year and quarter parameters for an intent time window"""
+    values = {"year": DEFAULT_YEAR}
+    if time_window:
+        year_match = YEAR_IN_WINDOW_PATTERN.search(time_window)
+        if year_match:
+            values["year"] = int(year_match.group())
+        quarter_match = QUARTER_IN_WINDOW_PATTERN.search(time_window)
+        if quarter_match:
+            values["quarter"] = int(quarter_match.group(1))
+    return values
+
+
+def render_sql(sql: str, parameters: Optional[Sequence[Any]]) -> str:
+    """Inline bound values into ? placeholders, for display and prompts only"""
+    if not parameters:
+        return sql
+    values = iter(parameters)
+    
+    def literal(value):
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return "NULL" if value is None else str(value)
+    
+    parts = []
+    position = 0
+    for match in TOKEN_PATTERN.finditer(sql):
+        if match.group() == "?" and match.lastgroup == "param":
+            parts.append(sql[position:match.start()])
+            parts.append(literal(next(values)))
+            position = match.end()
+    parts.append(sql[position:])
+    return "".join(parts)
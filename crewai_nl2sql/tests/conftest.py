@@ -0,0 +1,25 @@
+"""
+Shared fixtures for the NL2SQL tests
+
+The package modules import each other by flat module name, so the package
+directory goes on sys.path the same way running from it would.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def synthetic_backend():
+    """Pooled in-memory SQLite backend with a small seeded synthetic data set"""
+    from data_generator import populate_database
+    from db_backends import create_backend
+    
+    backend = create_backend("sqlite")
+    with backend.connection() as conn:
+        populate_database(conn, scale=0.05, seed=7)
+    yield backend
+    backend.close()
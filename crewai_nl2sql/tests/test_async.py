@@ -0,0 +1,59 @@
+"""
+Async pipeline API: concurrency limit and per-query timeout
+"""
+import asyncio
+import threading
+import time
+
+from crew import NL2SQLCrew
+
+QUESTIONS = [
+    "What is the fully loaded cost per employee by department for Q1 2025?",
+    "What is the benefits ratio by location?",
+    "Show headcount movement for 2024",
+    "What is the total compensation cost by department?"
+]
+
+
+class CountingLLM:
+    """Records how many calls overlap; every call takes a fixed time"""
+    
+    def __init__(self, latency):
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        
+    def invoke(self, prompt, **kwargs):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.latency)
+        with self._lock:
+            self.active -= 1
+        return "SELECT 1"
+
+
+def test_arun_limits_concurrency():
+    llm = CountingLLM(0.1)
+    crew = NL2SQLCrew(mode="planner", llm=llm, max_concurrency=2, max_repairs=0)
+    
+    async def main():
+        return await asyncio.gather(*(crew.arun(question) for question in QUESTIONS))
+        
+    results = asyncio.run(main())
+    assert [result["mode"] for result in results] == ["planner"] * len(QUESTIONS)
+    assert llm.peak == 2
+
+
+def test_arun_times_out_with_error_result():
+    crew = NL2SQLCrew(mode="planner", llm=CountingLLM(0.5), max_repairs=0)
+    results = asyncio.run(crew.arun(QUESTIONS[0], timeout=0.05))
+    assert results == {
+        "status": "error",
+        "mode": "planner",
+        "pipeline_output": {},
+        "final_sql": None,
+        "validation": None,
+        "error": "Query timed out after 0.05 seconds"
+    }
@@ -0,0 +1,63 @@
+"""
+Batch runs: shared answers for repeated questions and per-query errors
+"""
+import json
+
+from crew import NL2SQLCrew
+from mock_llm import MockChatModel
+
+
+class ExplodingLLM:
+    def invoke(self, prompt, **kwargs):
+        raise RuntimeError("no LLM in this test")
+
+
+def test_run_batch_answers_each_intent_once():
+    questions = [
+        "What is the fully loaded cost per employee by department for Q1 2025?",
+        "Fully loaded cost per employee by department in Q1 2025",
+        "What is the benefits ratio by location?",
+        "what is the BENEFITS ratio by   location?"
+    ]
+    results = NL2SQLCrew(mode="direct").run_batch(questions)
+    
+    assert [result["query"] for result in results] == questions
+    assert [result["duplicate_of"] for result in results] == [None, 0, None, 2]
+    assert results[1]["final_sql"] == results[0]["final_sql"]
+    assert results[0]["final_sql"] != results[2]["final_sql"]
+    json.dumps(results)
+
+
+def test_run_batch_shares_llm_answers_only_between_repeated_questions():
+    questions = [
+        "What is the fully loaded cost per employee in Engineering for Q1 2025?",
+        "What is the fully loaded cost per employee in Sales for Q1 2025?",
+        "what is the fully loaded cost per employee in  engineering for Q1 2025?"
+    ]
+    results = NL2SQLCrew(mode="planner", llm=MockChatModel()).run_batch(questions)
+    assert [result["duplicate_of"] for result in results] == [None, None, 0]
+
+
+def test_run_batch_keeps_errors_per_query(monkeypatch):
+    questions = [
+        "What is the fully loaded cost per employee by department for Q1 2025?",
+        "What is the benefits ratio by location?",
+        "Show the headcount movement by department"
+    ]
+    crew = NL2SQLCrew(mode="direct", llm=ExplodingLLM())
+    run_direct = crew.run_direct
+    
+    def failing_run_direct(user_query):
+        if user_query == questions[1]:
+            raise RuntimeError("warehouse unavailable")
+        return run_direct(user_query)
+    
+    monkeypatch.setattr(crew, "run_direct", failing_run_direct)
+    results = crew.run_batch(questions)
+    
+    assert results[1]["status"] == "error" and results[1]["final_sql"] is None
+    assert results[1]["error"] == "warehouse unavailable"
+    assert results[1]["query"] == questions[1]
+    for result in (results[0], results[2]):
+        assert result["status"] == "success" and result["mode"] == "direct" and result["final_sql"]
+    assert crew.tracer.traces[1].status == "error"
@@ -0,0 +1,25 @@
+"""
+Vectorized batch intent classification matches the scalar classifier
+"""
+from batch_intent import classify_intents, intents_to_dicts
+from tools import classify_intent
+
+QUESTIONS = [
+    "What is the fully loaded cost per employee by department for Q1 2025?",
+    "Show me headcount movements by quarter for 2025",
+    "Calculate the benefits ratio by location for current year",
+    "What are the total salary costs by department in USD?",
+    "Budget vs actual total cost by location in rupees for 2024",
+    "Forecast salary to date for Q3",
+    "hello there"
+]
+
+
+def test_batch_matches_scalar_classifier():
+    questions = QUESTIONS + QUESTIONS[::-1]
+    assert intents_to_dicts(classify_intents(questions)) == [classify_intent.func(q) for q in questions]
+
+
+def test_rows_follow_input_order():
+    intents = classify_intents(["Show headcount movement for 2024", "hello", "Show headcount movement for 2024"])
+    assert list(intents["metric_type"]) == ["headcount_movement", "", "headcount_movement"]
@@ -0,0 +1,108 @@
+"""
+Result cache keys, persistence and expiry
+"""
+import sqlite3
+
+import cache as cache_module
+from cache import QueryCache
+from mock_llm import MockChatModel
+from crew import NL2SQLCrew
+from materialized import MaterializedAggregates
+
+INTENT = {"metric_type": "fully_loaded_cost", "scenario": "historical_actuals_only"}
+VALIDATION = {"is_valid": True, "issues": [], "recommendations": []}
+COST_QUESTION = "What is the fully loaded cost per employee by department for Q1 2025?"
+ENGINEERING_QUESTION = "What is the fully loaded cost per employee in Engineering for Q1 2025?"
+SALES_QUESTION = "What is the fully loaded cost per employee in Sales for Q1 2025?"
+
+
+def _stored_keys(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0] for row in conn.execute("SELECT cache_key FROM query_cache")}
+    finally:
+        conn.close()
+
+
+def test_context_separates_keys():
+    cache = QueryCache()
+    keys = {
+        cache.make_key(INTENT),
+        cache.make_key(INTENT, {"mode": "direct", "aggregates": []}),
+        cache.make_key(INTENT, {"mode": "planner", "aggregates": []}),
+        cache.make_key(INTENT, {"mode": "direct", "aggregates": ["agg_compensation_cost"]})
+    }
+    assert len(keys) == 4
+
+
+def test_entries_persist_per_context(tmp_path):
+    path = str(tmp_path / "cache.db")
+    routed = {"mode": "direct", "aggregates": ["agg_compensation_cost"]}
+    QueryCache(path=path).put(INTENT, "SELECT 1 FROM agg_compensation_cost", VALIDATION, [2025], routed)
+    
+    reopened = QueryCache(path=path)
+    assert reopened.get(INTENT, {"mode": "direct", "aggregates": []}) is None
+    entry = reopened.get(INTENT, routed)
+    assert entry["final_sql"] == "SELECT 1 FROM agg_compensation_cost"
+    assert entry["parameters"] == [2025]
+
+
+def test_schema_version_change_invalidates_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    QueryCache(path=path, schema_version="old").put(INTENT, "SELECT 1", VALIDATION)
+    assert QueryCache(path=path, schema_version="new").get(INTENT) is None
+
+
+def test_expired_entries_miss():
+    cache = QueryCache(ttl_seconds=0)
+    cache.put(INTENT, "SELECT 1", VALIDATION)
+    assert cache.get(INTENT) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_aggregate_sql_is_not_served_without_aggregates(tmp_path, synthetic_backend):
+    path = str(tmp_path / "cache.db")
+    aggregates = MaterializedAggregates(synthetic_backend)
+    materialized = NL2SQLCrew(mode="direct", cache=QueryCache(path=path), aggregates=aggregates)
+    first = materialized.run(COST_QUESTION)
+    assert "agg_compensation_cost" in first["final_sql"]
+    assert materialized.run(COST_QUESTION)["mode"] == "cache"
+    
+    plain = NL2SQLCrew(mode="direct", cache=QueryCache(path=path))
+    results = plain.run(COST_QUESTION)
+    assert results["mode"] == "direct"
+    assert "agg_" not in results["final_sql"]
+
+
+def test_put_trims_the_stored_table(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.db")
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(cache_module.time, "time", lambda: next(clock))
+    QueryCache(path=path, schema_version="old").put({"metric_type": "salary"}, "SELECT 0", VALIDATION)
+    
+    cache = QueryCache(path=path, max_entries=2)
+    intents = [{"metric_type": name} for name in ("fully_loaded_cost", "benefits_ratio", "headcount_movement")]
+    cache.put(intents[0], "SELECT 1", VALIDATION)
+    cache.put(intents[1], "SELECT 2", VALIDATION)
+    assert cache.get(intents[0]) is not None
+    cache.put(intents[2], "SELECT 3", VALIDATION)
+    # The old schema version's row and the least recently used row are gone
+    assert _stored_keys(path) == {cache.make_key(intents[0]), cache.make_key(intents[2])}
+    
+    expiring = QueryCache(path=path, ttl_seconds=0.5)
+    expiring.put(intents[1], "SELECT 2", VALIDATION)
+    assert _stored_keys(path) == {cache.make_key(intents[1])}
+
+
+def test_llm_written_sql_is_keyed_on_the_question():
+    crew = NL2SQLCrew(mode="planner", llm=MockChatModel(), cache=QueryCache())
+    assert crew._cacheable_intent(ENGINEERING_QUESTION) == crew._cacheable_intent(SALES_QUESTION)
+    crew.run(ENGINEERING_QUESTION)
+    assert crew.run(SALES_QUESTION)["mode"] == "planner"
+    assert crew.run("  what is the fully loaded cost per employee in engineering for Q1 2025?")["mode"] == "cache"
+
+
+def test_direct_sql_is_shared_by_intent():
+    crew = NL2SQLCrew(mode="direct", cache=QueryCache())
+    crew.run(ENGINEERING_QUESTION)
+    assert crew.run(SALES_QUESTION)["mode"] == "cache"
@@ -0,0 +1,59 @@
+"""
+Cost check policies and their interplay with the index advisor
+"""
+from cost_check import CostChecker
+from index_advisor import IndexAdvisor
+from sample_schema import SAMPLE_SCHEMA
+from tools import classify_intent, generate_sql, prune_columns, select_tables, validate_sql
+
+COST_QUESTION = "What is the fully loaded cost per employee by department for Q1 2025?"
+
+
+def _generated():
+    intent = classify_intent.func(COST_QUESTION)
+    tables = select_tables.func(intent)
+    return tables, generate_sql.func(intent, tables, prune_columns.func(tables, intent))
+
+
+def _fact_scan_problems(report):
+    return [problem for problem in report["problems"] if problem.startswith("Full scan of fact table")]
+
+
+def test_reject_policy_fails_validation_on_large_fact_scans(synthetic_backend):
+    tables, output = _generated()
+    checker = CostChecker(synthetic_backend, policy="reject", large_table_rows=1000)
+    validation = validate_sql.func(output["sql"], tables, SAMPLE_SCHEMA, checker, output["parameters"])
+    assert not validation["is_valid"]
+    assert any(issue.startswith("Full scan of fact table") for issue in validation["issues"])
+
+
+def test_index_advice_is_attached_before_rejecting(synthetic_backend):
+    tables, output = _generated()
+    checker = CostChecker(synthetic_backend, policy="reject", large_table_rows=1000,
+                          index_advisor=IndexAdvisor(synthetic_backend, min_rows=1))
+    validation = validate_sql.func(output["sql"], tables, SAMPLE_SCHEMA, checker, output["parameters"])
+    advice = validation["cost"]["index_advice"]
+    assert not validation["is_valid"]
+    assert not advice["created"] and advice["indexes"]
+    assert set(advice["indexes"]) <= set(validation["recommendations"])
+
+
+def test_created_indexes_let_the_query_pass(synthetic_backend):
+    tables, output = _generated()
+    checker = CostChecker(synthetic_backend, policy="reject", large_table_rows=1000,
+                          index_advisor=IndexAdvisor(synthetic_backend, min_rows=1), create_indexes=True)
+    validation = validate_sql.func(output["sql"], tables, SAMPLE_SCHEMA, checker, output["parameters"])
+    assert validation["cost"]["index_advice"]["created"]
+    assert _fact_scan_problems(validation["cost"]) == []
+    assert validation["is_valid"]
+
+
+def test_row_counts_are_cached_until_cleared(synthetic_backend):
+    checker = CostChecker(synthetic_backend)
+    with synthetic_backend.connection() as conn:
+        before = checker._row_count(conn, "m_department")
+        conn.execute("INSERT INTO m_department (department_id, department_name) VALUES (9999, 'New')")
+        conn.commit()
+        assert checker._row_count(conn, "m_department") == before
+        checker.clear_statistics()
+        assert checker._row_count(conn, "m_department") == before + 1
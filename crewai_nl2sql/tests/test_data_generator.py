@@ -0,0 +1,39 @@
+"""
+Seeded synthetic data for the sample warehouse
+"""
+import sqlite3
+
+from data_generator import benchmark_templates, populate_database
+from sample_schema import SAMPLE_SCHEMA
+
+
+def generate(seed):
+    conn = sqlite3.connect(":memory:")
+    counts = populate_database(conn, scale=0.02, seed=seed)
+    return conn, counts
+
+
+def test_same_seed_same_data():
+    first, counts = generate(7)
+    second, _ = generate(7)
+    third, _ = generate(8)
+    query = "SELECT employee_id, accounting_period, category, amount FROM a_personnel_details ORDER BY rowid"
+    assert first.execute(query).fetchall() == second.execute(query).fetchall()
+    assert first.execute(query).fetchall() != third.execute(query).fetchall()
+    assert counts["a_personnel_details"] == first.execute("SELECT COUNT(*) FROM a_personnel_details").fetchone()[0]
+    assert set(counts) <= set(SAMPLE_SCHEMA)
+
+
+def test_summary_rolls_up_the_details():
+    conn, _ = generate(3)
+    detail, summary = conn.execute("""
+        SELECT (SELECT ROUND(SUM(amount), 0) FROM a_personnel_details),
+               (SELECT ROUND(SUM(total_amount), 0) FROM a_personnel_summary)
+    """).fetchone()
+    assert abs(detail - summary) <= 1
+
+
+def test_metric_templates_run_on_generated_data():
+    conn, _ = generate(5)
+    timings = benchmark_templates(conn, runs=1)
+    assert timings and all(ms >= 0 for ms in timings.values())
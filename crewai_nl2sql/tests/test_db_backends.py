@@ -0,0 +1,115 @@
+"""
+Connection pool and pluggable execution backends
+"""
+import os
+import sqlite3
+import threading
+
+import pytest
+
+from db_backends import EXECUTION_BACKENDS, ConnectionPool, create_backend, register_backend
+
+
+def test_pool_reuses_connections():
+    pool = ConnectionPool(lambda: sqlite3.connect(":memory:", check_same_thread=False), max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        assert second is first
+    assert pool.stats() == {"max_size": 2, "open": 1, "idle": 1}
+    pool.close()
+
+
+def test_pool_limits_checkouts():
+    pool = ConnectionPool(lambda: sqlite3.connect(":memory:", check_same_thread=False), max_size=1, timeout=0.05)
+    with pool.connection():
+        with pytest.raises(TimeoutError):
+            with pool.connection():
+                pass
+    pool.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        with pool.connection():
+            pass
+
+
+def test_failed_work_is_rolled_back():
+    backend = create_backend("sqlite", max_connections=1)
+    with backend.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+    with pytest.raises(ValueError):
+        with backend.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (1)")
+            raise ValueError("abort")
+    with backend.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (0,)
+    backend.close()
+
+
+def test_default_database_is_a_temporary_wal_file():
+    backend = create_backend("sqlite")
+    with backend.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert os.path.exists(backend._database)
+    backend.close()
+    assert not os.path.exists(backend._database)
+
+
+def test_concurrent_writers_wait_for_each_other():
+    backend = create_backend("sqlite", max_connections=4)
+    with backend.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        
+    errors = []
+    
+    def write(value):
+        try:
+            with backend.connection() as conn:
+                for _ in range(50):
+                    conn.execute("INSERT INTO t VALUES (?)", (value,))
+                    conn.commit()
+        except sqlite3.Error as e:
+            errors.append(e)
+            
+    threads = [threading.Thread(target=write, args=(value,)) for value in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with backend.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone() == (200,)
+    assert errors == []
+    backend.close()
+
+
+def test_in_memory_database_is_shared_across_threads():
+    backend = create_backend("sqlite", ":memory:", max_connections=2)
+    with backend.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+        conn.commit()
+        
+    counts = []
+    
+    def count():
+        with backend.connection() as other:
+            counts.append(other.execute("SELECT COUNT(*) FROM t").fetchone()[0])
+            
+    with backend.connection():
+        thread = threading.Thread(target=count)
+        thread.start()
+        thread.join()
+    assert counts == [1]
+    backend.close()
+
+
+def test_registered_backend(monkeypatch):
+    monkeypatch.setitem(EXECUTION_BACKENDS, "memory", None)
+    register_backend("memory", lambda: create_backend("dbapi", sqlite3.connect, ":memory:", dialect="SQLite"))
+    backend = create_backend("memory")
+    assert backend.dialect == "SQLite"
+    with backend.connection() as conn:
+        assert conn.execute("SELECT 1").fetchone() == (1,)
+    with pytest.raises(ValueError, match="Unknown execution backend"):
+        create_backend("nonexistent")
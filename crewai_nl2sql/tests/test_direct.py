@@ -0,0 +1,36 @@
+"""
+Direct mode: the deterministic tool chain answers without the LLM
+"""
+from crew import NL2SQLCrew
+
+QUESTIONS = [
+    "What is the fully loaded cost per employee by department for Q1 2025?",
+    "What is the benefits ratio by location?",
+    "Show headcount movement for 2024"
+]
+
+
+class ExplodingLLM:
+    def invoke(self, prompt, **kwargs):
+        raise AssertionError("direct mode must not call the LLM")
+
+
+def test_direct_mode_answers_without_the_llm(synthetic_backend):
+    crew = NL2SQLCrew(mode="direct", llm=ExplodingLLM())
+    for question in QUESTIONS:
+        results = crew.run(question)
+        assert results["mode"] == "direct"
+        assert results["validation"]["is_valid"], results["validation"]["issues"]
+        with synthetic_backend.connection() as conn:
+            conn.execute(results["final_sql"], results["parameters"]).fetchall()
+
+
+def test_unrecognised_question_is_left_to_the_crew():
+    assert NL2SQLCrew(mode="direct").run_direct("How many meeting rooms are there?") is None
+
+
+def test_direct_run_is_traced_per_stage():
+    results = NL2SQLCrew(mode="direct").run(QUESTIONS[0])
+    stages = results["trace"]["stages"]
+    assert [stage["stage"] for stage in stages][:4] == ["intent", "tables", "schema", "sql_generation"]
+    assert sum(stage["llm_calls"] for stage in stages) == 0
@@ -0,0 +1,41 @@
+"""
+Few-shot example retrieval from the local TF-IDF index
+"""
+from examples import ExampleStore
+
+EXAMPLES = [
+    ("What is the fully loaded cost per employee by department?", "SELECT 'cost'"),
+    ("Show headcount movement by quarter", "SELECT 'headcount'"),
+    ("Benefits ratio by location for the current year", "SELECT 'benefits'")
+]
+
+
+def make_store(path=None):
+    store = ExampleStore(path)
+    for question, sql in EXAMPLES:
+        store.add(question, {}, sql)
+    return store
+
+
+def test_nearest_example_comes_first():
+    store = make_store()
+    matches = store.search("fully loaded cost per employee for Q1 2025", k=2)
+    assert matches[0]["sql"] == "SELECT 'cost'"
+    assert matches[0]["score"] >= matches[-1]["score"]
+    assert store.search("completely unrelated words") == []
+
+
+def test_index_picks_up_new_examples():
+    store = make_store()
+    store.search("headcount")
+    store.add("Total salary cost in rupees", {}, "SELECT 'salary'")
+    assert store.search("salary in rupees", k=1)[0]["sql"] == "SELECT 'salary'"
+    assert not store.add("Total salary cost in rupees", {}, "SELECT 'other'")
+
+
+def test_examples_persist(tmp_path):
+    path = str(tmp_path / "examples.jsonl")
+    make_store(path)
+    reopened = ExampleStore(path)
+    assert [example["question"] for example in reopened.examples] == [question for question, _ in EXAMPLES]
+    assert "SELECT 'headcount'" in reopened.format_for_prompt("headcount movement")
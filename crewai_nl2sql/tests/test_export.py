@@ -0,0 +1,56 @@
+"""
+Columnar and file export of query results
+"""
+import csv
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from export import numpy_batches, write_csv
+from main import NL2SQLApp
+
+SQL = "SELECT department_id, SUM(amount) AS amount FROM a_personnel_details GROUP BY department_id"
+
+
+def test_numpy_batches_type_columns():
+    batches = [[(1, Decimal("2.50"), "a"), (2, None, None)]]
+    (columns,) = numpy_batches(batches, ["id", "amount", "name"])
+    assert columns["id"].dtype == np.int64
+    assert columns["amount"][0] == 2.5 and np.isnan(columns["amount"][1])
+    assert columns["name"].dtype == object
+
+
+def test_csv_export_matches_the_query(tmp_path, synthetic_backend):
+    app = NL2SQLApp(mode="direct", backend=synthetic_backend, result_batch_size=3)
+    path = str(tmp_path / "result.csv")
+    written = app.export_results(SQL, path)
+    
+    with synthetic_backend.connection() as conn:
+        expected = conn.execute(SQL).fetchall()
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert written == len(expected)
+    assert rows[0] == ["department_id", "amount"]
+    assert [int(row[0]) for row in rows[1:]] == [row[0] for row in expected]
+
+
+def test_empty_result_still_writes_the_header(tmp_path):
+    path = str(tmp_path / "empty.csv")
+    assert write_csv(iter([]), ["a", "b"], path) == 0
+    with open(path, encoding="utf-8") as f:
+        assert f.read().strip() == "a,b"
+
+
+def test_parquet_export(tmp_path, synthetic_backend):
+    pq = pytest.importorskip("pyarrow.parquet")
+    app = NL2SQLApp(mode="direct", backend=synthetic_backend)
+    path = str(tmp_path / "result.parquet")
+    written = app.export_results(SQL, path)
+    assert pq.read_table(path).num_rows == written
+
+
+def test_unknown_format_is_rejected(synthetic_backend):
+    app = NL2SQLApp(mode="direct", backend=synthetic_backend)
+    with pytest.raises(ValueError, match="Unsupported export format"):
+        app.export_results(SQL, "result.xlsx")
@@ -0,0 +1,53 @@
+"""
+Index proposals for generated queries and their effect on the query plan
+"""
+from index_advisor import IndexAdvisor
+from tools import classify_intent, generate_sql, prune_columns, select_tables
+
+COST_QUESTION = "What is the fully loaded cost per employee by department for Q1 2025?"
+
+
+def _generated():
+    intent = classify_intent.func(COST_QUESTION)
+    tables = select_tables.func(intent)
+    return generate_sql.func(intent, tables, prune_columns.func(tables, intent))
+
+
+def _index_count(backend):
+    with backend.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index'").fetchone()[0]
+
+
+def test_fact_table_index_leads_with_equality_filters(synthetic_backend):
+    output = _generated()
+    proposals = {proposal["table"]: proposal for proposal in
+                 IndexAdvisor(synthetic_backend, min_rows=1).recommend(output["sql"], output["parameters"])}
+    fact = proposals["a_personnel_details"]
+    assert fact["reason"] == "full scan"
+    assert fact["columns"][:3] == ["plan_version_name", "closed", "fiscal_year"]
+    assert "amount" in fact["columns"]
+    assert fact["ddl"].startswith("CREATE INDEX IF NOT EXISTS idx_a_personnel_details_plan_version_name_")
+
+
+def test_small_tables_are_left_to_full_scans(synthetic_backend):
+    output = _generated()
+    proposals = IndexAdvisor(synthetic_backend, min_rows=10 ** 9).recommend(output["sql"], output["parameters"])
+    assert all(proposal["reason"] == "automatic index" for proposal in proposals)
+
+
+def test_advise_rolls_back_unless_asked_to_create(synthetic_backend):
+    output = _generated()
+    advisor = IndexAdvisor(synthetic_backend, min_rows=1)
+    before = _index_count(synthetic_backend)
+    
+    report = advisor.advise(output["sql"], parameters=output["parameters"])
+    assert report["indexes"] and not report["created"]
+    assert "a_personnel_details" in report["full_scans_before"]
+    assert "a_personnel_details" not in report["full_scans_after"]
+    assert _index_count(synthetic_backend) == before
+    
+    report = advisor.advise(output["sql"], create=True, parameters=output["parameters"])
+    assert report["created"]
+    assert _index_count(synthetic_backend) == before + len(report["indexes"])
+    assert "a_personnel_details" not in [proposal["table"] for proposal in
+                                         advisor.recommend(output["sql"], output["parameters"])]
@@ -0,0 +1,30 @@
+"""
+Intent classification from the declarative synonym table
+"""
+import pytest
+
+from tools import PhraseMatcher, classify_intent
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is the fully loaded cost per employee by department for Q1 2025?",
+     {"metric_type": "fully_loaded_cost", "aggregation_level": "employee_level", "time_window": "Q1 2025"}),
+    ("Calculate the benefits ratio by location for current year",
+     {"metric_type": "benefits_ratio", "scenario": "current_year_totals", "aggregation_level": "location"}),
+    ("What are the total salary costs by department in USD?",
+     {"metric_type": "salary", "requires_currency_conversion": True, "target_currency": "USD"}),
+    ("Budget vs actual total cost by location in rupees for 2024",
+     {"metric_type": "fully_loaded_cost", "scenario": "budget_vs_actual", "time_window": "2024",
+      "target_currency": "INR"}),
+    ("Forecast salary to date for Q3", {"scenario": "current_year_totals", "time_window": "Q3 2025"}),
+    ("hello there", {"metric_type": None, "scenario": "historical_actuals_only", "aggregation_level": "company"})
+])
+def test_classify_intent(question, expected):
+    intent = classify_intent.func(question)
+    assert {key: intent.get(key) for key in expected} == expected
+
+
+def test_phrase_matcher_reports_overlapping_phrases():
+    matcher = PhraseMatcher(["cost", "cost per employee", "employee", "per"])
+    assert matcher.find("the cost per employee") == {"cost", "cost per employee", "employee", "per"}
+    assert matcher.find("nothing here") == set()
@@ -0,0 +1,41 @@
+"""
+Direct and planner modes must run without importing crewai
+"""
+import json
+import os
+import subprocess
+import sys
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_CODE = """
+import json, sys
+import main
+from mock_llm import MockChatModel
+app = main.NL2SQLApp(mode=sys.argv[1], llm=MockChatModel())
+results = app.crew.run("What is the fully loaded cost per employee by department for Q1 2025?")
+print(json.dumps({
+    "mode": results["mode"],
+    "status": results["status"],
+    "loaded": sorted(name for name in ("crewai", "crewai_tools") if name in sys.modules)
+}))
+"""
+
+
+def _run_child(mode):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE, mode],
+        cwd=PACKAGE_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_direct_mode_does_not_import_crewai():
+    result = _run_child("direct")
+    assert result["mode"] == "direct"
+    assert result["loaded"] == []
+
+
+def test_planner_mode_does_not_import_crewai():
+    result = _run_child("planner")
+    assert result == {"mode": "planner", "status": "success", "loaded": []}
@@ -0,0 +1,34 @@
+"""
+Pluggable LLM providers and the deterministic mock model
+"""
+import json
+import time
+
+import pytest
+
+from llm_providers import LLM_PROVIDERS, create_llm, register_llm_provider
+from mock_llm import MockChatModel
+
+
+def test_provider_from_environment(monkeypatch):
+    monkeypatch.setenv("NL2SQL_LLM_PROVIDER", "mock")
+    assert isinstance(create_llm(latency=0.01), MockChatModel)
+    with pytest.raises(ValueError, match="Unknown LLM provider"):
+        create_llm("nonexistent")
+
+
+def test_registered_provider(monkeypatch):
+    monkeypatch.setitem(LLM_PROVIDERS, "canned", None)
+    register_llm_provider("canned", lambda **kwargs: MockChatModel(responses=["one", "two"], **kwargs))
+    llm = create_llm("canned")
+    assert [llm.invoke("question").content for _ in range(3)] == ["one", "two", "one"]
+
+
+def test_mock_answers_crew_tasks_with_the_tools():
+    prompt = ("You are Intent Strategist.\nAnalyze this user query and classify the intent:\n"
+              "'What is the benefits ratio by location?'\n")
+    started = time.perf_counter()
+    reply = MockChatModel(latency=0.05).invoke(prompt).content
+    assert time.perf_counter() - started >= 0.05
+    intent = json.loads(reply.split("Final Answer:", 1)[1])
+    assert intent["metric_type"] == "benefits_ratio" and intent["aggregation_level"] == "location"
@@ -0,0 +1,42 @@
+"""
+Planner mode: the whole pipeline with a single LLM call
+"""
+from crew import NL2SQLCrew
+from mock_llm import MockChatModel
+from planner import build_planner_prompt, parse_planner_response
+from tools import classify_intent, prune_columns, select_tables
+
+COST_QUESTION = "What is the fully loaded cost per employee by department for Q1 2025?"
+
+
+def test_prompt_carries_joins_rules_and_template():
+    intent = classify_intent.func(COST_QUESTION)
+    tables = select_tables.func(intent)
+    prompt = build_planner_prompt(COST_QUESTION, intent, tables, prune_columns.func(tables, intent), dialect="SQLite")
+    assert "FROM a_personnel_details pd\nJOIN m_accounting_period ap ON pd.accounting_period = ap.name" in prompt
+    assert "- Scenario filter: plan_version_name = 'actual' AND closed = 1" in prompt
+    assert "Reference template for fully_loaded_cost_per_employee" in prompt
+    assert "{scenario_filter}" in prompt
+
+
+def test_parse_planner_response_reads_fenced_json_and_bare_sql():
+    reply = 'Here it is:\n```json\n{"sql": "SELECT 1 WHERE x = ?", "parameters": [2]}\n```'
+    assert parse_planner_response(reply)["parameters"] == [2]
+    bare = parse_planner_response("```sql\nSELECT 1;\n```")
+    assert bare["sql"] == "SELECT 1" and bare["parameters"] == []
+    assert parse_planner_response("I cannot answer that")["sql"] is None
+
+
+def test_planner_makes_one_llm_call():
+    results = NL2SQLCrew(mode="planner", llm=MockChatModel()).run(COST_QUESTION)
+    assert results["status"] == "success" and results["validation"]["is_valid"]
+    assert results["parameters"] == ["actual", 1, 2025, 1]
+    assert list(results["pipeline_output"]) == ["intent", "tables", "schema", "sql_generation", "validation"]
+    assert sum(stage["llm_calls"] for stage in results["trace"]["stages"]) == 1
+
+
+def test_speculative_planner_answers_from_the_template():
+    results = NL2SQLCrew(mode="planner", speculative=True, llm=MockChatModel()).run(COST_QUESTION)
+    assert results["status"] == "success"
+    assert results["speculation"] == {"winner": "template_sql"}
+    assert results["parameters"] == ["actual", 1, 2025, 1]
@@ -0,0 +1,133 @@
+"""
+Deterministic and LLM repair of SQL that fails validation
+"""
+from mock_llm import MockChatModel
+from planner import PLANNER_STAGE, build_planner_prompt, llm_config, parse_planner_response
+from repair import (
+    REPAIR_STAGE,
+    add_scenario_filter,
+    build_repair_prompt,
+    deterministic_repair,
+    repair_loop
+)
+from sample_schema import SAMPLE_SCHEMA
+from statements import render_sql
+from tools import classify_intent, prune_columns, select_tables, validate_sql
+
+INTENT = {"metric_type": "benefits_cost", "scenario": "historical_actuals_only"}
+TABLES = ["a_personnel_details", "m_department"]
+SCHEMA = {"a_personnel_details": ["department_id", "amount"], "m_department": ["department_id", "department_name"]}
+
+
+def validate(sql_output, tables=TABLES):
+    return validate_sql(sql_output["sql"], tables, SAMPLE_SCHEMA, parameters=sql_output.get("parameters"))
+
+
+def test_missing_table_is_joined_along_the_join_path():
+    sql_output = {
+        "sql": "SELECT pd.department_id, SUM(pd.amount) FROM a_personnel_details pd "
+               "WHERE pd.amount > ? GROUP BY pd.department_id",
+        "parameters": [0]
+    }
+    issues = validate(sql_output)["issues"]
+    assert issues == ["Expected table 'm_department' not found in query"]
+    
+    repaired = deterministic_repair(sql_output, issues, INTENT)
+    assert "JOIN m_department d ON pd.department_id = d.department_id" in repaired["sql"]
+    assert repaired["parameters"] == [0]
+    assert validate(repaired)["is_valid"]
+
+
+def test_scenario_filter_keeps_parameter_order():
+    sql = "SELECT pd.amount * ? FROM a_personnel_details pd GROUP BY pd.amount HAVING SUM(pd.amount) > ?"
+    filtered_sql, parameters = add_scenario_filter(sql, [2, 100], INTENT["scenario"])
+    
+    assert filtered_sql.index("WHERE") < filtered_sql.index("GROUP BY")
+    assert parameters[0] == 2 and parameters[-1] == 100
+    assert filtered_sql.count("?") == len(parameters)
+    assert "'actual'" in render_sql(filtered_sql, parameters)
+
+
+def test_scenario_filter_only_goes_on_the_outer_query():
+    sql = ("WITH totals AS (SELECT pd.department_id, SUM(pd.amount) AS amount FROM a_personnel_details pd "
+           "WHERE pd.amount > ? GROUP BY pd.department_id) SELECT t.amount FROM totals t")
+    filtered_sql, parameters = add_scenario_filter(sql, [0], INTENT["scenario"])
+    assert filtered_sql.startswith(sql.split(" SELECT t.amount")[0])
+    assert filtered_sql.count("WHERE") == 2
+    assert parameters[0] == 0
+    assert add_scenario_filter(filtered_sql, parameters, INTENT["scenario"]) is None
+
+
+def test_other_issues_are_left_to_the_llm():
+    sql_output = {"sql": "SELECT pd.amount FROM a_personnel_details pd", "parameters": []}
+    issues = ["Missing WHERE clause for scenario filter", "Unknown column 'x'"]
+    assert deterministic_repair(sql_output, issues, INTENT) is None
+
+
+def test_repair_loop_is_bounded():
+    attempts = []
+    
+    def llm_repair(sql_output, issues):
+        attempts.append(issues)
+        return dict(sql_output)
+        
+    invalid = {"is_valid": False, "issues": ["Unknown column 'x'"], "recommendations": []}
+    sql_output, validation, log = repair_loop(
+        {"sql": "SELECT x FROM a_personnel_details", "parameters": []}, invalid,
+        lambda output: invalid, INTENT, llm_repair, max_repairs=3
+    )
+    assert len(attempts) == 3
+    assert [entry["kind"] for entry in log] == ["llm"] * 3
+    assert not validation["is_valid"]
+
+
+def test_repair_loop_stops_when_the_llm_returns_no_sql():
+    invalid = {"is_valid": False, "issues": ["Unknown column 'x'"], "recommendations": []}
+    _, _, log = repair_loop({"sql": "SELECT x", "parameters": []}, invalid, lambda output: invalid,
+                            INTENT, lambda sql_output, issues: {"sql": None}, max_repairs=3)
+    assert log == [{"kind": "llm", "issues": ["Unknown column 'x'"], "is_valid": False}]
+
+
+def test_prompts_name_the_dialect_not_a_role():
+    planner_prompt = build_planner_prompt("Benefits by department", INTENT, TABLES, SCHEMA, dialect="PostgreSQL")
+    repair_prompt = build_repair_prompt("Benefits by department", {"sql": "SELECT 1"}, ["Unknown column 'x'"],
+                                        INTENT, TABLES, SCHEMA, dialect="PostgreSQL")
+    for prompt in (planner_prompt, repair_prompt):
+        assert not prompt.startswith("You are")
+        assert "PostgreSQL" in prompt
+        assert "SQLite" not in prompt
+        assert "context you're working with" not in prompt
+
+
+def test_llm_repair_fixes_the_reported_issues():
+    llm = MockChatModel()
+    
+    def llm_repair(sql_output, issues):
+        prompt = build_repair_prompt("Benefits by department", sql_output, issues, INTENT, TABLES, SCHEMA)
+        return parse_planner_response(llm.invoke(prompt, config=llm_config(REPAIR_STAGE)).content)
+        
+    sql_output = {
+        "sql": "SELECT pd.department_id, SUM(pd.amount) * ? FROM a_personnel_details pd ¤ "
+               "GROUP BY pd.department_id",
+        "parameters": [2]
+    }
+    validation = validate(sql_output)
+    assert "Unsupported character '¤' in query" in validation["issues"]
+    
+    repaired, validation, log = repair_loop(sql_output, validation, validate, INTENT, llm_repair)
+    assert validation["is_valid"], validation["issues"]
+    assert [entry["kind"] for entry in log] == ["llm"]
+    assert "¤" not in repaired["sql"]
+    assert "JOIN m_department" in repaired["sql"]
+    assert repaired["parameters"][0] == 2
+
+
+def test_mock_answers_planner_calls_by_stage():
+    question = "What is the fully loaded cost per employee by department for Q1 2025?"
+    intent = classify_intent.func(question)
+    tables = select_tables.func(intent)
+    prompt = build_planner_prompt(question, intent, tables, prune_columns.func(tables, intent))
+    llm = MockChatModel()
+    planned = parse_planner_response(llm.invoke(prompt, config=llm_config(PLANNER_STAGE)).content)
+    assert validate(planned, tables)["is_valid"]
+    assert "Unrecognised task" in llm.invoke(prompt).content
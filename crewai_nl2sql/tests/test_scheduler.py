@@ -0,0 +1,103 @@
+"""
+Stage graph scheduling, races, timeouts and errors
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from crew import NL2SQLCrew
+from scheduler import Stage, StageScheduler
+
+COST_QUESTION = "What is the fully loaded cost per employee by department for Q1 2025?"
+UNKNOWN_QUESTION = "How many meeting rooms are there?"
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=False)
+
+
+def test_dependencies_receive_results(executor):
+    stages = [
+        Stage("a", lambda: 2),
+        Stage("b", lambda: 3),
+        Stage("product", lambda a, b: a * b, ("a", "b"))
+    ]
+    assert StageScheduler(executor).run(stages)["product"] == 6
+
+
+def test_accepted_candidate_wins_without_waiting(executor):
+    release = threading.Event()
+    stages = [
+        Stage("slow", lambda: release.wait(5) and "slow", accept=bool),
+        Stage("fast", lambda: "fast", accept=bool)
+    ]
+    results = StageScheduler(executor).run(stages, races={"answer": ("slow", "fast")}, timeout=2)
+    release.set()
+    assert results["answer"] == "fast"
+    assert results["answer.winner"] == "fast"
+
+
+def test_race_falls_back_to_first_result_in_order(executor):
+    def fails():
+        raise RuntimeError("candidate failed")
+        
+    stages = [
+        Stage("first", fails, accept=lambda result: False),
+        Stage("second", lambda: "rejected", accept=lambda result: False),
+        Stage("third", lambda: "also rejected", accept=lambda result: False)
+    ]
+    results = StageScheduler(executor).run(stages, races={"answer": ("first", "second", "third")})
+    assert results["answer.winner"] == "second"
+
+
+def test_timeout_raises(executor):
+    release = threading.Event()
+    stages = [Stage("stuck", lambda: release.wait(5))]
+    with pytest.raises(TimeoutError):
+        StageScheduler(executor).run(stages, timeout=0.1)
+    release.set()
+
+
+def test_stage_error_propagates(executor):
+    def fails():
+        raise ValueError("stage failed")
+        
+    with pytest.raises(ValueError, match="stage failed"):
+        StageScheduler(executor).run([Stage("fails", fails)])
+
+
+class SlowLLM:
+    """LLM whose every call takes longer than the test's query timeout"""
+    
+    def invoke(self, prompt, **kwargs):
+        time.sleep(1)
+        return "SELECT 1"
+
+
+class BrokenExampleStore:
+    def format_for_prompt(self, user_query, num_examples):
+        raise RuntimeError("example store unavailable")
+
+
+def test_speculative_planner_times_out_with_error_result():
+    crew = NL2SQLCrew(mode="planner", speculative=True, llm=SlowLLM(), query_timeout=0.2)
+    results = crew.run(UNKNOWN_QUESTION)
+    assert results["status"] == "error"
+    assert results["error"] == "Query timed out after 0.2 seconds"
+    assert results["final_sql"] is None
+    json.dumps(results)
+
+
+def test_speculative_planner_reports_stage_errors():
+    crew = NL2SQLCrew(mode="planner", speculative=True, llm=SlowLLM(), example_store=BrokenExampleStore())
+    results = crew.run(COST_QUESTION)
+    assert results["status"] == "error"
+    assert results["mode"] == "planner"
+    assert results["error"] == "example store unavailable"
+    assert results["trace"]["status"] == "error"
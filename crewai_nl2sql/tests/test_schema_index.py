@@ -0,0 +1,35 @@
+"""
+Join graph lookups and table selection over the schema index
+"""
+from schema_index import SchemaIndex
+from tools import classify_intent, select_tables
+
+SCHEMA = {
+    "orders": {"columns": {"order_id": "INTEGER PRIMARY KEY", "customer_id": "INTEGER"}},
+    "customers": {"columns": {"customer_id": "INTEGER PRIMARY KEY", "region_id": "INTEGER"}},
+    "regions": {"columns": {"region_id": "INTEGER PRIMARY KEY", "name": "VARCHAR(50)"}},
+    "notes": {"columns": {"note_id": "INTEGER PRIMARY KEY", "text": "VARCHAR(50)"}}
+}
+
+
+def test_shortest_join_paths_are_precomputed():
+    index = SchemaIndex(SCHEMA, aliases={"regions": "r"})
+    assert index.join_path("orders", "regions") == ["orders", "customers", "regions"]
+    assert index.join_path("orders", "notes") == []
+    assert index.connected_tables(["orders", "regions"]) == ["orders", "regions", "customers"]
+    assert index.join_clauses("orders", ["regions"]) == [
+        "JOIN customers c ON o.customer_id = c.customer_id",
+        "JOIN regions r ON c.region_id = r.region_id"
+    ]
+
+
+def test_extra_joins_add_edges():
+    index = SchemaIndex(SCHEMA, extra_joins=[("notes", "text", "regions", "name")])
+    assert index.join_path("orders", "notes") == ["orders", "customers", "regions", "notes"]
+
+
+def test_select_tables_adds_currency_only_when_converting():
+    plain = select_tables.func(classify_intent.func("What are the total salary costs by department?"))
+    converted = select_tables.func(classify_intent.func("What are the total salary costs by department in USD?"))
+    assert "currency_master" not in plain
+    assert converted == plain + ["currency_master"]
@@ -0,0 +1,54 @@
+"""
+Token-budgeted schema pruning
+"""
+from schema_pruner import (
+    DEFAULT, DEFAULT_COLUMNS, RELEVANT, REQUIRED, count_tokens, prune_schema, render_schema, score_columns
+)
+from tools import classify_intent, select_tables
+
+COST_QUESTION = "What is the fully loaded cost per employee by department for Q1 2025?"
+
+
+def _intent_and_tables(question):
+    intent = classify_intent.func(question)
+    return intent, select_tables.func(intent)
+
+
+def _old_schema(tables):
+    return {table: DEFAULT_COLUMNS.get(table, []) for table in tables}
+
+
+def test_required_and_relevant_columns_are_kept():
+    intent, tables = _intent_and_tables(COST_QUESTION)
+    scores = score_columns(intent, tables)
+    pruned = prune_schema(intent, tables)["schema"]
+    for table, columns in scores.items():
+        for column, score in columns.items():
+            if score >= RELEVANT:
+                assert column in pruned[table]
+
+
+def test_default_budget_is_smaller_than_old_fixed_lists():
+    intent, tables = _intent_and_tables(COST_QUESTION)
+    result = prune_schema(intent, tables)
+    assert result["tokens_after"] <= result["token_budget"]
+    assert result["tokens_after"] < count_tokens(render_schema(_old_schema(tables)))
+
+
+def test_default_columns_only_fill_the_budget():
+    intent, tables = _intent_and_tables(COST_QUESTION)
+    scores = score_columns(intent, tables)
+    budgeted = prune_schema(intent, tables)
+    unbudgeted = prune_schema(intent, tables, None)
+    for table, columns in unbudgeted["schema"].items():
+        assert all(scores[table][column] >= DEFAULT for column in columns)
+        assert set(budgeted["schema"][table]) <= set(columns)
+    assert unbudgeted["tokens_after"] > budgeted["token_budget"] >= budgeted["tokens_after"]
+
+
+def test_join_keys_survive_a_tiny_budget():
+    intent, tables = _intent_and_tables(COST_QUESTION)
+    scores = score_columns(intent, tables)
+    pruned = prune_schema(intent, tables, 1)["schema"]
+    for table, columns in scores.items():
+        assert [c for c, score in columns.items() if score == REQUIRED] == pruned[table]
@@ -0,0 +1,125 @@
+"""
+Typed stage outputs and the plain results built from them
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from cache import QueryCache
+from crew import NL2SQLCrew, validation_passed
+from mock_llm import MockChatModel
+from planner import parse_planner_response
+from stage_outputs import SQLOutput, StageOutputs, ValidationOutput, find_value, task_models
+
+COST_QUESTION = "What is the fully loaded cost per employee by department for Q1 2025?"
+
+
+@pytest.mark.parametrize("mode, speculative", [("direct", False), ("planner", False), ("planner", True)])
+def test_results_are_plain_json(mode, speculative):
+    crew = NL2SQLCrew(mode=mode, llm=MockChatModel(), speculative=speculative)
+    results = crew.run(COST_QUESTION)
+    
+    assert results["status"] == "success"
+    assert "outputs" not in results
+    assert type(results["pipeline_output"]) is dict
+    assert all(isinstance(text, str) for text in results["pipeline_output"].values())
+    assert json.loads(json.dumps(results))["final_sql"] == results["final_sql"]
+    assert json.loads(results["pipeline_output"]["sql_generation"])["sql"] == results["final_sql"]
+
+
+def test_cached_results_are_plain_json():
+    crew = NL2SQLCrew(mode="direct", cache=QueryCache())
+    crew.run(COST_QUESTION)
+    results = crew.run(COST_QUESTION)
+    assert results["mode"] == "cache"
+    json.dumps(results)
+
+
+def test_crew_outputs_come_from_exported_models():
+    models = task_models()
+    exported = {
+        "intent": models["intent"].model_validate_json('{"metric_type": "headcount_movement", "extra": 1}'),
+        "tables": models["tables"].model_validate_json('{"tables": ["a_personnel_headcount"]}'),
+        "schema": models["schema"].model_validate_json('{"columns": {"a_personnel_headcount": ["headcount"]}}'),
+        "sql_generation": models["sql_generation"].model_validate_json('{"sql": "SELECT ?", "parameters": [1]}'),
+        # CrewAI leaves the text in place of an answer it could not convert
+        "validation": "The query looks fine to me"
+    }
+    raw = {stage: str(value) for stage, value in exported.items()}
+    outputs = StageOutputs.from_crew(exported, raw)
+    
+    assert outputs.intent["metric_type"] == "headcount_movement" and outputs.intent["extra"] == 1
+    assert outputs.tables == ["a_personnel_headcount"]
+    assert outputs.schema == {"a_personnel_headcount": ["headcount"]}
+    assert outputs.sql_generation.sql == "SELECT ?" and outputs.sql_generation.parameters == [1]
+    assert outputs.validation is None
+    assert outputs.pipeline_output()["validation"] == "The query looks fine to me"
+
+
+def test_unconverted_crew_stages_are_read_from_their_text():
+    models = task_models()
+    replies = {
+        "intent": 'Intent: {"metric_type": "salary", "scenario": null}',
+        "tables": 'I picked {"tables": ["a_personnel_details"]} for this',
+        "schema": "Keep department_id and amount",
+        "sql_generation": "```sql\nSELECT amount FROM a_personnel_details;\n```",
+        "validation": '{"is_valid": false, "issues": ["Missing scenario filter"], "recommendations": []}'
+    }
+    tasks = [SimpleNamespace(output=SimpleNamespace(exported_output=text, raw_output=text)) for text in replies.values()]
+    outputs = NL2SQLCrew._crew_outputs(tasks)
+    
+    assert outputs.intent == models["intent"](metric_type="salary").model_dump()
+    assert outputs.tables == ["a_personnel_details"]
+    assert outputs.schema is None
+    assert outputs.sql_generation.sql == "SELECT amount FROM a_personnel_details"
+    assert outputs.validation.issues == ["Missing scenario filter"]
+
+
+def test_crew_stage_without_sql_stays_empty():
+    tasks = [SimpleNamespace(output=SimpleNamespace(exported_output=text, raw_output=text))
+             for text in ("{}", "{}", "{}", "I could not write the query", "Nothing to validate")]
+    outputs = NL2SQLCrew._crew_outputs(tasks)
+    assert outputs.sql_generation.sql is None and outputs.validation is None
+
+
+@pytest.mark.parametrize("text", ["Here: {{}} SELECT 1", "x {[1]: 2} SELECT 1", "[" * 1100 + "]" * 1100 + " SELECT 1"],
+                         ids=["nested-dict-key", "list-key", "too-deep"])
+def test_unbuildable_literals_do_not_stop_the_scan(text):
+    assert find_value(text, dict, "sql") is None
+    assert parse_planner_response(text)["sql"].startswith("SELECT 1")
+    assert find_value(text + ' {"sql": "SELECT 2"}', dict, "sql") == {"sql": "SELECT 2"}
+
+
+def test_planner_survives_brace_bearing_replies():
+    class BraceLLM:
+        def invoke(self, prompt, **kwargs):
+            return "Here: {{}} SELECT 1"
+    
+    results = NL2SQLCrew(mode="planner", llm=BraceLLM()).run(COST_QUESTION)
+    assert results["final_sql"] == "SELECT 1"
+    assert results["status"] == "success"
+
+
+def test_replaced_stage_renders_its_value():
+    outputs = StageOutputs(None, None, None, SQLOutput.parse("SELECT 1"), None, {"sql_generation": "SELECT 1"})
+    outputs.replace("validation", ValidationOutput(True, [], [], None, None))
+    assert json.loads(outputs.pipeline_output()["validation"]) == {
+        "is_valid": True, "issues": [], "recommendations": []
+    }
+
+
+def test_planner_reply_parsing():
+    reply = 'Here you go:\n```json\n{"sql": "SELECT a FROM t WHERE b = ?", "parameters": [2]}\n```'
+    assert SQLOutput.parse(reply).to_dict()["parameters"] == [2]
+    assert SQLOutput.parse("The answer is\nSELECT a FROM t;").sql == "SELECT a FROM t"
+    assert SQLOutput.parse("No idea").sql is None
+    with pytest.raises(ValueError):
+        SQLOutput.from_dict({"sql": "SELECT 1", "parameters": "1"})
+
+
+def test_validation_passed():
+    assert validation_passed({"is_valid": True, "issues": []})
+    assert not validation_passed({"is_valid": "yes"})
+    assert not validation_passed(None)
+    assert not validation_passed("is_valid is not false")
@@ -0,0 +1,54 @@
+"""
+Metric templates compiled into parameterized statements
+"""
+import pytest
+
+from statements import compile_metric_template, compile_template, render_sql, time_window_values
+
+TEMPLATE = "fully_loaded_cost_per_employee"
+
+
+def test_scenario_literals_become_bound_constants():
+    statement = compile_metric_template(TEMPLATE, "current_year_totals", True)
+    assert "'actual'" not in statement.sql and "CURRENT_DATE" not in statement.sql
+    assert "pd.fiscal_year = ? AND pd.plan_version_name IN (?, ?)" in statement.sql
+    assert "ap.fiscal_quarter = ?" in statement.sql
+    assert statement.parameters == ("current_year", "scenario_0", "scenario_1", "year", "quarter")
+    assert statement.bind(year=2024, quarter=2, current_year=2025) == [2025, "actual", "forecast", 2024, 2]
+
+
+def test_statements_are_compiled_once_per_variant():
+    statement = compile_metric_template(TEMPLATE, "historical_actuals_only", True)
+    assert compile_metric_template(TEMPLATE, "historical_actuals_only", True) is statement
+    assert compile_metric_template(TEMPLATE, "historical_actuals_only", False).sql != statement.sql
+
+
+def test_bind_reports_missing_parameters():
+    with pytest.raises(ValueError, match="quarter"):
+        compile_metric_template(TEMPLATE, None, True).bind(year=2025)
+
+
+def test_quarter_filter_needs_the_period_join():
+    with pytest.raises(ValueError, match="m_accounting_period"):
+        compile_template("SELECT SUM(pd.amount) FROM a_personnel_details pd WHERE {scenario_filter} AND pd.fiscal_year = {year}",
+                         with_quarter=True)
+
+
+def test_one_statement_text_serves_every_period(synthetic_backend):
+    statement = compile_metric_template(TEMPLATE, None, True)
+    with synthetic_backend.connection() as conn:
+        first = conn.execute(statement.sql, statement.bind(year=2025, quarter=1)).fetchall()
+        second = conn.execute(statement.sql, statement.bind(year=2025, quarter=2)).fetchall()
+    assert first and second and first != second
+
+
+def test_time_window_values():
+    assert time_window_values("Q3 2024") == {"year": 2024, "quarter": 3}
+    assert time_window_values("FY2023") == {"year": 2023}
+    assert time_window_values(None) == {"year": 2025}
+
+
+def test_render_sql_inlines_values_outside_string_literals():
+    sql = "SELECT * FROM t WHERE a = ? AND b = ? AND c = '?'"
+    assert render_sql(sql, ["it's", None]) == "SELECT * FROM t WHERE a = 'it''s' AND b = NULL AND c = '?'"
+    assert render_sql(sql, []) == sql
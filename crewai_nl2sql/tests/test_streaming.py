@@ -0,0 +1,70 @@
+"""
+Streaming query execution in bounded batches
+"""
+import asyncio
+import types
+
+import pytest
+
+from main import NL2SQLApp
+
+SQL = "SELECT employee_id, amount FROM a_personnel_details ORDER BY rowid"
+
+
+@pytest.fixture
+def app(synthetic_backend):
+    return NL2SQLApp(mode="direct", backend=synthetic_backend, result_batch_size=40)
+
+
+def test_rows_arrive_in_batches_up_to_the_limit(app):
+    batches = app.stream_query(SQL, max_rows=100)
+    assert next(batches) == ["employee_id", "amount"]
+    assert [len(rows) for rows in batches] == [40, 40, 20]
+
+
+def test_parameters_are_bound(app):
+    batches = app.stream_query("SELECT COUNT(*) FROM a_personnel_details WHERE amount > ?", parameters=[0])
+    next(batches)
+    (count,), = next(batches)
+    assert count > 0
+
+
+def test_connection_returns_to_the_pool_when_the_stream_is_closed(app, synthetic_backend):
+    batches = app.stream_query(SQL)
+    next(batches)
+    next(batches)
+    batches.close()
+    stats = synthetic_backend.pool.stats()
+    assert stats["idle"] == stats["open"]
+
+
+def _row_count(app):
+    with app.backend.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM a_personnel_details").fetchone()[0]
+
+
+def test_limit_is_reported_only_when_rows_were_dropped(app, capsys):
+    total = _row_count(app)
+    app._execute_sql(SQL, max_rows=total)
+    output = capsys.readouterr().out
+    assert f"Query returned {total} rows" in output
+    assert "row limit" not in output
+    
+    app._execute_sql(SQL, max_rows=total - 1)
+    output = capsys.readouterr().out
+    assert f"Query returned {total - 1} rows" in output
+    assert f"Output stopped at the {total - 1} row limit" in output
+
+
+def test_async_results_are_rendered_as_they_stream(app, monkeypatch):
+    rendered = []
+    
+    def render(columns, batches, max_rows=None):
+        rendered.append(isinstance(batches, types.GeneratorType))
+        for _ in batches:
+            pass
+    
+    monkeypatch.setattr(app, "_render_result", render)
+    results = asyncio.run(app.aprocess_query("What is the benefits ratio by location?"))
+    assert results["status"] == "success"
+    assert rendered == [True]
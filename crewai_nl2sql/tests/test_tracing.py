@@ -0,0 +1,116 @@
+"""
+Per-stage tracing and its JSON lines and Prometheus exports
+"""
+import json
+import threading
+import uuid
+
+import pytest
+
+from crew import NL2SQLCrew
+from mock_llm import MockChatModel
+from tracing import STAGES, Tracer, timed_tool
+
+
+@timed_tool
+def _tool(fail=False):
+    if fail:
+        raise ValueError("bad input")
+    return "ok"
+
+
+def test_tool_calls_count_against_the_open_stage():
+    tracer = Tracer()
+    tracer.begin("q", "direct")
+    with tracer.stage("tables"):
+        _tool()
+        with pytest.raises(ValueError):
+            _tool(fail=True)
+    _tool()
+    trace = tracer.end("success")
+    assert list(trace.stages) == ["tables"]
+    assert trace.stages["tables"].tool_calls == 2
+    assert trace.stages["tables"].retries == 1
+    assert trace.stages["tables"].wall_time >= trace.stages["tables"].tool_time > 0
+
+
+def test_task_callback_advances_through_the_stages():
+    tracer = Tracer()
+    tracer.begin("q", "crew")
+    tracer.start_stages()
+    for _ in STAGES:
+        tracer.task_callback()
+    assert list(tracer.end("success").stages) == list(STAGES)
+
+
+def test_callback_handler_records_reported_and_estimated_tokens():
+    from langchain_core.outputs import Generation, LLMResult
+    
+    tracer = Tracer()
+    handler = tracer.callback_handler()
+    tracer.begin("q", "planner")
+    with tracer.stage("sql_generation"):
+        run_id = uuid.uuid4()
+        handler.on_llm_start({}, ["write the query"], run_id=run_id)
+        handler.on_llm_end(LLMResult(generations=[[Generation(text="SELECT 1")]],
+                                     llm_output={"token_usage": {"prompt_tokens": 11, "completion_tokens": 3}}),
+                           run_id=run_id)
+        run_id = uuid.uuid4()
+        handler.on_llm_start({}, ["write the query"], run_id=run_id)
+        handler.on_llm_end(LLMResult(generations=[[Generation(text="SELECT 1")]]), run_id=run_id)
+        handler.on_llm_error(RuntimeError("rate limited"), run_id=uuid.uuid4())
+    stage = tracer.end("success").stages["sql_generation"]
+    assert stage.llm_calls == 3 and stage.retries == 1
+    assert stage.prompt_tokens > 11 and stage.completion_tokens > 3
+    assert stage.tokens_estimated
+
+
+def test_stages_on_other_threads_land_in_the_scheduling_trace():
+    tracer = Tracer()
+    tracer.begin("q", "planner")
+    worker = threading.Thread(target=tracer.wrap_stage("schema", _tool))
+    worker.start()
+    worker.join()
+    trace = tracer.end("success")
+    assert trace.stages["schema"].tool_calls == 1
+
+
+def test_work_after_the_trace_ended_is_not_recorded():
+    tracer = Tracer()
+    tracer.begin("q", "planner")
+    late = tracer.wrap_stage("validation", _tool)
+    trace = tracer.end("success")
+    late()
+    assert "validation" not in trace.stages
+
+
+def test_exports(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(max_traces=1, path=str(path))
+    for status in ("success", "error"):
+        tracer.begin("q", "direct")
+        with tracer.stage("intent"):
+            pass
+        tracer.record_repairs(2)
+        tracer.end(status)
+    
+    assert [json.loads(line)["status"] for line in path.read_text().splitlines()] == ["success", "error"]
+    assert [json.loads(line)["status"] for line in tracer.to_jsonl().splitlines()] == ["error"]
+    
+    metrics = tracer.prometheus_text()
+    assert 'nl2sql_queries_total{mode="direct",status="success"} 1' in metrics
+    assert 'nl2sql_repairs_total{mode="direct"} 4' in metrics
+    assert 'nl2sql_stage_duration_seconds_count{stage="intent"} 2' in metrics
+    assert 'nl2sql_stage_duration_seconds_bucket{stage="intent",le="+Inf"} 2' in metrics
+
+
+def test_shared_llm_is_not_changed_by_tracing():
+    llm = MockChatModel()
+    crews = [NL2SQLCrew(mode="planner", llm=llm) for _ in range(2)]
+    results = [crew.run("What is the benefits ratio by location?") for crew in crews]
+    
+    assert llm.callbacks is None
+    for crew, result in zip(crews, results):
+        assert crew.agents.llm is not llm
+        assert len(crew.agents.llm.callbacks) == 1
+        assert sum(stage["llm_calls"] for stage in result["trace"]["stages"]) == 1
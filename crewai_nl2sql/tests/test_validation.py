@@ -0,0 +1,70 @@
+"""
+validate_sql checks over the parsed query structure
+"""
+from sample_schema import SAMPLE_SCHEMA
+from sql_parser import parse_sql
+from tools import validate_sql
+
+TABLES = ["a_personnel_details", "m_department"]
+
+JOINED_SQL = """
+SELECT d.department_name, SUM(pd.amount) AS total_amount
+FROM a_personnel_details pd
+JOIN m_department d ON pd.department_id = d.department_id
+WHERE pd.plan_version_name = 'actual'
+GROUP BY d.department_name
+"""
+
+CTE_SQL = """
+WITH actuals AS (
+    SELECT pd.department_id, pd.amount
+    FROM a_personnel_details pd
+    WHERE pd.plan_version_name = 'actual'
+)
+SELECT d.department_name, SUM(a.amount) AS total_amount
+FROM actuals a
+JOIN m_department d ON a.department_id = d.department_id
+GROUP BY d.department_name
+"""
+
+
+def _issues(sql, tables=TABLES):
+    return validate_sql.func(sql, tables, SAMPLE_SCHEMA)["issues"]
+
+
+def test_correct_join_is_valid():
+    assert _issues(JOINED_SQL) == []
+
+
+def test_join_on_the_wrong_partner_column_is_reported():
+    sql = JOINED_SQL.replace("pd.department_id = d.department_id", "pd.location_id = d.department_id")
+    assert "Missing proper join condition for department" in _issues(sql)
+
+
+def test_join_using_counts_as_join_condition():
+    sql = JOINED_SQL.replace("ON pd.department_id = d.department_id", "USING (department_id)")
+    assert _issues(sql) == []
+
+
+def test_scenario_filter_inside_cte_satisfies_where_check():
+    assert "Missing WHERE clause for scenario filter" not in _issues(CTE_SQL)
+    assert parse_sql(CTE_SQL).scope_where_terms == [["pd.plan_version_name = 'actual'"]]
+    assert parse_sql(CTE_SQL).where_terms == []
+
+
+def test_query_without_any_where_is_reported():
+    sql = JOINED_SQL.replace("WHERE pd.plan_version_name = 'actual'", "")
+    assert "Missing WHERE clause for scenario filter" in _issues(sql)
+
+
+def test_unknown_characters_are_issues_not_parse_errors():
+    sql = JOINED_SQL.replace("pd.plan_version_name = 'actual'", "pd.amount ≥ 0")
+    query = parse_sql(sql)
+    assert query.errors == []
+    assert query.unknown_tokens == ["≥"]
+    assert _issues(sql) == ["Unsupported character '≥' in query"]
+
+
+def test_unknown_column_is_reported():
+    sql = JOINED_SQL.replace("SUM(pd.amount)", "SUM(pd.salary)")
+    assert "Column 'salary' does not exist in 'a_personnel_details'" in _issues(sql)
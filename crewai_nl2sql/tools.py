@@ -3,9 +3,127 @@ Tools for CrewAI NL2SQL Agents
 """
 import json
 import re
-from typing import Dict, List, Any, Tuple
-from crewai_tools import tool
-from sample_schema import SAMPLE_SCHEMA, DATA_RULES, METRIC_TEMPLATES
+from typing import Dict, List, Any, Optional, Tuple
+from sample_schema import SAMPLE_SCHEMA, DATA_RULES, METRIC_TEMPLATES, INTENT_RULES
+from materialized import aggregate_route, compile_aggregate_template
+from schema_index import SCHEMA_INDEX
+from schema_pruner import DEFAULT_COLUMNS, DEFAULT_TOKEN_BUDGET, prune_schema
+from sql_parser import parse_sql
+from tracing import timed_tool
+from statements import (
+    CompiledStatement,
+    compile_metric_template,
+    parameterize_filter,
+    scenario_filter_sql,
+    time_window_values,
+    to_qmark
+)
+
+
+class LazyTool:
+    """
+    Plain function that becomes a CrewAI tool only when an agent needs it
+    
+    Importing crewai_tools pulls in crewai and langchain, so the tools stay
+    ordinary callables (also reachable as .func, like a CrewAI Tool) until
+    as_tool() is called while building an agent. Calls through the tool or
+    the LazyTool itself count as tool time in the active trace.
+    """
+    
+    def __init__(self, name: str, func):
+        self.name = name
+        self.func = func
+        self.__doc__ = func.__doc__
+        self._timed = timed_tool(func)
+        self._tool = None
+        
+    def __call__(self, *args, **kwargs):
+        return self._timed(*args, **kwargs)
+    
+    def as_tool(self):
+        """Return the crewai_tools Tool wrapping this function"""
+        if self._tool is None:
+            from crewai_tools import tool as crewai_tool
+            self._tool = crewai_tool(self.name)(self._timed)
+        return self._tool
+
+
+def tool(name: str):
+    """Decorator registering a function as a lazily built CrewAI tool"""
+    return lambda func: LazyTool(name, func)
+
+
+class PhraseMatcher:
+    """
+    Finds every phrase from a fixed vocabulary in a single regex scan
+    
+    The phrases are folded into a character trie and emitted as one
+    alternation, so lookups cost the same whether the table holds ten
+    synonyms or several hundred.
+    """
+    
+    def __init__(self, phrases: List[str]):
+        phrases = sorted(set(phrases))
+        # A match only reports the longest phrase at each position, so keep
+        # track of the shorter phrases it also contains as a prefix
+        self._prefixes = {
+            phrase: [other for other in phrases if phrase.startswith(other)]
+            for phrase in phrases
+        }
+        trie = {}
+        for phrase in phrases:
+            node = trie
+            for char in phrase:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        # The lookahead lets matches overlap, mirroring plain substring checks
+        self._pattern = re.compile(f"(?=({self._trie_to_pattern(trie)}))")
+        
+    @classmethod
+    def _trie_to_pattern(cls, node: Dict[str, Any]) -> str:
+        branches = [
+            re.escape(char) + cls._trie_to_pattern(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        pattern = f"(?:{'|'.join(branches)})"
+        return pattern + "?" if "" in node else pattern
+    
+    def find(self, text: str) -> set:
+        """Return the set of phrases occurring anywhere in text"""
+        found = set()
+        for match in self._pattern.finditer(text):
+            found.update(self._prefixes[match.group(1)])
+        return found
+
+
+def _rule_phrases(phrases) -> List[str]:
+    return [phrase for rule in phrases for phrase in (rule if isinstance(rule, tuple) else (rule,))]
+
+
+INTENT_MATCHER = PhraseMatcher([
+    phrase
+    for rules in INTENT_RULES.values()
+    for _, phrases in rules
+    for phrase in _rule_phrases(phrases)
+])
+QUARTER_PATTERN = re.compile(r'q([1-4])\s*(\d{4})?')
+YEAR_PATTERN = re.compile(r'\b(20\d{2})\b')
+
+
+def _resolve_rule(rules, found: set):
+    """Return the value of the first rule with a phrase present in found"""
+    for value, phrases in rules:
+        for phrase in phrases:
+            if isinstance(phrase, tuple):
+                if found.issuperset(phrase):
+                    return value
+            elif phrase in found:
+                return value
+    return None
 
 
 @tool("Intent Classifier")
@@ -28,36 +146,18 @@ def classify_intent(question: str) -> Dict[str, Any]:
     }
     
     question_lower = question.lower()
+    found = INTENT_MATCHER.find(question_lower)
     
-    # Detect metric type
-    if "fully loaded cost" in question_lower or "total cost" in question_lower:
-        intent["metric_type"] = "fully_loaded_cost"
-    elif "benefits" in question_lower and "ratio" in question_lower:
-        intent["metric_type"] = "benefits_ratio"
-    elif "headcount" in question_lower or "movement" in question_lower:
-        intent["metric_type"] = "headcount_movement"
-    elif "salary" in question_lower:
-        intent["metric_type"] = "salary"
-    
-    # Detect scenario
-    if "current year" in question_lower or "to date" in question_lower:
-        intent["scenario"] = "current_year_totals"
-    elif "budget" in question_lower:
-        intent["scenario"] = "budget_vs_actual"
-    elif "forecast" in question_lower:
-        intent["scenario"] = "current_year_totals"
-        
-    # Detect aggregation level
-    if "per employee" in question_lower or "by employee" in question_lower:
-        intent["aggregation_level"] = "employee_level"
-    elif "department" in question_lower:
-        intent["aggregation_level"] = "department"
-    elif "location" in question_lower or "by location" in question_lower:
-        intent["aggregation_level"] = "location"
+    # Detect metric type, scenario and aggregation level
+    intent["metric_type"] = _resolve_rule(INTENT_RULES["metric_type"], found)
+    intent["scenario"] = _resolve_rule(INTENT_RULES["scenario"], found) or intent["scenario"]
+    intent["aggregation_level"] = (
+        _resolve_rule(INTENT_RULES["aggregation_level"], found) or intent["aggregation_level"]
+    )
         
     # Detect time window
-    quarter_match = re.search(r'q([1-4])\s*(\d{4})?', question_lower)
-    year_match = re.search(r'\b(20\d{2})\b', question_lower)
+    quarter_match = QUARTER_PATTERN.search(question_lower)
+    year_match = YEAR_PATTERN.search(question_lower)
     
     if quarter_match:
         quarter = quarter_match.group(1)
@@ -67,16 +167,25 @@ def classify_intent(question: str) -> Dict[str, Any]:
         intent["time_window"] = year_match.group(1)
     
     # Detect currency
-    if "inr" in question_lower or "rupees" in question_lower:
-        intent["requires_currency_conversion"] = True
-        intent["target_currency"] = "INR"
-    elif "usd" in question_lower or "dollars" in question_lower:
+    target_currency = _resolve_rule(INTENT_RULES["target_currency"], found)
+    if target_currency:
         intent["requires_currency_conversion"] = True
-        intent["target_currency"] = "USD"
+        intent["target_currency"] = target_currency
         
     return intent
 
 
+# Fact table and metric specific lookup tables for each metric type
+METRIC_TABLES = {
+    "fully_loaded_cost": ["a_personnel_details", "master_rollup_mapping_details"],
+    "benefits_ratio": ["a_personnel_details", "master_rollup_mapping_details"],
+    "salary": ["a_personnel_details"],
+    "headcount_movement": ["a_personnel_headcount"]
+}
+
+MASTER_TABLES = ["m_department", "m_location", "m_accounting_period"]
+
+
 @tool("Table Selector")
 def select_tables(intent: Dict[str, Any]) -> List[str]:
     """
@@ -88,89 +197,56 @@ def select_tables(intent: Dict[str, Any]) -> List[str]:
     Returns:
         List of table names needed for the query
     """
-    tables = []
-    
-    # Core table selection based on metric
-    if intent["metric_type"] in ["fully_loaded_cost", "salary", "benefits_ratio"]:
-        tables.append("a_personnel_details")
-    
-    if intent["metric_type"] == "headcount_movement":
-        tables.append("a_personnel_headcount")
+    # Core fact table plus metric specific lookups
+    tables = list(METRIC_TABLES.get(intent["metric_type"], []))
         
     # Add GL summary if needed
     if intent.get("include_gl_reconciliation"):
         tables.append("a_personnel_summary")
         
     # Always add master tables
-    tables.extend(["m_department", "m_location", "m_accounting_period"])
-    
-    # Add rollup mapping for cost categories
-    if intent["metric_type"] in ["fully_loaded_cost", "benefits_ratio"]:
-        tables.append("master_rollup_mapping_details")
+    tables.extend(MASTER_TABLES)
         
-    # Add currency master if conversion needed
-    if intent.get("requires_currency_conversion"):
+    # Add currency master if conversion needed and a selected table carries currency_id
+    if intent.get("requires_currency_conversion") and any(
+        "currency_master" in SCHEMA_INDEX.edges[table] for table in tables
+    ):
         tables.append("currency_master")
         
-    return list(set(tables))  # Remove duplicates
+    # Add any bridging tables needed to join everything together
+    return SCHEMA_INDEX.connected_tables(list(dict.fromkeys(tables)))
 
 
 @tool("Column Pruner")
-def prune_columns(tables: List[str]) -> Dict[str, List[str]]:
+def prune_columns(tables: List[str], intent: Optional[Dict[str, Any]] = None,
+                  token_budget: Optional[int] = DEFAULT_TOKEN_BUDGET) -> Dict[str, List[str]]:
     """
     Select only necessary columns from each table
     
     Args:
         tables: List of table names
+        intent: Optional intent metadata used to score column relevance
+        token_budget: Maximum prompt tokens for the pruned schema when intent is given
         
     Returns:
         Dict mapping table names to list of columns to keep
     """
+    if intent is not None:
+        return prune_schema(intent, tables, token_budget)["schema"]
+        
     pruned_schema = {}
     
-    # Define columns to keep for each table
-    column_rules = {
-        "a_personnel_details": [
-            "employee_id", "department_id", "location_id", 
-            "accounting_period", "amount", "currency_id",
-            "category", "category_rollup", "closed",
-            "plan_version_name", "fiscal_year"
-        ],
-        "a_personnel_headcount": [
-            "employee_id", "department_id", "location_id",
-            "accounting_period", "headcount", "movement_type",
-            "fiscal_year"
-        ],
-        "a_personnel_summary": [
-            "department_id", "location_id", "accounting_period",
-            "total_amount", "currency_id", "category_rollup",
-            "plan_version_name", "headcount", "fiscal_year"
-        ],
-        "m_department": ["department_id", "department_name"],
-        "m_location": ["location_id", "location_name", "country"],
-        "m_accounting_period": [
-            "period_id", "name", "fiscal_year", 
-            "fiscal_quarter", "fiscal_month"
-        ],
-        "master_rollup_mapping_details": [
-            "category", "category_rollup", "rollup_level_1",
-            "is_compensation", "requires_negation"
-        ],
-        "currency_master": [
-            "currency_id", "conversion_rate_to_usd"
-        ]
-    }
-    
     for table in tables:
-        if table in column_rules:
-            pruned_schema[table] = column_rules[table]
+        if table in DEFAULT_COLUMNS:
+            pruned_schema[table] = DEFAULT_COLUMNS[table]
             
     return pruned_schema
 
 
 @tool("SQL Generator")
 def generate_sql(intent: Dict[str, Any], tables: List[str], 
-                pruned_schema: Dict[str, List[str]]) -> Dict[str, Any]:
+                pruned_schema: Dict[str, List[str]],
+                aggregates: Optional[List[str]] = None) -> Dict[str, Any]:
     """
     Generate SQL query based on intent and schema
     
@@ -178,37 +254,31 @@ def generate_sql(intent: Dict[str, Any], tables: List[str],
         intent: Intent metadata
         tables: Selected tables
         pruned_schema: Pruned column schema
+        aggregates: Materialized aggregates that are built and current; a
+            template one of them answers is routed to it
         
     Returns:
-        Dict with SQL query and reasoning
+        Dict with the SQL query (? placeholders), its bound parameters and
+        reasoning. Routed queries also carry "materialized" and the "tables"
+        they read.
     """
     # Check if we have a template
     if intent["metric_type"] in ["fully_loaded_cost", "headcount_movement"]:
         template_key = f"{intent['metric_type']}_per_employee" if intent["aggregation_level"] == "employee_level" else intent["metric_type"]
         
         if template_key in METRIC_TEMPLATES:
-            sql_template = METRIC_TEMPLATES[template_key]
-            
-            # Apply scenario filter
-            scenario_filter = DATA_RULES["scenario_filters"].get(
-                intent["scenario"], 
-                DATA_RULES["scenario_filters"]["historical_actuals_only"]
-            )["filter"]
+            # Templates are compiled once per scenario; year, quarter and
+            # scenario values are bound rather than inlined
+            values = time_window_values(intent.get("time_window"))
+            aggregate = aggregate_route(template_key, aggregates)
+            if aggregate:
+                statement = compile_aggregate_template(aggregate, template_key, intent["scenario"], "quarter" in values)
+            else:
+                statement = compile_metric_template(template_key, intent["scenario"], "quarter" in values)
             
-            # Extract year from time window
-            year = "2025"  # Default
-            if intent.get("time_window"):
-                year_match = re.search(r'20\d{2}', intent["time_window"])
-                if year_match:
-                    year = year_match.group()
-            
-            sql = sql_template.format(
-                scenario_filter=scenario_filter,
-                year=year
-            )
-            
-            return {
-                "sql": sql.strip(),
+            result = {
+                "sql": statement.sql,
+                "parameters": statement.bind(**values),
                 "decisions": {
                     "negation": "applied" if intent["metric_type"] == "fully_loaded_cost" else "not_applied",
                     "scenario": intent["scenario"],
@@ -217,6 +287,11 @@ def generate_sql(intent: Dict[str, Any], tables: List[str],
                 },
                 "notes": f"Generated from template for {intent['metric_type']}"
             }
+            if aggregate:
+                result["materialized"] = aggregate
+                result["tables"] = sorted({ref.name for ref in parse_sql(statement.sql).tables})
+                result["notes"] += f", answered from materialized aggregate {aggregate}"
+            return result
     
     # If no template, build basic query
     return build_custom_sql(intent, tables, pruned_schema)
@@ -228,6 +303,7 @@ def build_custom_sql(intent: Dict[str, Any], tables: List[str],
     
     # Start with basic SELECT
     main_table = "a_personnel_details" if "a_personnel_details" in tables else tables[0]
+    main_alias = SCHEMA_INDEX.alias(main_table)
     
     sql_parts = {
         "select": [],
@@ -254,38 +330,30 @@ def build_custom_sql(intent: Dict[str, Any], tables: List[str],
     else:
         sql_parts["select"].append("SUM(pd.amount) as total_amount")
     
-    # Build JOINs
-    if "m_department" in tables:
-        sql_parts["joins"].append(
-            f"JOIN m_department d ON {main_table}.department_id = d.department_id"
-        )
-    if "m_location" in tables:
-        sql_parts["joins"].append(
-            f"JOIN m_location l ON {main_table}.location_id = l.location_id"
-        )
-    if "m_accounting_period" in tables:
-        sql_parts["joins"].append(
-            f"JOIN m_accounting_period ap ON {main_table}.accounting_period = ap.name"
-        )
+    # Build JOINs from the precomputed join graph
+    sql_parts["joins"] = SCHEMA_INDEX.join_clauses(
+        main_table, [table for table in tables if table != main_table]
+    )
         
     # Build WHERE clause
-    scenario_filter = DATA_RULES["scenario_filters"].get(
-        intent["scenario"], 
-        DATA_RULES["scenario_filters"]["historical_actuals_only"]
-    )["filter"]
+    scenario_filter, constants = parameterize_filter(
+        scenario_filter_sql(intent["scenario"]), main_alias, main_table
+    )
     sql_parts["where"].append(scenario_filter)
     
     # Construct final SQL
     sql = f"""
 SELECT {', '.join(sql_parts['select'])}
-FROM {sql_parts['from']} {main_table[0:2]}
+FROM {sql_parts['from']} {main_alias}
 {' '.join(sql_parts['joins'])}
 WHERE {' AND '.join(sql_parts['where'])}
 {f"GROUP BY {', '.join(sql_parts['group_by'])}" if sql_parts['group_by'] else ""}
     """.strip()
+    sql, names = to_qmark(sql)
     
     return {
         "sql": sql,
+        "parameters": CompiledStatement(sql, names, tuple(constants.items())).bind(),
         "decisions": {
             "negation": "applied" if intent["metric_type"] == "fully_loaded_cost" else "not_applied",
             "scenario": intent["scenario"],
@@ -297,7 +365,8 @@ WHERE {' AND '.join(sql_parts['where'])}
 
 
 @tool("SQL Validator")
-def validate_sql(sql: str, tables: List[str], schema: Dict[str, Any]) -> Dict[str, Any]:
+def validate_sql(sql: str, tables: List[str], schema: Dict[str, Any],
+                 cost_checker=None, parameters: Optional[List[Any]] = None) -> Dict[str, Any]:
     """
     Validate generated SQL for correctness
     
@@ -305,47 +374,110 @@ def validate_sql(sql: str, tables: List[str], schema: Dict[str, Any]) -> Dict[st
         sql: SQL query to validate
         tables: Expected tables
         schema: Full schema definition
+        cost_checker: Optional CostChecker that explains the query on the
+            execution database; its problems become issues or warnings
+            depending on its policy
+        parameters: Values bound to ? placeholders in the SQL
         
     Returns:
-        Dict with validation status and issues
+        Dict with validation status and issues, plus cost and warnings when
+        a cost checker is given
     """
     issues = []
-    sql_lower = sql.lower()
+    query = parse_sql(sql)
+    if query.errors:
+        issues.extend(f"SQL could not be parsed: {error}" for error in query.errors)
+    for token in dict.fromkeys(query.unknown_tokens):
+        issues.append(f"Unsupported character {token!r} in query")
+        
+    referenced = {ref.name for ref in query.tables}
+    
+    def table_columns(table):
+        info = schema.get(table) if isinstance(schema, dict) else None
+        return info.get("columns", {}) if isinstance(info, dict) else None
     
     # Check 1: All expected tables are referenced
     for table in tables:
-        if table.lower() not in sql_lower:
+        if table.lower() not in referenced:
             issues.append(f"Expected table '{table}' not found in query")
             
     # Check 2: Join conditions exist
-    if "join" in sql_lower:
-        # Check for proper join conditions
-        if ".department_id = " not in sql_lower and "m_department" in tables:
-            issues.append("Missing proper join condition for department")
-        if ".location_id = " not in sql_lower and "m_location" in tables:
-            issues.append("Missing proper join condition for location")
-            
+    if len(referenced) > 1:
+        for table, key, label in (("m_department", "department_id", "department"),
+                                  ("m_location", "location_id", "location")):
+            partners = query.joins(table, key) if table in tables and table in referenced else None
+            if partners is not None and not any(partner.column == key for partner in partners):
+                issues.append(f"Missing proper join condition for {label}")
+                
     # Check 3: Period mapping
     if "m_accounting_period" in tables:
-        if ".accounting_period = " not in sql_lower or ".name" not in sql_lower:
+        partners = query.joins("m_accounting_period", "name")
+        if not any(partner.column == "accounting_period" for partner in partners):
             issues.append("Incorrect period mapping - should join on accounting_period = name")
             
     # Check 4: Scenario filter
-    if "where" not in sql_lower:
+    if not any(query.scope_where_terms):
         issues.append("Missing WHERE clause for scenario filter")
         
     # Check 5: Negation logic
-    if "fully_loaded_cost" in str(tables) and "case when" not in sql_lower:
+    if "fully_loaded_cost" in str(tables) and not query.has_case:
         issues.append("Missing negation logic for fully loaded cost calculation")
         
     # Check 6: No varchar to integer casts
-    if "cast(" in sql_lower and "as integer" in sql_lower:
-        issues.append("Avoid casting varchar to integer on name fields")
-        
-    return {
+    for columns, target in query.casts:
+        if not target.startswith("INT"):
+            continue
+        for column in columns:
+            column_type = (table_columns(query.resolve(column.qualifier)) or {}).get(column.column, "")
+            if not column.qualifier or column_type.upper().startswith("VARCHAR"):
+                issues.append(f"Avoid casting varchar to integer on name fields ({column})")
+                break
+                
+    # Check 7: Every table alias and column exists in the schema
+    for ref in query.tables:
+        if ref.name not in query.derived_tables and table_columns(ref.name) is None:
+            issues.append(f"Unknown table '{ref.name}'")
+    known_columns = set()
+    for table in referenced:
+        known_columns.update(table_columns(table) or {})
+    for column in dict.fromkeys(query.columns):
+        if column.qualifier is None:
+            if query.derived_tables or column.column in query.output_aliases:
+                continue
+            if known_columns and column.column not in known_columns:
+                issues.append(f"Unknown column '{column.column}'")
+            continue
+        table = query.resolve(column.qualifier)
+        if table is None:
+            issues.append(f"Unknown table alias '{column.qualifier}' in '{column}'")
+        elif table not in query.derived_tables:
+            columns = table_columns(table)
+            if columns is not None and column.column not in columns:
+                issues.append(f"Column '{column.column}' does not exist in '{table}'")
+                
+    # Check 8: Query plan cost on the execution database
+    cost = None
+    warnings = []
+    if cost_checker is not None:
+        cost = cost_checker.check(sql, parameters)
+        if cost["policy"] == "reject":
+            issues.extend(cost["problems"])
+        else:
+            warnings.extend(cost["problems"])
+            
+    result = {
         "is_valid": len(issues) == 0,
         "issues": issues,
         "recommendations": [
-            "Add missing join conditions" if "join" in i for i in issues
+            "Add missing join conditions" for i in issues if "join" in i
         ]
     }
+    if cost is not None:
+        result["warnings"] = warnings
+        result["cost"] = cost
+        advice = cost.get("index_advice") or {}
+        if advice.get("indexes") and not advice.get("created"):
+            result["recommendations"].extend(advice["indexes"])
+        elif cost["full_scans"]:
+            result["recommendations"].append("Add indexes for the fact table filters (see advise_indexes)")
+    return result
@@ -0,0 +1,371 @@
+"""
+Per-stage latency and token tracing for the NL2SQL pipeline
+"""
+import functools
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from schema_pruner import count_tokens
+
+# Pipeline stages in task order, shared by the crew and the direct path
+STAGES = ("intent", "tables", "schema", "sql_generation", "validation")
+
+# Upper bounds (seconds) of the Prometheus stage duration histogram
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Per-stage counters in the Prometheus dump: StageTrace field -> (metric, help)
+STAGE_COUNTERS = {
+    "llm_time": ("nl2sql_stage_llm_seconds_total", "Time spent waiting on the LLM per stage"),
+    "tool_time": ("nl2sql_stage_tool_seconds_total", "Time spent in tool calls per stage"),
+    "prompt_tokens": ("nl2sql_stage_prompt_tokens_total", "Prompt tokens sent per stage"),
+    "completion_tokens": ("nl2sql_stage_completion_tokens_total", "Completion tokens received per stage"),
+    "llm_calls": ("nl2sql_stage_llm_calls_total", "LLM calls per stage"),
+    "tool_calls": ("nl2sql_stage_tool_calls_total", "Tool calls per stage"),
+    "retries": ("nl2sql_stage_retries_total", "Failed LLM or tool calls that were retried per stage")
+}
+
+
+@dataclass
+class StageTrace:
+    """
+    Timings and token counts of one pipeline stage
+    
+    Attributes:
+        wall_time: Seconds from the stage starting to it finishing
+        llm_time: Seconds spent waiting on LLM responses
+        tool_time: Seconds spent inside tool functions
+        prompt_tokens / completion_tokens: As reported by the provider, or
+            counted locally when it reports none (tokens_estimated)
+        retries: LLM errors and failed tool calls, which the agent retries
+    """
+    stage: str
+    wall_time: float = 0.0
+    llm_time: float = 0.0
+    tool_time: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_calls: int = 0
+    tool_calls: int = 0
+    retries: int = 0
+    tokens_estimated: bool = False
+
+
+@dataclass
+class QueryTrace:
+    """All stage traces of one pipeline run"""
+    query: str
+    mode: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    status: Optional[str] = None
+    total_time: float = 0.0
+    repairs: int = 0
+    stages: Dict[str, StageTrace] = field(default_factory=dict)
+    
+    def stage(self, name: str) -> StageTrace:
+        if name not in self.stages:
+            self.stages[name] = StageTrace(name)
+        return self.stages[name]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["stages"] = [asdict(self.stages[name]) for name in self.stages]
+        return data
+
+
+# Tracer recording on each thread, found by tool wrappers shared across crews
+_active = threading.local()
+
+
+def timed_tool(func):
+    """Wrap a tool function so its calls count as tool time of the open stage"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        tracer = getattr(_active, "tracer", None)
+        stage = tracer.active_stage() if tracer is not None else None
+        if stage is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            stage.tool_time += time.perf_counter() - started
+            stage.tool_calls += 1
+            stage.retries += failed
+    return wrapper
+
+
+def _usage(response) -> Dict[str, int]:
+    """Token usage from a LangChain LLMResult, in either reporting style"""
+    usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    if usage:
+        return {"prompt_tokens": usage.get("prompt_tokens", 0), "completion_tokens": usage.get("completion_tokens", 0)}
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return {"prompt_tokens": metadata.get("input_tokens", 0), "completion_tokens": metadata.get("output_tokens", 0)}
+    return {}
+
+
+def _generated_text(response) -> str:
+    return "".join(
+        generation.text for generations in getattr(response, "generations", None) or [] for generation in generations
+    )
+
+
+class Tracer:
+    """
+    Collects a QueryTrace per pipeline run
+    
+    The trace being recorded is per thread, so concurrent runs on the async
+    API's worker threads don't mix. Stages are opened with stage() around
+    direct tool calls, or advanced by task_callback() as crew tasks finish.
+    LLM time and tokens arrive through callback_handler() on the chat model
+    and tool time through timed_tool(), both attributed to the open stage.
+    Finished traces are kept (up to max_traces), summed for prometheus_text()
+    and, with a path, appended to a JSON lines file.
+    
+    Args:
+        max_traces: Finished traces kept in memory for export
+        path: JSON lines file every finished trace is appended to
+    """
+    
+    def __init__(self, max_traces: int = 1000, path: Optional[str] = None):
+        self.path = path
+        self.traces = deque(maxlen=max_traces)
+        
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stage_totals = {}
+        self._histograms = {}
+        self._queries = {}
+        self._repairs = {}
+    
+    @property
+    def current(self) -> Optional[QueryTrace]:
+        """The trace being recorded on this thread"""
+        return getattr(self._local, "trace", None)
+    
+    def begin(self, query: str, mode: str) -> QueryTrace:
+        trace = QueryTrace(query, mode)
+        self._local.trace = trace
+        self._local.stage = None
+        self._local.stage_started = None
+        self._local.started = time.perf_counter()
+        _active.tracer = self
+        return trace
+    
+    def end(self, status: Optional[str], mode: Optional[str] = None) -> Optional[QueryTrace]:
+        """Finish this thread's trace and record it"""
+        trace = self.current
+        if trace is None:
+            return None
+        self._close_stage()
+        trace.total_time = time.perf_counter() - self._local.started
+        trace.status = status
+        if mode:
+            trace.mode = mode
+        self._local.trace = None
+        _active.tracer = None
+        
+        with self._lock:
+            self.traces.append(trace)
+            key = (trace.mode, trace.status or "unknown")
+            count, seconds = self._queries.get(key, (0, 0.0))
+            self._queries[key] = (count + 1, seconds + trace.total_time)
+            self._repairs[trace.mode] = self._repairs.get(trace.mode, 0) + trace.repairs
+            for stage in trace.stages.values():
+                totals = self._stage_totals.setdefault(stage.stage, dict.fromkeys(STAGE_COUNTERS, 0))
+                for name in STAGE_COUNTERS:
+                    totals[name] += getattr(stage, name)
+                buckets = self._histograms.setdefault(stage.stage, [0] * len(DURATION_BUCKETS) + [0, 0.0])
+                for index, bound in enumerate(DURATION_BUCKETS):
+                    if stage.wall_time <= bound:
+                        buckets[index] += 1
+                buckets[-2] += 1
+                buckets[-1] += stage.wall_time
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict()) + "\n")
+        return trace
+    
+    def _open_stage(self, name: str):
+        self._close_stage()
+        if self.current is not None and self.current.status is None:
+            self.current.stage(name)
+            self._local.stage = name
+            self._local.stage_started = time.perf_counter()
+    
+    def _close_stage(self):
+        trace = self.current
+        name = getattr(self._local, "stage", None)
+        if trace is not None and name is not None and trace.status is None:
+            trace.stage(name).wall_time += time.perf_counter() - self._local.stage_started
+        self._local.stage = None
+    
+    def active_stage(self) -> Optional[StageTrace]:
+        trace = self.current
+        name = getattr(self._local, "stage", None)
+        if trace is None or name is None or trace.status is not None:
+            # Work finishing after its trace ended (e.g. a losing speculative stage) is not recorded
+            return None
+        return trace.stage(name)
+    
+    @contextmanager
+    def stage(self, name: str):
+        """Time the with block as (part of) a stage of this thread's trace"""
+        previous = getattr(self._local, "stage", None)
+        self._open_stage(name)
+        try:
+            yield self.active_stage()
+        finally:
+            self._close_stage()
+            if previous is not None:
+                self._open_stage(previous)
+    
+    def wrap_stage(self, name: str, func):
+        """
+        Wrap func to run as stage name of this thread's trace on another thread
+        
+        Used by StageScheduler so stages on pool threads land in the trace of
+        the run that scheduled them.
+        """
+        trace = self.current
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            previous = getattr(self._local, "trace", None), getattr(_active, "tracer", None)
+            self._local.trace = trace
+            self._local.stage = None
+            _active.tracer = self
+            try:
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            finally:
+                self._local.trace, _active.tracer = previous
+        return wrapper
+    
+    def start_stages(self, first: str = STAGES[0]):
+        """Open the first crew stage as kickoff starts"""
+        self._open_stage(first)
+    
+    def task_callback(self, task_output=None):
+        """Crew task_callback: close the finished stage and open the next one"""
+        name = getattr(self._local, "stage", None)
+        self._close_stage()
+        if name in STAGES and STAGES.index(name) + 1 < len(STAGES):
+            self._open_stage(STAGES[STAGES.index(name) + 1])
+    
+    def record_repairs(self, count: int):
+        """Add repair attempts to this thread's trace"""
+        if self.current is not None and self.current.status is None:
+            self.current.repairs += count
+            
+    def record_llm(self, seconds: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+                   error: bool = False, estimated: bool = False):
+        """Add one LLM call to the open stage"""
+        stage = self.active_stage()
+        if stage is None:
+            return
+        stage.llm_time += seconds
+        stage.llm_calls += 1
+        stage.prompt_tokens += prompt_tokens
+        stage.completion_tokens += completion_tokens
+        stage.retries += error
+        stage.tokens_estimated = stage.tokens_estimated or estimated
+    
+    def callback_handler(self):
+        """LangChain callback handler feeding LLM latency and tokens into record_llm"""
+        from langchain_core.callbacks import BaseCallbackHandler
+        
+        tracer = self
+        
+        class TracingCallbackHandler(BaseCallbackHandler):
+            def __init__(self):
+                self._started = {}
+            
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self._started[run_id] = (time.perf_counter(), sum(count_tokens(prompt) for prompt in prompts))
+            
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                prompt = "".join(str(message.content) for batch in messages for message in batch)
+                self._started[run_id] = (time.perf_counter(), count_tokens(prompt))
+            
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                started, prompt_tokens = self._started.pop(run_id, (time.perf_counter(), 0))
+                usage = _usage(response)
+                if usage:
+                    tracer.record_llm(time.perf_counter() - started, usage["prompt_tokens"], usage["completion_tokens"])
+                else:
+                    tracer.record_llm(time.perf_counter() - started, prompt_tokens,
+                                      count_tokens(_generated_text(response)), estimated=True)
+            
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                started, _ = self._started.pop(run_id, (time.perf_counter(), 0))
+                tracer.record_llm(time.perf_counter() - started, error=True)
+        
+        return TracingCallbackHandler()
+    
+    def to_jsonl(self) -> str:
+        """The kept traces as JSON lines, oldest first"""
+        with self._lock:
+            traces = list(self.traces)
+        return "".join(json.dumps(trace.to_dict()) + "\n" for trace in traces)
+    
+    def export_jsonl(self, path: str) -> int:
+        """Write the kept traces to a JSON lines file, returning how many"""
+        text = self.to_jsonl()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return text.count("\n")
+    
+    def prometheus_text(self) -> str:
+        """All finished traces summed up in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP nl2sql_queries_total Pipeline runs by mode and status")
+            lines.append("# TYPE nl2sql_queries_total counter")
+            for (mode, status), (count, _) in sorted(self._queries.items()):
+                lines.append(f'nl2sql_queries_total{{mode="{mode}",status="{status}"}} {count}')
+            lines.append("# HELP nl2sql_query_seconds_total Pipeline run wall time by mode and status")
+            lines.append("# TYPE nl2sql_query_seconds_total counter")
+            for (mode, status), (_, seconds) in sorted(self._queries.items()):
+                lines.append(f'nl2sql_query_seconds_total{{mode="{mode}",status="{status}"}} {seconds:.6f}')
+            
+            lines.append("# HELP nl2sql_repairs_total SQL repair attempts after failed validation by mode")
+            lines.append("# TYPE nl2sql_repairs_total counter")
+            for mode, count in sorted(self._repairs.items()):
+                lines.append(f'nl2sql_repairs_total{{mode="{mode}"}} {count}')
+                
+            lines.append("# HELP nl2sql_stage_duration_seconds Wall time per pipeline stage")
+            lines.append("# TYPE nl2sql_stage_duration_seconds histogram")
+            for name in self._ordered(self._histograms):
+                buckets = self._histograms[name]
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f'nl2sql_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'nl2sql_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {buckets[-2]}')
+                lines.append(f'nl2sql_stage_duration_seconds_sum{{stage="{name}"}} {buckets[-1]:.6f}')
+                lines.append(f'nl2sql_stage_duration_seconds_count{{stage="{name}"}} {buckets[-2]}')
+            
+            for field_name, (metric, help_text) in STAGE_COUNTERS.items():
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for name in self._ordered(self._stage_totals):
+                    value = self._stage_totals[name][field_name]
+                    value = f"{value:.6f}" if isinstance(value, float) else value
+                    lines.append(f'{metric}{{stage="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+    
+    @staticmethod
+    def _ordered(stages) -> List[str]:
+        return sorted(stages, key=lambda name: (STAGES.index(name) if name in STAGES else len(STAGES), name))